@@ -0,0 +1,303 @@
+"""
+Columnar (DuckDB over Parquet) backend for analytical queries.
+
+SQLite stays the system of record and serves point lookups. Every table is
+mirrored to Parquet, one file per table, rebuilt in the background whenever
+the DB file signature changes, and DuckDB queries those files through views.
+`QueryRouter` sends a query to DuckDB only when its shape is analytical
+(aggregates, GROUP BY, window functions), it uses only functions both engines
+share and no LIKE/GLOB (case-sensitive in DuckDB, not in SQLite), it reads at
+least one table of `COLUMNAR_MIN_ROWS` rows (below that DuckDB's per-query
+overhead outweighs the scan) and the mirror is current. Everything else, and
+any query DuckDB rejects, runs on SQLite. DuckDB is optional: without it
+every query goes to SQLite.
+
+The mirror is written by DuckDB itself: with DuckDB's sqlite extension
+installed each table is a single `COPY (SELECT * FROM sqlite_scan(...))`;
+otherwise rows are streamed in `EXPORT_BATCH` batches into a disk-backed
+DuckDB staging table, typed from what the column actually holds, and then
+copied out. Neither path holds a whole table in memory. A `timeout` passed
+to `QueryRouter.run` interrupts the DuckDB query when it runs past the
+budget; that raises TimeoutError rather than starting over on SQLite.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from result_cache import db_version
+from schema_catalog import is_partition
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover
+    duckdb = None
+
+ANALYTICS_DIR = Path(os.getenv("ANALYTICS_DIR", Path(tempfile.gettempdir()) / "sql_chatbot_columnar"))
+COLUMNAR_MIN_ROWS = int(os.getenv("COLUMNAR_MIN_ROWS", 5000))
+EXPORT_BATCH = 50_000  # rows per batch when streaming a table without the sqlite extension
+
+lg = logging.getLogger("sql_graph")
+
+_ANALYTIC = re.compile(r"\bgroup\s+by\b|\bover\s*\(|\b(count|sum|avg|min|max|total|median|stddev)\s*\(", re.I)
+_TABLE_REF = re.compile(r'\b(?:from|join)\s+["`\[]?(\w+)', re.I)
+_ROW_STORE_ONLY = re.compile(r"\b(like|glob)\b", re.I)  # pattern matching differs between the engines
+_CALL = re.compile(r"\b([a-z_][a-z0-9_]*)\s*\(", re.I)
+_KEYWORDS = frozenset("""
+    select from where and or not in exists as on join using over partition values with when then else case
+    filter having limit union all intersect except cast
+""".split())
+# Functions that behave the same in SQLite and DuckDB
+PORTABLE_FUNCTIONS = frozenset("""
+    count sum avg min max median stddev round abs coalesce ifnull nullif lower upper length trim
+    replace substr cast row_number rank dense_rank lag lead first_value last_value ntile
+""".split())
+
+
+def query_shape(sql: str) -> str:
+    """'analytic' for portable aggregate/window queries, else 'lookup'."""
+    if not _ANALYTIC.search(sql or "") or _ROW_STORE_ONLY.search(sql):
+        return "lookup"
+    calls = {name.lower() for name in _CALL.findall(sql)} - _KEYWORDS
+    return "analytic" if calls <= PORTABLE_FUNCTIONS else "lookup"
+
+
+class _DuckConnection:
+    """DB-API-ish wrapper: every `execute` gets its own cursor, so `close()` is safe."""
+
+    def __init__(self, db):
+        self._db = db
+        self._cursors: list = []
+
+    def execute(self, sql: str, params=None):
+        cur = self._db.cursor()
+        self._cursors.append(cur)
+        return cur.execute(sql, params) if params else cur.execute(sql)
+
+    def interrupt(self) -> None:
+        """Abort whatever is running on the cursors handed out so far."""
+        for cur in self._cursors:
+            cur.interrupt()
+
+
+def _column_types(src: sqlite3.Connection, table: str) -> dict:
+    """{column: DuckDB type} from the values stored: BIGINT, DOUBLE, else VARCHAR."""
+    columns = [row[1] for row in src.execute("SELECT * FROM pragma_table_info(?)", (table,))]
+    if not columns:
+        return {}
+    checks = ", ".join(
+        f"""SUM(typeof("{c}") NOT IN ('integer', 'null')), SUM(typeof("{c}") NOT IN ('integer', 'real', 'null'))"""
+        for c in columns
+    )
+    counts = src.execute(f'SELECT {checks} FROM "{table}"').fetchone()
+    types = {}
+    for i, c in enumerate(columns):
+        not_int, not_number = counts[2 * i] or 0, counts[2 * i + 1] or 0
+        types[c] = "BIGINT" if not not_int else "DOUBLE" if not not_number else "VARCHAR"
+    return types
+
+
+def _frame(rows: list, types: dict) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows, columns=list(types))
+    for col, typ in types.items():
+        if typ == "BIGINT":
+            df[col] = df[col].astype("Int64")
+        elif typ == "DOUBLE":
+            df[col] = df[col].astype("float64")
+        else:
+            df[col] = df[col].astype("string")  # mixed-type TEXT columns
+    return df
+
+
+def _has_sqlite_scan(duck) -> bool:
+    try:
+        duck.execute("SET autoinstall_known_extensions = false")  # never download during a build
+        duck.execute("LOAD sqlite")
+        return True
+    except Exception:
+        return False
+
+
+class ColumnarMirror:
+    """Parquet copy of every table in `db_path`, queried through DuckDB."""
+
+    def __init__(self, db_path, folder=ANALYTICS_DIR):
+        self.db_path = Path(db_path).resolve()
+        self.folder = Path(folder) / hashlib.sha1(str(self.db_path).encode()).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self._db = None
+        self._version = None
+        self._building = False
+        self.row_counts: dict = {}
+
+    def _manifest(self) -> dict:
+        path = self.folder / "manifest.json"
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def build(self) -> dict:
+        """Export every table and view to Parquet; returns {table: row count}."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        version = list(db_version(self.db_path))
+        staging = self.folder / "staging.duckdb"
+        staging.unlink(missing_ok=True)
+        src = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        duck = duckdb.connect(str(staging))  # disk-backed, so DuckDB can spill
+        try:
+            scan = _has_sqlite_scan(duck)
+            tables = {}
+            for (table,) in src.execute(
+                    "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'").fetchall():
+                if is_partition(table) or table == "_partitions":
+                    continue  # exported once, through the partition view
+                tmp = self.folder / f"{table}.parquet.part"
+                if not (scan and self._copy_scan(duck, table, tmp)):
+                    self._copy_streamed(duck, src, table, tmp)
+                tables[table] = duck.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp}')").fetchone()[0]
+                tmp.replace(self.folder / f"{table}.parquet")
+        finally:
+            src.close()
+            duck.close()
+            staging.unlink(missing_ok=True)
+            Path(f"{staging}.wal").unlink(missing_ok=True)
+        (self.folder / "manifest.json").write_text(json.dumps({"version": version, "tables": tables}))
+        return tables
+
+    def _copy_scan(self, duck, table: str, target: Path) -> bool:
+        """COPY straight from SQLite through the sqlite extension; False if it cannot read the table."""
+        db = str(self.db_path).replace("'", "''")
+        try:
+            duck.execute(f"COPY (SELECT * FROM sqlite_scan('{db}', '{table}')) TO '{target}' (FORMAT PARQUET)")
+            return True
+        except Exception as e:  # e.g. values that do not match the declared type
+            lg.info(f"sqlite_scan could not export {table}, streaming it instead: {e}")
+            return False
+
+    @staticmethod
+    def _copy_streamed(duck, src: sqlite3.Connection, table: str, target: Path) -> None:
+        """Stream `table` into a staging table batch by batch, then COPY it out."""
+        types = _column_types(src, table)
+        cols = ", ".join(f'"{c}" {t}' for c, t in types.items())
+        duck.execute(f"CREATE OR REPLACE TABLE staging ({cols})")
+        cur = src.execute(f'SELECT * FROM "{table}"')
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if not rows:
+                break
+            duck.register("batch", _frame(rows, types))
+            duck.execute("INSERT INTO staging SELECT * FROM batch")
+            duck.unregister("batch")
+        duck.execute(f"COPY staging TO '{target}' (FORMAT PARQUET)")
+        duck.execute("DROP TABLE staging")
+
+    def _open(self, manifest: dict) -> None:
+        db = duckdb.connect()
+        for setting in ("integer_division = true",  # SQLite semantics for int / int
+                        "default_null_order = 'nulls_first_on_asc_last_on_desc'"):  # SQLite's NULL ordering
+            try:
+                db.execute(f"SET GLOBAL {setting}")  # cursors open their own sessions
+            except Exception:
+                pass
+        for table in manifest["tables"]:
+            db.execute(f"CREATE VIEW \"{table}\" AS SELECT * FROM read_parquet('{self.folder / table}.parquet')")
+        old, self._db, self._version = self._db, db, tuple(manifest["version"])
+        self.row_counts = {name.lower(): rows for name, rows in manifest["tables"].items()}
+        if old is not None:
+            old.close()
+
+    def _build_in_background(self) -> None:
+        try:
+            self.build()
+            with self._lock:
+                self._open(self._manifest())
+        except Exception as e:
+            lg.warning(f"columnar mirror build failed: {e}")
+        finally:
+            self._building = False
+
+    def ready(self) -> bool:
+        """True if the mirror matches the DB file; otherwise start (re)building it."""
+        if duckdb is None:
+            return False
+        current = db_version(self.db_path)
+        with self._lock:
+            if self._version == current:
+                return True
+            manifest = self._manifest()
+            if tuple(manifest.get("version", ())) == current:
+                self._open(manifest)
+                return True
+            if not self._building:
+                self._building = True
+                threading.Thread(target=self._build_in_background, daemon=True, name="columnar-mirror").start()
+        return False
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """A connection to the mirror; queries still running after `timeout` seconds raise TimeoutError."""
+        with self._lock:
+            db = self._db
+        conn = _DuckConnection(db)
+        timer = threading.Timer(timeout, conn.interrupt) if timeout else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            yield conn
+        except duckdb.InterruptException as e:
+            raise TimeoutError(f"query exceeded the {timeout:g}s time budget") from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+
+class QueryRouter:
+    """Send analytical queries to the columnar mirror and the rest to SQLite."""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path).resolve()
+        self.mirror = ColumnarMirror(self.db_path)
+
+    def backend_for(self, sql: str) -> str:
+        if query_shape(sql) != "analytic" or not self.mirror.ready():
+            return "sqlite"
+        rows = self.mirror.row_counts
+        largest = max((rows.get(t.lower(), 0) for t in _TABLE_REF.findall(sql)), default=0)
+        return "duckdb" if largest >= COLUMNAR_MIN_ROWS else "sqlite"
+
+    def run(self, sql: str, columnar, row_store, timeout: Optional[float] = None):
+        """(backend, result): `columnar(duckdb_conn)` when routed there, else `row_store()`.
+
+        `timeout` bounds the DuckDB query; running past it raises TimeoutError.
+        """
+        if self.backend_for(sql) == "duckdb":
+            try:
+                with self.mirror.connection(timeout) as conn:
+                    return "duckdb", columnar(conn)
+            except TimeoutError:
+                raise
+            except Exception as e:
+                lg.info(f"DuckDB could not run the query, using SQLite: {e}")
+        return "sqlite", row_store()
+
+
+_ROUTERS: dict = {}
+_ROUTERS_LOCK = threading.Lock()
+
+
+def get_router(db_path) -> QueryRouter:
+    """Return the process-wide router for `db_path`."""
+    key = str(Path(db_path).resolve())
+    with _ROUTERS_LOCK:
+        router = _ROUTERS.get(key)
+        if router is None:
+            router = _ROUTERS[key] = QueryRouter(key)
+        return router
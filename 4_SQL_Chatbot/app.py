@@ -7,8 +7,6 @@ from pathlib import Path
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 import streamlit as st
 from sqlalchemy import create_engine
-import sqlite3
-from io import StringIO
 from io import BytesIO
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 from reportlab.lib.pagesizes import letter
@@ -23,10 +21,27 @@ from langchain_openai import ChatOpenAI
 from langchain_community.agent_toolkits.sql.base import create_sql_agent
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langchain_community.utilities import SQLDatabase
+from langchain_community.utilities.sql_database import truncate_word
 from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
 from langchain_community.agent_toolkits.sql.prompt import SQL_PREFIX as _LC_SQL_PREFIX
+from result_cache import Timer, conversation_key, get_result_cache, render_cache_stats
+from result_capture import QueryRows, capture, linked_frame, parse_markdown_table, record
+from analytics_backend import get_router
+from db_pool import POOL_SIZE, add_connect_hook, get_pool, recycle_on_change
+from schema_catalog import get_catalog
+from prompt_builder import PromptBuilder
+from prompt_cache import PromptCacheMonitor, render_prompt_cache_stats
+from conversation_memory import ConversationMemory
+from history_store import get_history_store
+from domain_classifier import classify_domain, normalize as normalize_question
+import fast_path
+from schema_digest import count_tool_calls, schema_digest
+from tracing import TracingCallbackHandler, get_tracer
+from shape_index import SQL_FUNCTIONS_DOC, register_sql_functions
+from timeseries import TIMESERIES_FUNCTIONS_DOC, register_timeseries_functions
 
 import re
+import functools
 # Attempt to pull LangChain's default SQL prompt so we can append our own.
 try:
     from langchain.agents.agent_toolkits.sql.prompt import SQL_PREFIX as _LC_SQL_PREFIX
@@ -37,38 +52,47 @@ except Exception:  # Fallback if import path changes
 from pathlib import Path
 
 
-import json
+import uuid
 
-HISTORY_FILE = Path("chat_history.json")
+HISTORY_DB = Path("chat_history.db")
+HISTORY_RESTORE_LIMIT = 200  # messages restored when a session is reopened
 
-def save_history():
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(st.session_state["messages"], f)
+@st.cache_resource
+def get_history():
+    """Shared append-only history store, compacted once per process."""
+    store = get_history_store(HISTORY_DB)
+    store.compact()
+    return store
+
+def session_id() -> str:
+    """Per-session key, kept in the URL so a reload resumes the same chat."""
+    sid = st.query_params.get("session")
+    if not sid:
+        sid = st.query_params["session"] = uuid.uuid4().hex
+    return sid
+
+def save_message(role: str, content: str):
+    """Add a message to the session and append it (O(1)) to the history store."""
+    st.session_state.messages.append({"role": role, "content": content})
+    get_history().append(session_id(), role, content)
 
 def load_history():
-    if HISTORY_FILE.exists():
-        try:
-            with open(HISTORY_FILE) as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            # If file is corrupt or empty, start fresh
-            return []
-    return []
-
-def load_modular_system_prompt(folder: str = "modular_prompt") -> str:
+    return get_history().recent(session_id(), limit=HISTORY_RESTORE_LIMIT)
+
+PROMPT_TOKEN_BUDGET = 2500
+PROMPT_BUILDER = PromptBuilder(
+    "modular_prompt",
+    budget=PROMPT_TOKEN_BUDGET,
+    pinned=("global_rules.txt", "query_execution.md"),  # always sent in full
+)
+
+def load_modular_system_prompt(query: str) -> str:
     """
-    Load and concatenate all modular instruction files into one system prompt string.
-    Files are read in alphabetical order.
+    Assemble the per-question part of the modular instructions: the most relevant
+    sections of the non-pinned files, within PROMPT_TOKEN_BUDGET tokens.
+    The pinned files go into the static prompt prefix instead.
     """
-    folder_path = Path(folder)
-    if not folder_path.exists():
-        raise FileNotFoundError(f"Missing prompt folder: {folder_path}")
-    
-    parts = []
-    for file in sorted(folder_path.glob("*.*")):
-        parts.append(file.read_text().strip())
-    
-    return "\n\n".join(parts)
+    return ascii_clean(PROMPT_BUILDER.build(query, with_pinned=False))
 
 # Load the final system prompt
 def ascii_clean(text: str) -> str:
@@ -79,32 +103,18 @@ def ascii_clean(text: str) -> str:
         .decode("ascii")
     )
 
-SYSTEM_PROMPT = ascii_clean(load_modular_system_prompt())
-
-def extract_markdown_table(markdown_text: str) -> pd.DataFrame | None:
-    """Try to extract a DataFrame from a markdown table in a string."""
-    lines = markdown_text.strip().splitlines()
-    table_lines = [line for line in lines if "|" in line]
-    if len(table_lines) >= 2:
-        csv_text = "\n".join(
-            line.strip().strip("|").replace("|", ",")
-            for line in table_lines
-            if "---" not in line
-        )
-        try:
-            return pd.read_csv(StringIO(csv_text))
-        except Exception:
-            return None
-    return None
+def display_response_with_downloads(response, result_df: pd.DataFrame | None = None) -> str:
+    """Display a response and return the assistant reply content (for chat history).
 
-def display_response_with_downloads(response) -> str:
-    """Display a response and return the assistant reply content (for chat history)."""
+    `result_df` holds the typed rows of the query behind the answer (see
+    result_capture); the markdown in the reply is only parsed without it.
+    """
     response_df = None
 
     if isinstance(response, pd.DataFrame):
         response_df = response
     elif isinstance(response, str):
-        response_df = extract_markdown_table(response)
+        response_df = result_df if result_df is not None else parse_markdown_table(response)
 
     if response_df is not None:
         # ✅ Cache for future reruns
@@ -201,26 +211,43 @@ def extract_raw_sql(text: str) -> str:
 
 
 
-def is_transit_related(query: str, api_key: str) -> bool:
-    """Check if the user's query is related to fleet/transit/dispatch (for OpenAI SDK v1.0+)."""
+DOMAIN_CONFIDENCE = 0.8  # below this the local classifier defers to the LLM
+
+@st.cache_resource
+def get_openai_client(api_key: str):
     from openai import OpenAI
-    client = OpenAI(api_key=api_key)
+    return OpenAI(api_key=api_key)
 
+@functools.lru_cache(maxsize=1024)
+def _llm_domain_check(normalized_query: str, api_key: str) -> bool:
+    client = get_openai_client(api_key)
     prompt = (
         "Is the following question about public transportation, electric buses, "
-        "transit dispatch, scheduling, or vehicle telematics? Reply with only Yes or No.\n\n"
-        f"Question: {query.strip()}"
+        "transit dispatch, scheduling, vehicle telematics, or the records in a fleet "
+        "database (loads, energy use, vehicles, trips)? Reply with only Yes or No.\n\n"
+        f"Question: {normalized_query}"
     )
+    response = client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=5,
+    )
+    return "yes" in response.choices[0].message.content.strip().lower()
+
+def is_transit_related(query: str, api_key: str) -> bool:
+    """Check if the user's query is related to fleet/transit/dispatch.
 
+    Decided locally from the fleet vocabulary; questions it cannot decide
+    (confidence below DOMAIN_CONFIDENCE) cost an LLM round trip, and if that
+    fails the question goes through to the agent.
+    """
+    normalized = normalize_question(query)
+    is_transit, confidence = classify_domain(normalized)
+    if confidence >= DOMAIN_CONFIDENCE:
+        return is_transit
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            max_tokens=5,
-        )
-        answer = response.choices[0].message.content.strip().lower()
-        return "yes" in answer
+        return _llm_domain_check(normalized, api_key)
     except Exception as e:
         st.warning(f"⚠️ Domain check failed: {e}")
         return True  # fallback to allow query
@@ -229,6 +256,8 @@ def is_transit_related(query: str, api_key: str) -> bool:
 # ---------- Utility helpers --------------------------------------------------
 ###############################################################################
 DB_FILE = Path(__file__).parent / "vehicles.db"
+add_connect_hook(register_sql_functions)  # nearest_route(), distance_to_route_m(), ... on every pooled connection
+add_connect_hook(register_timeseries_functions)  # latest(), delta(), total_drop(), time_bucket(), ...
 
 def ascii_sanitise(value: str) -> str:
     """Return a strictly-ASCII version of `value`."""
@@ -238,16 +267,51 @@ def ascii_sanitise(value: str) -> str:
         .decode("ascii")
     )
 
-def convert_to_message_history(messages):
-    from langchain_core.messages import AIMessage, HumanMessage
+def _rows_as_text(rows, max_string_length: int = 300) -> str:
+    """Same text SQLDatabase.run returns for a list of result rows."""
+    if not rows:
+        return ""
+    return str([tuple(truncate_word(value, length=max_string_length) for value in row) for row in rows])
+
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase whose plain `run(sql)` calls go through the shared result cache.
+
+    Analytical queries are served from the DuckDB/Parquet mirror when it is
+    current (see analytics_backend); everything else runs on SQLite. Results
+    are cached as typed QueryRows and recorded for result_capture; the agent
+    gets the usual text.
+    """
+
+    def __init__(self, engine, cache, router=None, **kwargs):
+        super().__init__(engine, **kwargs)
+        self._result_cache = cache
+        self._router = router
+
+    def _query_rows(self, command: str) -> QueryRows:
+        rows = self._execute(command)
+        return QueryRows(command, tuple(rows[0]) if rows else (), [tuple(row.values()) for row in rows])
+
+    def run(self, command, fetch="all", include_columns=False, **kwargs):
+        # sql_db_query calls run_no_throw, which passes the defaults explicitly
+        if fetch != "all" or include_columns or any(v is not None for v in kwargs.values()) or not isinstance(command, str):
+            return super().run(command, fetch, include_columns=include_columns, **kwargs)
+        result = self._result_cache.get_result(command)
+        if result is None:
+            with Timer() as t:
+                if self._router is None:
+                    result = self._query_rows(command)
+                else:
+                    def columnar(conn):
+                        cur = conn.execute(command)
+                        return QueryRows(command, tuple(d[0] for d in cur.description or []), cur.fetchall())
+                    _, result = self._router.run(command, columnar=columnar, row_store=lambda: self._query_rows(command))
+            self._result_cache.put_result(command, result, t.elapsed)
+        record(result)
+        return _rows_as_text(result.rows, self._max_string_length)
 
-    history = []
-    for msg in messages:
-        if msg["role"] == "user":
-            history.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            history.append(AIMessage(content=msg["content"]))
-    return history
+def convert_to_message_history(messages):
+    """Bounded history: recent turns verbatim plus a rolling summary and recent tables."""
+    return st.session_state["memory"].history(messages)
 
 ###############################################################################
 # ---------- Streamlit sidebar (API key only) ---------------------------------
@@ -280,17 +344,25 @@ def get_db_connection(db_path: Path, api_key_ascii: str):
 
     st.session_state["_db_mtime"] = db_path.stat().st_mtime  # refresh on change
 
-    from sqlalchemy.pool import StaticPool
+    from sqlalchemy.pool import QueuePool
 
-    # ⬇️ Open in read-only mode so no accidental writes occur
-    creator = lambda: sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    # ⬇️ Pooled read-only (immutable, tuned) connections so sessions read in parallel
+    creator = lambda: get_pool(db_path).connect()
     engine = create_engine(
         "sqlite://",
         creator=creator,
-        poolclass=StaticPool,
-        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+    )
+    recycle_on_change(engine, db_path)  # immutable connections never see a rebuilt vehicles.db
+    sql_db = CachedSQLDatabase(
+        engine,
+        get_result_cache(db_path),
+        router=get_router(db_path),
+        view_support=True,  # partitioned tables are UNION ALL views (see ingest.py)
+        ignore_tables=get_catalog(db_path).hidden_tables(),
     )
-    sql_db = SQLDatabase(engine)
 
     llm = ChatOpenAI(
         openai_api_key=api_key_ascii,
@@ -298,6 +370,7 @@ def get_db_connection(db_path: Path, api_key_ascii: str):
         #model_name="o4-mini",
         #model_name="o4-mini",
         streaming=True,
+        stream_usage=True,  # report (cached) token usage for streamed calls
         temperature=0.5
     )
 
@@ -305,44 +378,54 @@ def get_db_connection(db_path: Path, api_key_ascii: str):
 
 
 db, llm = get_db_connection(DB_FILE, api_key)
+if "memory" not in st.session_state:
+    st.session_state["memory"] = ConversationMemory(llm=llm, keep_turns=4, max_tokens=1500)
+result_cache = get_result_cache(DB_FILE)
+render_cache_stats(st, result_cache)
+prompt_cache_monitor = st.session_state.setdefault("prompt_cache_monitor", PromptCacheMonitor())
+tracer = get_tracer()  # spans per LLM call / tool call / SQL → traces.db, see the trace dashboard page
+render_prompt_cache_stats(st, prompt_cache_monitor)
+if st.session_state.get("agent_stats"):
+    with st.sidebar.expander("🛠️ Agent tool calls", expanded=False):
+        stats = pd.DataFrame(st.session_state["agent_stats"])
+        st.dataframe(stats.groupby("mode")[["tool_calls", "discovery_calls", "seconds"]].mean().round(2))
 
 ###############################################################################
 # ---------- Capture baseline tables -----------------------------------------
 ###############################################################################
+catalog = get_catalog(DB_FILE)
 if "base_tables" not in st.session_state:
-    with sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True) as _conn:
-        st.session_state["base_tables"] = {
-            row[0] for row in _conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table';"
-            )
-        }
+    st.session_state["base_tables"] = catalog.table_names()
 
 ###############################################################################
 # ---------- LangChain agent with custom prompt ------------------------------
 ###############################################################################
 toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-# custom_prefix = SYSTEM_INSTRUCTIONS.strip() + "\n\n" + _LC_SQL_PREFIX
-#escaped_system_instructions = SYSTEM_INSTRUCTIONS.replace("{", "{{").replace("}", "}}")
-escaped_system_instructions = SYSTEM_PROMPT.replace("{", "{{").replace("}", "}}")
-
-
-custom_prefix = (
-    escaped_system_instructions.strip()
-    + "\n\n"
-    + FORMAT_INSTRUCTIONS.strip()
-    + "\n\n"
-    + _LC_SQL_PREFIX.strip()
-)
-
 
+# ⬇️ One byte-stable system message first, so the provider can cache it across
+# every ReAct step and every question. Anything that varies per question
+# (history, selected rules, input, scratchpad) comes after it.
+escaped_pinned_rules = ascii_clean(PROMPT_BUILDER.pinned_text()).replace("{", "{{").replace("}", "}}")
+# Compact DDL + join keys for every table, so the agent can go straight to
+# sql_db_query instead of spending steps on sql_db_list_tables/sql_db_schema.
+# It only changes with the catalog, so it belongs in the cached prefix.
+preseed_schema = st.sidebar.checkbox("📐 Pre-seed schema context", value=True)
+escaped_digest = ascii_clean(schema_digest(catalog)).replace("{", "{{").replace("}", "}}") if preseed_schema else ""
+static_prefix = "\n\n".join(part for part in [
+    escaped_pinned_rules.strip(),
+    escaped_digest.strip(),
+    SQL_FUNCTIONS_DOC,
+    TIMESERIES_FUNCTIONS_DOC,
+    FORMAT_INSTRUCTIONS.strip(),
+    _LC_SQL_PREFIX.strip(),
+    "You can use the following tools:\n{tools}",
+    "Tool names: {tool_names}",
+] if part)
 
 prompt = ChatPromptTemplate.from_messages([
-    ("system", escaped_system_instructions),
-    ("system", FORMAT_INSTRUCTIONS),
-    ("system", _LC_SQL_PREFIX),
-    ("system", "You can use the following tools:\n{tools}"),
-    ("system", "Tool names: {tool_names}"),
+    ("system", static_prefix),
     MessagesPlaceholder("history"),  # ✅ keep this!
+    ("system", "{system_rules}"),     # per-question modular instructions
     ("human", "{input}"),
     ("ai", "{agent_scratchpad}")
 ])
@@ -370,20 +453,15 @@ agent = AgentExecutor.from_agent_and_tools(
 ###############################################################################
 #st.sidebar.markdown("### 📥 Download new Table as CSV")
 
-with sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True) as _conn:
-    current_tables = {
-        row[0] for row in _conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table';"
-        )
-    }
+current_tables = catalog.table_names()
 
 ###############################################################################
 # ---------- Chat UI & session history ---------------------------------------
 ###############################################################################
-if (
-    "messages" not in st.session_state
-    or st.button("🗑️ Clear chat history", help="Start a fresh session")
-):
+clear_clicked = st.button("🗑️ Clear chat history", help="Start a fresh session")
+if "messages" not in st.session_state or clear_clicked:
+    if clear_clicked:
+        get_history().clear(session_id())
     st.session_state.messages = [
         {
             "role": "assistant",
@@ -392,6 +470,7 @@ if (
             ),
         }
     ]
+    st.session_state["memory"] = ConversationMemory(llm=llm, keep_turns=4, max_tokens=1500)
 
 for msg in st.session_state.messages:
     st.chat_message(msg["role"]).write(msg["content"])
@@ -401,22 +480,54 @@ user_query = st.chat_input("Ask a question…")
 if user_query:
     user_query = unicodedata.normalize("NFKD", user_query).encode("ascii", errors="ignore").decode("ascii")
     st.chat_message("user").write(user_query)
-    st.session_state.messages.append({"role": "user", "content": user_query})
-    save_history()
+    save_message("user", user_query)
 
     with st.chat_message("assistant"):
         cb = StreamlitCallbackHandler(st.container())
+        prev_df = st.session_state.get("last_response_df")
         try:
             history = convert_to_message_history(st.session_state.messages)
 
-            # Run the agent with full trace
-            response = agent.invoke(
-                {
-                    "input": user_query,
-                    "history": history
-                },
-                callbacks=[cb]
-            )
+            # Reuse the final answer for a question repeated in the same context, else run the agent with full trace
+            answer_context = conversation_key(session_id(), st.session_state.messages[:-1])
+            with tracer.span("request", kind="request", query=user_query[:200]) as request_span:
+                response = result_cache.get_answer(user_query, answer_context)
+                request_span.set(answer_cached=response is not None)
+                if response is None:
+                    # Common question shapes: one parameterized lookup, no LLM call
+                    with tracer.span("fast_path", kind="sql") as span, get_pool(DB_FILE).connection() as _conn:
+                        fast = fast_path.answer(_conn, user_query)
+                        span.set(rows=len(fast[1]) if fast else 0, intent=fast[0] if fast else None)
+                    if fast is not None:
+                        response = {"output": fast[1], "intermediate_steps": []}
+                if response is None:
+                    with tracer.span("domain_check", kind="stage"):
+                        on_topic = is_transit_related(user_query, api_key)
+                    if not on_topic:
+                        response = {
+                            "output": "I can only answer questions about the fleet, its vehicles, trips, "
+                                      "blocks and schedules in vehicles.db. Please rephrase your question."
+                        }
+                if response is None:
+                    with Timer() as t, tracer.span("agent", kind="stage") as agent_span, capture() as captured:
+                        response = agent.invoke(
+                            {
+                                "input": user_query,
+                                "history": history,
+                                "system_rules": load_modular_system_prompt(user_query),
+                            },
+                            callbacks=[cb, prompt_cache_monitor, TracingCallbackHandler(tracer, agent_span)]
+                        )
+                    # Keep the typed rows behind the answer's table with the answer (and its cache entry)
+                    response["result_df"] = linked_frame(str(response.get("output", "")), captured)
+                    result_cache.put_answer(user_query, response, t.elapsed, context=answer_context)
+                    tool_calls, discovery_calls = count_tool_calls(response.get("intermediate_steps", []))
+                    st.session_state.setdefault("agent_stats", []).append({
+                        "mode": "pre-seeded" if preseed_schema else "discovery",
+                        "tool_calls": tool_calls,
+                        "discovery_calls": discovery_calls,
+                        "seconds": t.elapsed,
+                    })
 
             # --- Extract assistant's reply ---
             #assistant_reply = response.get("output", response) if isinstance(response, dict) else response
@@ -424,7 +535,8 @@ if user_query:
             # Extract steps + output
             intermediate_steps = response.get("intermediate_steps", []) if isinstance(response, dict) else []
             assistant_reply = response.get("output", response) if isinstance(response, dict) else response
-            chat_reply = display_response_with_downloads(assistant_reply)
+            result_df = response.get("result_df") if isinstance(response, dict) else None
+            chat_reply = display_response_with_downloads(assistant_reply, result_df)
 
             # 🧠 Display chain of thought if available
             if intermediate_steps:
@@ -448,8 +560,14 @@ if user_query:
         st.write(chat_reply)
 
         # Always store assistant reply as a string (not dict or DataFrame)
-        st.session_state.messages.append({"role": "assistant", "content": str(chat_reply)})
-        save_history()
+        save_message("assistant", str(chat_reply))
+
+        # Keep the new result table and fold old turns into the summary (after the answer is shown)
+        memory = st.session_state["memory"]
+        new_df = st.session_state.get("last_response_df")
+        if new_df is not None and new_df is not prev_df:
+            memory.remember_table(user_query, new_df)
+        memory.update(st.session_state.messages)
 
 if not user_query and "last_response_df" in st.session_state:
     st.write("📌 Here's your previous result:")
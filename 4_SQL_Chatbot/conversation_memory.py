@@ -0,0 +1,92 @@
+"""
+Bounded conversation memory for the SQL agent.
+
+Only the last `keep_turns` user/assistant turns go to the agent verbatim.
+Older turns are folded into a rolling summary, which is updated incrementally
+(one small LLM call per chunk of turns that leaves the window, run after the
+answer has been shown). The last few result tables are kept as DataFrames and
+rendered compactly. The whole history stays under `max_tokens`.
+"""
+from collections import deque
+
+import pandas as pd
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from prompt_builder import count_tokens
+
+SUMMARY_CHUNK = 10      # messages folded into the summary per LLM call
+MAX_BACKLOG = 40        # older messages beyond this are dropped, not summarized
+TABLE_PREVIEW_ROWS = 5
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a transit analyst and a "
+    "SQL assistant over vehicles.db. Update the summary with the new lines. Keep bus IDs, "
+    "block/route IDs, dates, tables and filters that were used. At most {words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew lines:\n{lines}\n\nUpdated summary:"
+)
+
+
+def _to_message(msg: dict):
+    return HumanMessage(content=msg["content"]) if msg["role"] == "user" else AIMessage(content=msg["content"])
+
+
+class ConversationMemory:
+    """Last N turns verbatim + rolling summary + recent result tables."""
+
+    def __init__(self, llm=None, keep_turns: int = 4, max_tokens: int = 1500, keep_tables: int = 3, summary_words: int = 150):
+        self.llm = llm
+        self.keep_messages = keep_turns * 2
+        self.max_tokens = max_tokens
+        self.summary_words = summary_words
+        self.summary = ""
+        self.summarized_upto = 0   # index into the chat messages already folded in
+        self.tables: deque = deque(maxlen=keep_tables)
+
+    def remember_table(self, question: str, df: pd.DataFrame) -> None:
+        self.tables.append((question, df))
+
+    def _summarize(self, lines: str) -> str:
+        prompt = _SUMMARY_PROMPT.format(words=self.summary_words, summary=self.summary or "(none)", lines=lines)
+        try:
+            return self.llm.invoke(prompt).content.strip()
+        except Exception:
+            # Offline fallback: keep the first sentence of every new line
+            extra = " ".join(line.split(". ")[0][:200] for line in lines.splitlines() if line)
+            words = (self.summary + " " + extra).split()
+            return " ".join(words[-self.summary_words:])
+
+    def update(self, messages: list) -> None:
+        """Fold messages that fell out of the verbatim window into the summary."""
+        cutoff = max(0, len(messages) - self.keep_messages)
+        self.summarized_upto = max(self.summarized_upto, cutoff - MAX_BACKLOG)
+        while self.summarized_upto < cutoff:
+            end = min(cutoff, self.summarized_upto + SUMMARY_CHUNK)
+            chunk = messages[self.summarized_upto:end]
+            self.summary = self._summarize("\n".join(f"{m['role']}: {m['content']}" for m in chunk))
+            self.summarized_upto = end
+
+    def _tables_text(self) -> str:
+        parts = []
+        for question, df in self.tables:
+            head = df.head(TABLE_PREVIEW_ROWS).to_csv(index=False).strip()
+            parts.append(f"Q: {question}\n{len(df)} rows × {len(df.columns)} cols ({', '.join(map(str, df.columns))})\n{head}")
+        return "Recent result tables (first rows, CSV):\n\n" + "\n\n".join(parts)
+
+    def history(self, messages: list) -> list:
+        """Messages for the agent's `history` placeholder, under `max_tokens`."""
+        recent = [m for m in messages[max(self.summarized_upto, len(messages) - self.keep_messages):]
+                  if m["role"] in ("user", "assistant")]
+        context = []
+        if self.summary:
+            context.append(SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        if self.tables:
+            context.append(SystemMessage(content=self._tables_text()))
+        budget = self.max_tokens - sum(count_tokens(m.content) for m in context)
+        kept = []
+        for msg in reversed(recent):
+            tokens = count_tokens(msg["content"])
+            if tokens > budget:
+                break
+            kept.append(_to_message(msg))
+            budget -= tokens
+        return context + kept[::-1]
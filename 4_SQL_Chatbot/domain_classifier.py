@@ -0,0 +1,88 @@
+"""
+Local domain classifier for the "is this a fleet/transit question?" gate.
+
+The vocabulary is the fleet lexicon (seed terms plus table and column names
+harvested from `modular_prompt/`). A question is scored by how many of its
+content words fall in that vocabulary. Clear cases are decided locally, and
+only low-confidence ones should go to the LLM. Missing vocabulary is not
+evidence: a question is only called off-topic with confidence when it uses
+explicit off-topic words (`OFF_TOPIC`) and no fleet vocabulary. Everything
+else the lexicon does not cover comes back undecided, with confidence 0.
+Results are cached per normalized question.
+"""
+import functools
+import json
+import re
+from pathlib import Path
+
+_WORD = re.compile(r"[a-z0-9]+")
+_BACKTICKED = re.compile(r"`([A-Za-z_][A-Za-z0-9_.]*)`")
+_FIRST_CELL = re.compile(r"^\|\s*([A-Za-z_][A-Za-z0-9_, ]*?)\s*\|", re.MULTILINE)
+_VEHICLE_ID = re.compile(r"\b\d{4}\b")  # bus numbers such as 2402
+
+SEED_TERMS = frozenset("""
+    bus buses fleet vehicle vehicles vid transit dispatch route routes block blocks trip trips stop stops
+    schedule schedules scheduled service depot yard garage gps location position lat lon latitude longitude
+    soc charge charging charger battery batteries kwh energy range mile miles mileage odometer speed
+    ev electric diesel gillig telematics avl gtfs shape headway driver operator pullout pullin layover
+    prediction predicted forecast telemetry deadhead revenue inservice timetable passenger passengers
+    kilowatt kilowatts kw consumption consumed consumer consumers pull pulled records loaded
+""".split())
+
+# Words that only appear in questions about something else entirely
+OFF_TOPIC = frozenset("""
+    recipe recipes cook cooking bake poem poems poetry joke jokes song songs lyrics movie movies film films
+    actor actress celebrity football soccer basketball baseball nba nfl bitcoin crypto cryptocurrency stock stocks
+    horoscope astrology translate translation essay homework dating president election politics religion
+    weather capital novel
+""".split())
+
+GENERIC = frozenset("""
+    the and for with from that this what which when where who how are was were will can could would should
+    use used using data table tables value values join joins key keys id ids type name names description
+    time date day days current latest last first show list give get tell me you your our all any some
+    more most less per each into over under about between than then also only just not yes no please
+    is it of in on to an do does did my be by at as or if so up
+""".split())
+
+
+def normalize(question: str) -> str:
+    return " ".join(_WORD.findall(question.lower()))
+
+
+@functools.lru_cache(maxsize=4)
+def load_vocabulary(folder: str = "modular_prompt") -> frozenset:
+    """Seed terms plus identifier parts found in the prompt modules."""
+    vocab = set(SEED_TERMS)
+    folder_path = Path(folder)
+    for path in folder_path.glob("*.md"):
+        text = path.read_text()
+        idents = _BACKTICKED.findall(text) + [c for cell in _FIRST_CELL.findall(text) for c in cell.split(",")]
+        for ident in idents:
+            vocab.update(p for p in re.split(r"[_.\s]+", ident.lower()) if len(p) > 2)
+    memory = folder_path / "structured_memory.json"
+    if memory.exists():
+        for tbl, meta in json.loads(memory.read_text()).items():
+            vocab.update(p for p in tbl.lower().split("_") if len(p) > 2)
+            for key in meta.get("keys", []):
+                vocab.update(p for p in key.lower().split("_") if len(p) > 2)
+    return frozenset(vocab - GENERIC)
+
+
+@functools.lru_cache(maxsize=1024)
+def classify_domain(normalized_question: str, folder: str = "modular_prompt") -> tuple:
+    """Return (is_transit, confidence in [0, 1]) for an already-normalized question."""
+    vocab = load_vocabulary(folder)
+    terms = [w for w in normalized_question.split() if w[0].isalpha() and w not in GENERIC and len(w) > 1]
+    if _VEHICLE_ID.search(normalized_question) and any(w in SEED_TERMS for w in terms):
+        return True, 0.99
+    hits = sum(w in vocab for w in terms)
+    seed_hits = sum(w in SEED_TERMS for w in terms)
+    off_hits = sum(w in OFF_TOPIC for w in terms)
+    if seed_hits and not off_hits:
+        return True, min(0.99, 0.7 + 0.1 * seed_hits + 0.1 * hits / len(terms))
+    if off_hits and not hits:
+        return False, min(0.95, 0.8 + 0.05 * off_hits)
+    if hits and not off_hits:
+        return True, 0.4 + 0.4 * hits / len(terms)
+    return True, 0.0  # not covered by the lexicon (or mixed signals): undecided, let the caller decide
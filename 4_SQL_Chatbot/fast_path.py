@@ -0,0 +1,139 @@
+"""
+Deterministic fast path for the most common fleet questions.
+
+The question shapes in `modular_prompt/examples.md` and
+`structured_memory.json` ("where is bus 2401", "current SOC of bus 2402",
+"bus 2403's last trip", ...) map to fixed, parameterized SQL. A matching
+question is answered with one indexed lookup and no LLM call. The fast path
+only answers "the current state of one bus" (plus the block schedule and
+table list): a question with a date or time, a relative-time word, a route,
+a comparison, a superlative, an aggregate or more than one number returns
+None so the caller falls back to the ReAct agent. A wrong fast answer is
+worse than a slow right one. The SQL strings are constants, so
+sqlite3's per-connection statement cache reuses the compiled statements.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    pattern: re.Pattern
+    sql: str
+    needs_vehicle: bool = True
+
+
+_VEHICLE = re.compile(r"\b(?:bus|vehicle|vid|unit|coach)\s*(?:#|no\.?|number)?\s*(\d{3,5})\b")
+_BARE_ID = re.compile(r"\b(\d{4})\b")
+_BLOCK = re.compile(r"\bblock\s*(?:#|id)?\s*([0-9]+[a-z]?)\b")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# Anything that is not "the current state of one thing" goes to the agent
+_AGENT_ONLY = (
+    # dates and times of day
+    re.compile(r"\d{4}-\d{1,2}-\d{1,2}|\b\d{1,2}/\d{1,2}\b|\b\d{1,2}:\d{2}\b|\b\d{1,2}\s*(?:am|pm)\b|"
+               r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b|"
+               r"\b(?:mon|tues|wednes|thurs|fri|satur|sun)day\b|\b(?:noon|midnight)\b"),
+    # relative time
+    re.compile(r"\b(?:today|tonight|yesterday|tomorrow|ago|since|until|before|after|during|morning|afternoon|"
+               r"evening|night|hours?|minutes?|days?|weeks?|weekend|months?|years?|earlier|later|now on)\b"),
+    # routes are not vehicles
+    re.compile(r"\broutes?\b"),
+    # comparisons
+    re.compile(r"[<>=]|\b(?:below|above|under|over|less|more|greater|fewer|than|exceed\w*|at least|at most|"
+               r"between|compare\w*|comparison|vs|versus)\b"),
+    # superlatives ("most recent trip" is still the last trip)
+    re.compile(r"\b(?:lowest|highest|most(?! recent)|least|max|maximum|min|minimum|best|worst|top|bottom|"
+               r"fastest|slowest|longest|shortest|peak)\b"),
+    # aggregates and explanations
+    re.compile(r"\b(?:average|avg|mean|sum|total|trend|history|historical|each|every|per|count|why|how many|"
+               r"how much|forecast accuracy|error|distribution)\b"),
+)
+
+INTENTS = (
+    Intent(
+        "predicted_soc",
+        re.compile(r"\b(predict\w*|forecast\w*|end(?:ing)? soc|soc at (?:the )?end)\b"),
+        "SELECT bus_id, timestamp, block_id, route_id, trip_id, current_soc, pred_end_soc_trip, pred_end_soc, "
+        "pred_rm_miles, left_miles FROM clever_pred WHERE bus_id = ? ORDER BY timestamp DESC LIMIT 1",
+    ),
+    Intent(
+        "current_soc",
+        re.compile(r"\b(soc|state of charge|battery level|charge level)\b"),
+        "SELECT bus_id, timestamp, current_soc, block_id, route_id FROM clever_pred "
+        "WHERE bus_id = ? ORDER BY timestamp DESC LIMIT 1",
+    ),
+    Intent(
+        "location",
+        re.compile(r"\b(where|location|position|gps|coordinates|lat|lon)\b"),
+        "SELECT vid, tmstmp, timestamp, lat, lon, hdg, spd, rt, des, tablockid, blk FROM getvehicles "
+        "WHERE vid = ? ORDER BY timestamp DESC LIMIT 1",
+    ),
+    Intent(
+        "last_trip",
+        re.compile(r"\b(last|latest|most recent|previous) trip\b"),
+        "SELECT vid, stsd, tablockid, blk, rt, tatripid, start_timestamp, end_timestamp, miles_driven, "
+        "start_soc, end_soc, energy_used, kwh_mile FROM trip_event_bustime "
+        "WHERE vid = ? ORDER BY start_timestamp DESC LIMIT 1",
+    ),
+    Intent(
+        "bus_specs",
+        re.compile(r"\b(specs?|specifications?|battery capacity|capacity|model|manufacturer|make)\b"),
+        "SELECT vid, name, manufacturer, model, battery_capacity, num_seats, length, est_mileage, mile_per_soc "
+        "FROM bus_vid WHERE vid = ?",
+    ),
+    Intent(
+        "block_schedule",
+        re.compile(r"\bblock\b.*\b(schedule|start|end|times?|hours|in.?service|route)\b"),
+        "SELECT BLOCK_ID_USER, BLOCK_ID_GTFS, DAY, ROUTE_ID, START_TIME, END_TIME, INSERVICE_START_TIME, "
+        "INSERVICE_END_TIME, REVENUE_LENGTH FROM gtfs_block WHERE BLOCK_ID_USER = ? ORDER BY DAY",
+        needs_vehicle=False,
+    ),
+    Intent(
+        "list_tables",
+        re.compile(r"\b(list|show|what)\b.*\btables\b"),
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' "
+        "AND name NOT GLOB '*__p[0-9n]*' AND name != '_partitions' ORDER BY name",
+        needs_vehicle=False,
+    ),
+)
+
+
+def match(question: str) -> Optional[tuple]:
+    """Return (intent, params) if `question` has a known simple shape, else None."""
+    q = " ".join(question.lower().replace("'s", "").split())
+    if any(pattern.search(q) for pattern in _AGENT_ONLY):
+        return None
+    numbers = _NUMBER.findall(q)
+    if len(numbers) > 1:
+        return None
+    block = _BLOCK.search(q)
+    vehicles = set(_VEHICLE.findall(q)) or (set() if block else set(_BARE_ID.findall(q)))
+    for intent in INTENTS:
+        if not intent.pattern.search(q):
+            continue
+        if intent.needs_vehicle:
+            if block or len(vehicles) != 1:
+                return None
+            return intent, (vehicles.pop(),)
+        if intent.name == "block_schedule":
+            return (intent, (block.group(1).upper(),)) if block else None
+        if numbers:
+            return None
+        return intent, ()
+    return None
+
+
+def answer(conn, question: str) -> Optional[tuple]:
+    """Run the fast path; return (intent name, DataFrame) or None to fall back."""
+    hit = match(question)
+    if hit is None:
+        return None
+    intent, params = hit
+    df = pd.read_sql_query(intent.sql, conn, params=params)
+    if df.empty:
+        return None  # unknown ID or unexpected data – let the agent investigate
+    return intent.name, df
@@ -0,0 +1,100 @@
+"""
+Append-only, per-session chat history backed by SQLite.
+
+Each message is one INSERT (O(1), no rewrite of earlier messages), keyed by
+session id and indexed on (session_id, id) for fast "recent turns" reads.
+Clearing a chat appends a marker row instead of deleting; `compact` later
+removes everything hidden behind markers and sessions idle for too long.
+WAL mode plus a busy timeout lets many sessions/processes write concurrently.
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+CLEAR_MARKER = "__clear__"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT    NOT NULL,
+    ts         REAL    NOT NULL,
+    role       TEXT    NOT NULL,
+    content    TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_messages_session ON messages (session_id, id);
+"""
+
+
+class HistoryStore:
+    """Thread-safe append-only message log shared by all sessions."""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, ts, role, content) VALUES (?, ?, ?, ?)",
+                (session_id, time.time(), role, content),
+            )
+
+    def clear(self, session_id: str) -> None:
+        self.append(session_id, CLEAR_MARKER, "")
+
+    def recent(self, session_id: str, limit: Optional[int] = None) -> list:
+        """Messages after the last clear marker, oldest first (last `limit` only if given)."""
+        sql = """
+            SELECT role, content FROM messages
+            WHERE session_id = ? AND id > COALESCE(
+                (SELECT MAX(id) FROM messages WHERE session_id = ? AND role = ?), 0)
+            ORDER BY id DESC
+        """
+        params: tuple = (session_id, session_id, CLEAR_MARKER)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def compact(self, max_idle_days: float = 30) -> int:
+        """Drop cleared messages and idle sessions; return the number of rows removed."""
+        cutoff = time.time() - max_idle_days * 86400
+        with self._lock, self._conn:
+            cleared = self._conn.execute(
+                """
+                DELETE FROM messages WHERE id <= (
+                    SELECT MAX(m.id) FROM messages AS m
+                    WHERE m.session_id = messages.session_id AND m.role = ?)
+                """,
+                (CLEAR_MARKER,),
+            ).rowcount
+            idle = self._conn.execute(
+                """
+                DELETE FROM messages WHERE session_id IN (
+                    SELECT session_id FROM messages GROUP BY session_id HAVING MAX(ts) < ?)
+                """,
+                (cutoff,),
+            ).rowcount
+        return cleared + idle
+
+
+_STORES: dict = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_history_store(db_path) -> HistoryStore:
+    """Return the process-wide store for `db_path`."""
+    key = str(Path(db_path).resolve())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = HistoryStore(key)
+        return store
@@ -0,0 +1,159 @@
+"""
+Build vehicles.db from the CSV exports, with normalized, indexed time columns.
+
+Every time column becomes an INTEGER epoch (seconds) column with an index:
+
+- epoch columns (`timestamp`, `start_timestamp`, ...) are cast to integer
+  seconds (millisecond values are scaled down), falling back to a text
+  column when the epoch is missing (`getvehicles.tmstmp`)
+- date columns (`stsd`, `date`) keep their text and gain a `<col>_epoch`
+  column: local midnight (`FLEET_TZ`) of that day
+
+Large history tables can be split into monthly (or daily) partitions,
+`<table>__p202506` ..., with `<table>` recreated as a UNION ALL view over
+them. Each partition has the same indexes. SQLite pushes WHERE clauses into
+every branch of the view, so a time-range query only reads the partitions
+that hold matching rows; the others cost one index probe each. Partition
+bounds are recorded in `_partitions`.
+
+    python ingest.py                        # CSVs next to this file → vehicles.db
+    python ingest.py --partition day --csv-dir exports --db vehicles.db
+"""
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from schema_catalog import partition_name
+from timeseries import FLEET_TZ
+
+TABLES = (
+    "bus_vid", "clever_pred", "getvehicles", "gtfs_block", "gtfs_calendar_dates", "gtfs_shape",
+    "gtfs_trip", "trip_event_bustime", "trip_event_bustime_to_block",
+)
+# table -> {epoch column: text column to parse when the epoch is missing}
+EPOCH_COLUMNS = {
+    "getvehicles": {"timestamp": "tmstmp"},
+    "clever_pred": {"timestamp": None},
+    "trip_event_bustime": {"start_timestamp": None, "end_timestamp": None},
+    "trip_event_bustime_to_block": {"start_timestamp": None, "end_timestamp": None},
+}
+DATE_COLUMNS = {
+    "getvehicles": ["stsd"],
+    "clever_pred": ["date"],
+    "trip_event_bustime": ["stsd"],
+    "trip_event_bustime_to_block": ["stsd"],
+}
+# table -> (partition column, leading index column)
+PARTITIONED = {
+    "getvehicles": ("timestamp", "vid"),
+    "clever_pred": ("timestamp", "bus_id"),
+    "trip_event_bustime": ("start_timestamp", "vid"),
+}
+_PERIOD_FORMAT = {"month": "%Y%m", "day": "%Y%m%d"}
+
+
+def to_epoch(values: pd.Series) -> pd.Series:
+    """Epoch seconds (Int64) from epoch s/ms numbers or local date/time text."""
+    num = pd.to_numeric(values, errors="coerce")
+    num = num.where(num.isna() | (num.abs() < 1e11), num / 1000)
+    text = values[num.isna() & values.notna()].astype(str).str.strip()
+    if len(text):
+        parsed = pd.to_datetime(text, format="mixed", errors="coerce")
+        local = parsed.dt.tz_localize(FLEET_TZ, ambiguous="NaT", nonexistent="shift_forward")
+        num.loc[text.index] = (local - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    return num.round().astype("Int64")
+
+
+def normalize_times(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    for col, fallback in EPOCH_COLUMNS.get(table, {}).items():
+        if col not in df:
+            continue
+        epoch = to_epoch(df[col])
+        if fallback in df:
+            epoch = epoch.fillna(to_epoch(df[fallback]))
+        df[col] = epoch
+    for col in DATE_COLUMNS.get(table, []):
+        if col in df:
+            df[f"{col}_epoch"] = to_epoch(df[col])
+    return df
+
+
+def _time_indexes(table: str, target: str, df: pd.DataFrame) -> list:
+    """CREATE INDEX statements for every epoch column of `table`, created on `target`."""
+    lead = PARTITIONED.get(table, (None, None))[1]
+    cols = [c for c in EPOCH_COLUMNS.get(table, {}) if c in df]
+    cols += [f"{c}_epoch" for c in DATE_COLUMNS.get(table, []) if f"{c}_epoch" in df]
+    stmts = [f'CREATE INDEX "ix_{target}_{c}" ON "{target}" ("{c}")' for c in cols]
+    if lead in df and cols:
+        stmts.append(f'CREATE INDEX "ix_{target}_{lead}_{cols[0]}" ON "{target}" ("{lead}", "{cols[0]}")')
+    return stmts
+
+
+def _write(conn: sqlite3.Connection, table: str, target: str, df: pd.DataFrame) -> None:
+    df.to_sql(target, conn, if_exists="replace", index=False)
+    for stmt in _time_indexes(table, target, df):
+        conn.execute(stmt)
+
+
+def write_partitioned(conn: sqlite3.Connection, table: str, df: pd.DataFrame, period: str) -> list:
+    """Write `df` as per-period partition tables plus a UNION ALL view named `table`."""
+    column = PARTITIONED[table][0]
+    stamps = pd.to_datetime(df[column].astype("float64"), unit="s", utc=True).dt.tz_convert(FLEET_TZ)
+    keys = stamps.dt.strftime(_PERIOD_FORMAT[period]).fillna("null")
+    names = []
+    conn.execute("CREATE TABLE IF NOT EXISTS _partitions (parent TEXT, name TEXT, column TEXT, lo INTEGER, hi INTEGER)")
+    conn.execute("DELETE FROM _partitions WHERE parent = ?", (table,))
+    for key, part in df.groupby(keys, sort=True):
+        name = partition_name(table, key)
+        _write(conn, table, name, part)
+        lo, hi = part[column].min(), part[column].max()
+        conn.execute("INSERT INTO _partitions VALUES (?, ?, ?, ?, ?)",
+                     (table, name, column, None if pd.isna(lo) else int(lo), None if pd.isna(hi) else int(hi)))
+        names.append(name)
+    conn.execute(f'DROP VIEW IF EXISTS "{table}"')
+    conn.execute(f'CREATE VIEW "{table}" AS ' + " UNION ALL ".join(f'SELECT * FROM "{n}"' for n in names))
+    return names
+
+
+def build(csv_dir: Path, db_path: Path, partition: str = "month") -> None:
+    if db_path.exists():
+        print(f"🗑️ Deleting existing {db_path.name}")
+        db_path.unlink()
+    conn = sqlite3.connect(db_path)
+    try:
+        for table in TABLES:
+            file_path = csv_dir / f"{table}.csv"
+            if not file_path.exists():
+                print(f"⚠️  Skipping missing file: {file_path.name}")
+                continue
+            start = time.perf_counter()
+            df = normalize_times(table, pd.read_csv(file_path, index_col=0, na_values=["", "None", "N/A"]))
+            with conn:
+                if partition != "none" and table in PARTITIONED:
+                    parts = write_partitioned(conn, table, df, partition)
+                    detail = f"{len(parts)} {partition} partitions"
+                else:
+                    _write(conn, table, table, df)
+                    detail = "1 table"
+            print(f"📦 {file_path.name} → `{table}`: {len(df):,} rows, {detail} ({time.perf_counter() - start:.1f}s)")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    print(f"📁 {db_path} is ready to use.")
+
+
+def main() -> None:
+    here = Path(__file__).parent
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv-dir", type=Path, default=here)
+    parser.add_argument("--db", type=Path, default=here / "vehicles.db")
+    parser.add_argument("--partition", choices=["month", "day", "none"], default="month")
+    args = parser.parse_args()
+    build(args.csv_dir, args.db, args.partition)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import time
+
+import streamlit as st
+
+from tracing import get_tracer, stage_stats
+
+# ---------- Trace dashboard: which stage dominates latency? ----------
+
+st.set_page_config(page_title="Trace dashboard", page_icon="⏱️")
+st.title("⏱️ Trace dashboard")
+
+windows = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "All": None}
+window = st.selectbox("Time window", list(windows), index=1)
+since = time.time() - windows[window] if windows[window] else None
+
+spans = get_tracer().sink.load(since)
+if spans.empty:
+    st.info("No traces recorded yet – run a few queries first.")
+    st.stop()
+
+requests = spans[spans["kind"] == "request"]
+c1, c2, c3 = st.columns(3)
+c1.metric("Requests", len(requests))
+c2.metric("p50 request", f"{requests['duration_ms'].quantile(0.5) / 1000:.2f}s" if len(requests) else "–")
+c3.metric("p95 request", f"{requests['duration_ms'].quantile(0.95) / 1000:.2f}s" if len(requests) else "–")
+
+stats = stage_stats(spans)
+st.subheader("Latency per stage")
+st.dataframe(stats, use_container_width=True, hide_index=True)
+stages = stats[stats["kind"] != "request"].set_index("name")
+st.bar_chart(stages[["p50_ms", "p95_ms"]])
+
+tokens = spans[spans["kind"] == "llm"].groupby("name")[["prompt_tokens", "completion_tokens"]].mean().round(0)
+if not tokens.empty:
+    st.subheader("Mean tokens per LLM call")
+    st.dataframe(tokens, use_container_width=True)
+
+st.subheader("Recent traces")
+recent = requests.sort_values("start_ts", ascending=False).head(20)
+for _, req in recent.iterrows():
+    label = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(req['start_ts']))} · {req['duration_ms'] / 1000:.2f}s"
+    with st.expander(label):
+        steps = spans[(spans["trace_id"] == req["trace_id"]) & (spans["kind"] != "request")].copy()
+        steps["offset_ms"] = ((steps["start_ts"] - req["start_ts"]) * 1000).round(1)
+        st.dataframe(
+            steps[["offset_ms", "kind", "name", "duration_ms", "prompt_tokens", "completion_tokens", "rows", "error"]]
+            .sort_values("offset_ms"),
+            use_container_width=True,
+            hide_index=True,
+        )
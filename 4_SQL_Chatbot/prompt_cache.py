@@ -0,0 +1,123 @@
+"""
+Instrumentation for provider-side prompt caching.
+
+OpenAI reuses the KV cache for the longest byte-identical request prefix
+(>= 1024 tokens). `PromptCacheMonitor` is a LangChain callback that, for every
+chat-model call, hashes the static prefix it was sent, and records prompt vs.
+cached input tokens plus time-to-first-token. With any chat model (a fake one
+works as a local mock) `prefix_is_stable` shows whether the prefix stayed
+byte-stable across calls.
+"""
+import hashlib
+import threading
+import time
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+PREFIX_MESSAGES = 1  # leading messages that must be identical on every call
+
+
+def _content(message) -> str:
+    content = getattr(message, "content", message)
+    return content if isinstance(content, str) else repr(content)
+
+
+def prefix_hash(messages: list, n: int = PREFIX_MESSAGES) -> str:
+    digest = hashlib.sha256()
+    for m in messages[:n]:
+        digest.update(_content(m).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def _usage(response) -> tuple:
+    """(prompt_tokens, cached_tokens) from an LLMResult, streaming or not."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        details = usage.get("prompt_tokens_details") or {}
+        return usage.get("prompt_tokens", 0), details.get("cached_tokens", 0) or 0
+    for gens in response.generations:
+        for gen in gens:
+            meta = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if meta:
+                details = meta.get("input_token_details") or {}
+                return meta.get("input_tokens", 0), details.get("cache_read", 0) or 0
+    return 0, 0
+
+
+class PromptCacheMonitor(BaseCallbackHandler):
+    """Records prefix hash, prompt/cached tokens and TTFT for each LLM call."""
+
+    def __init__(self, prefix_messages: int = PREFIX_MESSAGES):
+        self.prefix_messages = prefix_messages
+        self.records: list = []
+        self._pending: dict = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        flat = messages[0] if messages else []
+        with self._lock:
+            self._pending[run_id] = {
+                "prefix_hash": prefix_hash(flat, self.prefix_messages),
+                "prefix_chars": sum(len(_content(m)) for m in flat[: self.prefix_messages]),
+                "start": time.perf_counter(),
+                "ttft": None,
+            }
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        rec = self._pending.get(run_id)
+        if rec is not None and rec["ttft"] is None:
+            rec["ttft"] = time.perf_counter() - rec["start"]
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            rec = self._pending.pop(run_id, None)
+        if rec is None:
+            return
+        prompt_tokens, cached_tokens = _usage(response)
+        rec.update(
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            latency=time.perf_counter() - rec.pop("start"),
+        )
+        with self._lock:
+            self.records.append(rec)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._pending.pop(run_id, None)
+
+    def summary(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+        prompt = sum(r["prompt_tokens"] for r in records)
+        cached = sum(r["cached_tokens"] for r in records)
+        ttfts = [r["ttft"] for r in records if r["ttft"] is not None]
+        return {
+            "calls": len(records),
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "cached_share": cached / prompt if prompt else 0.0,
+            "mean_ttft": sum(ttfts) / len(ttfts) if ttfts else None,
+            "prefix_stable": prefix_is_stable(records),
+        }
+
+
+def prefix_is_stable(records: list) -> Optional[bool]:
+    """True if every recorded call sent the same static prefix (None if no calls)."""
+    if not records:
+        return None
+    return len({r["prefix_hash"] for r in records}) == 1
+
+
+def render_prompt_cache_stats(st, monitor: PromptCacheMonitor) -> None:
+    s = monitor.summary()
+    if not s["calls"]:
+        return
+    ttft = f", TTFT {s['mean_ttft']:.2f}s" if s["mean_ttft"] is not None else ""
+    st.sidebar.caption(
+        f"Prompt cache: {s['cached_share']:.0%} of {s['prompt_tokens']:,} input tokens cached "
+        f"over {s['calls']} calls{ttft}; static prefix {'stable' if s['prefix_stable'] else 'CHANGED'}"
+    )
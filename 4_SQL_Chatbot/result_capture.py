@@ -0,0 +1,120 @@
+"""
+Typed result rows behind the agent's answer.
+
+The agent sees `sql_db_query` results as text and usually writes the rows
+back out as a markdown table. Parsing that markdown back loses types, and
+breaks on values that contain commas or pipes. It also misses every row the
+LLM left out. Instead, `CachedSQLDatabase.run` records each query's columns
+and rows (as returned by the driver) while `capture()` is active. After the
+agent finishes, `linked_frame` picks the query behind the answer's table.
+
+The UI and the downloads use that DataFrame. Markdown parsing
+(`parse_markdown_table`) is only the fallback when no captured query
+matches the table.
+"""
+import contextvars
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+_ACTIVE: contextvars.ContextVar = contextvars.ContextVar("captured_queries", default=None)
+_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+_CELL_SPLIT = re.compile(r"(?<!\\)\|")
+MATCH_ROWS = 50  # frame rows searched for the answer's first table row
+
+
+@dataclass(frozen=True)
+class QueryRows:
+    sql: str
+    columns: tuple
+    rows: list  # tuples of driver values (int/float/str/None)
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame.from_records(self.rows, columns=list(self.columns))
+
+
+@contextmanager
+def capture():
+    """Collect the QueryRows of every query run inside the block."""
+    captured: list = []
+    token = _ACTIVE.set(captured)
+    try:
+        yield captured
+    finally:
+        _ACTIVE.reset(token)
+
+
+def record(result: QueryRows) -> None:
+    captured = _ACTIVE.get()
+    if captured is not None:
+        captured.append(result)
+
+
+def _cells(line: str) -> list:
+    return [c.strip().replace("\\|", "|") for c in _CELL_SPLIT.split(line.strip().strip("|"))]
+
+
+def _markdown_table(text: str) -> Optional[tuple]:
+    """(header, rows) of the first markdown table in `text`, or None."""
+    lines = text.splitlines()
+    for i in range(len(lines) - 1):
+        if "|" in lines[i] and _SEPARATOR.match(lines[i + 1].strip()):
+            rows = []
+            for line in lines[i + 2:]:
+                if "|" not in line:
+                    break
+                rows.append(_cells(line))
+            return _cells(lines[i]), rows
+    return None
+
+
+def parse_markdown_table(text: str) -> Optional[pd.DataFrame]:
+    """First markdown table in `text` as a DataFrame, numeric columns converted."""
+    table = _markdown_table(text)
+    if table is None:
+        return None
+    header, rows = table
+    width = len(header)
+    rows = [(row + [""] * width)[:width] for row in rows]
+    df = pd.DataFrame(rows, columns=header).replace("", None)
+    for col in df.columns:
+        numbers = pd.to_numeric(df[col], errors="coerce")
+        if numbers.notna().sum() == df[col].notna().sum():
+            df[col] = numbers
+    return df
+
+
+def _norm(value) -> str:
+    try:
+        return f"{float(value):.4g}"
+    except (TypeError, ValueError):
+        return str(value).strip().lower()
+
+
+def _matches(result: QueryRows, header: list, first_row: Optional[list]) -> bool:
+    """Same width as the answer's table and, if it has rows, one of ours looks like its first."""
+    if len(result.columns) != len(header) or not result.rows:
+        return False
+    if not first_row:
+        return True
+    wanted = [_norm(v) for v in first_row]
+    for row in result.rows[:MATCH_ROWS]:
+        same = sum(_norm(v) == w for v, w in zip(row, wanted))
+        if same * 2 >= len(wanted):
+            return True
+    return False
+
+
+def linked_frame(answer: str, captured: list) -> Optional[pd.DataFrame]:
+    """Typed rows for the table in `answer`: the latest captured query that matches it, else the parsed markdown."""
+    table = _markdown_table(answer or "")
+    if table is None:
+        return None
+    header, rows = table
+    for result in reversed(captured):
+        if _matches(result, header, rows[0] if rows else None):
+            return result.frame()
+    return parse_markdown_table(answer)
@@ -0,0 +1,179 @@
+"""
+Schema catalog shared by the SQL agents.
+
+Holds tables, column names/types, row counts, indexes and a few sample
+values per column. It is built once per DB version with set-based pragma
+queries (no per-table round trips for columns/indexes) and rebuilt only when
+the file signature (mtime, size) changes – the same check that makes
+`db_pool` reopen its immutable connections, which cannot report changes
+through `PRAGMA data_version`.
+Partitioned tables (a UNION ALL view over `<table>__p<period>` tables, as
+the SQL chatbot's `ingest.py` writes them) appear once, under the view's name.
+Building never scans a whole table: row counts are estimates (sqlite_stat1,
+else the rowid range; a partition view sums its partitions, other views are
+counted up to `VIEW_COUNT_CAP`) and samples come from the first
+`SAMPLE_SCAN_ROWS` rows.
+"""
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from db_pool import get_pool
+from result_cache import db_version
+
+SAMPLE_VALUES = 3
+SAMPLE_SCAN_ROWS = 1000
+VIEW_COUNT_CAP = 100_000
+_PARTITION = re.compile(r"__p(\d{6}|\d{8}|null)$")
+
+_COLUMNS_SQL = """
+SELECT m.name, p.name, p.type, p.pk
+FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%' AND m.name != '_partitions'
+ORDER BY m.name, p.cid
+"""
+_INDEXES_SQL = """
+SELECT m.name, il.name, il."unique", ii.name
+FROM sqlite_master AS m
+JOIN pragma_index_list(m.name) AS il
+JOIN pragma_index_info(il.name) AS ii
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+ORDER BY m.name, il.name, ii.seqno
+"""
+
+
+def partition_name(table: str, period: str) -> str:
+    """'getvehicles', '202506' → 'getvehicles__p202506'."""
+    return f"{table}__p{period}"
+
+
+def is_partition(name: str) -> bool:
+    return bool(_PARTITION.search(name))
+
+
+def _analyzed_rows(conn) -> dict:
+    """{table: rows} recorded by ANALYZE, if it has been run."""
+    try:
+        return {tbl: int(stat.split()[0]) for tbl, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1") if stat}
+    except sqlite3.Error:
+        return {}  # never analyzed
+
+
+def _estimate_rows(conn, name: str, kinds: dict, analyzed: dict) -> int:
+    """Row count of `name` without a full scan."""
+    if name in analyzed:
+        return analyzed[name]
+    if kinds.get(name) == "table":
+        try:  # two index seeks; exact unless rows were deleted
+            lo, hi = conn.execute(f'SELECT (SELECT MIN(rowid) FROM "{name}"), (SELECT MAX(rowid) FROM "{name}")').fetchone()
+            return hi - lo + 1 if hi is not None else 0
+        except sqlite3.Error:
+            pass  # WITHOUT ROWID table
+    parts = [p for p in kinds if is_partition(p) and p.rsplit("__p", 1)[0] == name]
+    if parts:
+        return sum(_estimate_rows(conn, p, kinds, analyzed) for p in parts)
+    return conn.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM "{name}" LIMIT {VIEW_COUNT_CAP})').fetchone()[0]
+
+
+@dataclass
+class Column:
+    name: str
+    type: str
+    pk: bool = False
+    samples: list = field(default_factory=list)
+
+
+@dataclass
+class Table:
+    name: str
+    columns: list = field(default_factory=list)   # list[Column]
+    row_count: int = 0                            # estimate, see _estimate_rows
+    indexes: dict = field(default_factory=dict)   # index name -> [column, ...]
+
+    @property
+    def column_names(self) -> list:
+        return [c.name for c in self.columns]
+
+    def ddl(self) -> str:
+        """Compact CREATE TABLE text for prompts."""
+        cols = ", ".join(f"{c.name} {c.type}".strip() for c in self.columns)
+        return f"CREATE TABLE {self.name} ({cols}); -- {self.row_count} rows"
+
+
+class SchemaCatalog:
+    """Lazily built, auto-invalidating view of one database's schema."""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._tables: dict = {}
+        self._version: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    def version(self) -> tuple:
+        return db_version(self.db_path)
+
+    def _build(self, conn) -> dict:
+        tables: dict = {}
+        for tbl, col, typ, pk in conn.execute(_COLUMNS_SQL):
+            if is_partition(tbl):
+                continue
+            tables.setdefault(tbl, Table(tbl)).columns.append(Column(col, typ or "", bool(pk)))
+        for tbl, idx, _unique, col in conn.execute(_INDEXES_SQL):
+            if tbl not in tables:
+                continue
+            tables[tbl].indexes.setdefault(idx, []).append(col)
+        kinds = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')"))
+        analyzed = _analyzed_rows(conn)
+        for t in tables.values():
+            t.row_count = _estimate_rows(conn, t.name, kinds, analyzed)
+            for c in t.columns:
+                c.samples = [
+                    r[0] for r in conn.execute(
+                        f'SELECT DISTINCT "{c.name}" FROM (SELECT "{c.name}" FROM "{t.name}" LIMIT {SAMPLE_SCAN_ROWS}) '
+                        f'WHERE "{c.name}" IS NOT NULL LIMIT {SAMPLE_VALUES}'
+                    )
+                ]
+        return tables
+
+    def tables(self) -> dict:
+        """Return {table name: Table}, rebuilding if the database changed."""
+        version = self.version()
+        with self._lock:
+            if version != self._version:
+                with get_pool(self.db_path).connection() as conn:
+                    self._tables = self._build(conn)
+                self._version = version
+            return self._tables
+
+    def table_names(self) -> set:
+        return set(self.tables())
+
+    def hidden_tables(self) -> list:
+        """Partition tables (served through their views) and the `_partitions` registry."""
+        with get_pool(self.db_path).connection() as conn:
+            names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return [n for n in names if is_partition(n) or n == "_partitions"]
+
+    def columns(self) -> dict:
+        """{table: [column, ...]} – the shape the graph state uses as `schema`."""
+        return {name: t.column_names for name, t in self.tables().items()}
+
+    def get(self, table: str) -> Optional[Table]:
+        return self.tables().get(table)
+
+
+_CATALOGS: dict = {}
+_CATALOGS_LOCK = threading.Lock()
+
+
+def get_catalog(db_path) -> SchemaCatalog:
+    """Return the process-wide catalog for `db_path`."""
+    key = str(Path(db_path).resolve())
+    with _CATALOGS_LOCK:
+        catalog = _CATALOGS.get(key)
+        if catalog is None:
+            catalog = _CATALOGS[key] = SchemaCatalog(key)
+        return catalog
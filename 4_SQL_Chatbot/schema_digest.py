@@ -0,0 +1,67 @@
+"""
+Compact schema digest for pre-seeding the SQL agent's context.
+
+One line of DDL per table (from the schema catalog), a few sample values for
+key columns, and the join-key graph from `structured_memory.json`. With this
+in the prompt up front, the agent can skip `sql_db_list_tables` and
+`sql_db_schema` and go straight to `sql_db_query`. The digest only changes
+when the catalog does, so it can sit in the cached static prompt prefix.
+"""
+import json
+from pathlib import Path
+
+DISCOVERY_TOOLS = ("sql_db_list_tables", "sql_db_schema")
+SAMPLE_COLUMNS = 4  # columns per table that show sample values
+
+
+def join_edges(memory: dict) -> list:
+    """Unique 'a.x = b.y' edges from structured_memory relationships."""
+    edges = set()
+    for src, meta in memory.items():
+        for dst, keys in meta.get("relationships", {}).items():
+            for key in keys:
+                left, _, right = (k.strip() for k in key.partition("→"))
+                a, b = f"{src}.{left}", f"{dst}.{right or left}"
+                edges.add(" = ".join(sorted((a, b))))
+    return sorted(edges)
+
+
+def build_digest(tables: dict, memory: dict) -> str:
+    """`tables` is SchemaCatalog.tables(); returns plain text for the prompt."""
+    lines = ["## Database schema (authoritative - already loaded, do not re-discover)"]
+    for name in sorted(tables):
+        t = tables[name]
+        lines.append(t.ddl())
+        samples = [f"{c.name}={c.samples[:2]}" for c in t.columns if c.samples][:SAMPLE_COLUMNS]
+        if samples:
+            lines.append(f"  -- e.g. {', '.join(samples)}")
+    lines.append("")
+    lines.append("## Join keys")
+    known = {f"{n}.{c}".lower() for n, t in tables.items() for c in t.column_names}
+    lines.extend(e for e in join_edges(memory) if all(side.lower() in known for side in e.split(" = ")))
+    lines.append("")
+    lines.append(
+        "Use this schema directly: go straight to sql_db_query. Only call sql_db_list_tables "
+        "or sql_db_schema if a table or column you need is missing above."
+    )
+    return "\n".join(lines)
+
+
+_DIGESTS: dict = {}
+
+
+def schema_digest(catalog, memory_path="modular_prompt/structured_memory.json") -> str:
+    """Digest for `catalog`, rebuilt only when the catalog version changes."""
+    key = (catalog.db_path, catalog.version(), str(memory_path))
+    digest = _DIGESTS.get(key)
+    if digest is None:
+        path = Path(memory_path)
+        memory = json.loads(path.read_text()) if path.exists() else {}
+        digest = _DIGESTS[key] = build_digest(catalog.tables(), memory)
+    return digest
+
+
+def count_tool_calls(intermediate_steps: list) -> tuple:
+    """(total tool calls, schema-discovery calls) for one agent run."""
+    tools = [getattr(action, "tool", "") for action, _ in intermediate_steps]
+    return len(tools), sum(t in DISCOVERY_TOOLS for t in tools)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app's modules are imported flat, the way `streamlit run app.py` sees them
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,82 @@
+import sqlite3
+import time
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+import analytics_backend
+from analytics_backend import ColumnarMirror, QueryRouter, query_shape
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "fleet.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE pings (vid INTEGER, soc REAL, note TEXT)")
+        conn.executemany("INSERT INTO pings VALUES (?, ?, ?)",
+                         [(2400 + i % 5, i / 10, "ok" if i % 2 else i) for i in range(2500)])
+    return path
+
+
+def test_query_shape_only_routes_portable_aggregates():
+    assert query_shape("SELECT vid, AVG(soc) FROM pings GROUP BY vid") == "analytic"
+    assert query_shape("SELECT * FROM pings WHERE vid = 2401") == "lookup"
+    assert query_shape("SELECT vid, time_bucket(ts, 900), COUNT(*) FROM pings GROUP BY 1, 2") == "lookup"
+
+
+def test_build_streams_tables_in_batches_with_stored_types(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_backend, "EXPORT_BATCH", 300)
+    mirror = ColumnarMirror(db_path, folder=tmp_path / "mirror")
+    assert mirror.build() == {"pings": 2500}
+    assert mirror.ready()
+    with mirror.connection() as conn:
+        types = dict(conn.execute("SELECT column_name, data_type FROM information_schema.columns "
+                                  "WHERE table_name = 'pings'").fetchall())
+        totals = conn.execute("SELECT COUNT(*), SUM(vid), COUNT(DISTINCT note) FROM pings").fetchone()
+    assert types == {"vid": "BIGINT", "soc": "DOUBLE", "note": "VARCHAR"}  # note mixes text and integers
+    expected = sqlite3.connect(db_path).execute(
+        "SELECT COUNT(*), SUM(vid), COUNT(DISTINCT CAST(note AS TEXT)) FROM pings").fetchone()
+    assert totals == expected
+    assert not list((tmp_path / "mirror").rglob("staging.duckdb*"))
+
+
+def test_duckdb_queries_past_the_budget_raise_timeout(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_backend, "COLUMNAR_MIN_ROWS", 1)
+    router = QueryRouter(db_path)
+    router.mirror = ColumnarMirror(db_path, folder=tmp_path / "mirror")
+    router.mirror.build()
+    slow = "SELECT a.vid, COUNT(*) FROM pings a, pings b, pings c GROUP BY a.vid"  # ~1.6e10 rows
+    fallback = []
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        router.run(slow, columnar=lambda conn: conn.execute(slow).fetchall(),
+                   row_store=lambda: fallback.append(1), timeout=0.3)
+    assert time.monotonic() - start < 5
+    assert not fallback  # the budget is spent; SQLite does not start over
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT vid, ROUND(AVG(soc), 6), COUNT(*) / 7 FROM pings GROUP BY vid ORDER BY vid",
+    "SELECT rt, ROUND(SUM(kwh), 6) FROM trips GROUP BY rt ORDER BY rt",
+    "SELECT rt, MAX(kwh) AS m FROM trips GROUP BY rt ORDER BY m DESC, rt",
+])
+def test_routed_queries_give_the_same_answer_on_both_backends(db_path, tmp_path, sql):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE trips (rt TEXT, kwh REAL)")
+        conn.executemany("INSERT INTO trips VALUES (?, ?)",
+                         [(None if i % 7 == 0 else ("X9", "x9", "2")[i % 3], None if i % 5 == 0 else i / 4)
+                          for i in range(300)])
+    assert query_shape(sql) == "analytic"
+    mirror = ColumnarMirror(db_path, folder=tmp_path / "mirror")
+    mirror.build()
+    assert mirror.ready()
+    with mirror.connection() as conn:
+        columnar = conn.execute(sql).fetchall()
+    assert columnar == sqlite3.connect(db_path).execute(sql).fetchall()
+
+
+def test_pattern_matching_stays_on_sqlite():
+    # LIKE is case-insensitive in SQLite but not in DuckDB
+    assert query_shape("SELECT COUNT(*) FROM trips WHERE rt LIKE 'x%'") == "lookup"
+    assert query_shape("SELECT COUNT(*) FROM trips WHERE rt GLOB 'X*'") == "lookup"
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from conversation_memory import ConversationMemory
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return AIMessage(content=f"summary {self.calls}")
+
+
+def _chat(turns):
+    messages = []
+    for i in range(turns):
+        messages += [{"role": "user", "content": f"soc of bus {2400 + i}?"},
+                     {"role": "assistant", "content": f"bus {2400 + i} is at {50 + i}%"}]
+    return messages
+
+
+def test_only_the_last_turns_are_sent_verbatim():
+    memory = ConversationMemory(llm=CountingLLM(), keep_turns=2)
+    messages = _chat(6)
+    memory.update(messages)
+    history = memory.history(messages)
+    assert isinstance(history[0], SystemMessage) and "summary" in history[0].content
+    assert [m.content for m in history[1:]] == [m["content"] for m in messages[-4:]]
+    assert isinstance(history[1], HumanMessage) and isinstance(history[2], AIMessage)
+
+
+def test_the_summary_is_updated_incrementally():
+    llm = CountingLLM()
+    memory = ConversationMemory(llm=llm, keep_turns=2)
+    messages = _chat(6)
+    memory.update(messages)
+    calls = llm.calls
+    memory.update(messages)  # nothing new left the window
+    assert llm.calls == calls
+    messages += _chat(1)
+    memory.update(messages)
+    assert llm.calls == calls + 1
+
+
+def test_history_stays_under_the_token_budget():
+    memory = ConversationMemory(llm=CountingLLM(), keep_turns=10, max_tokens=40)
+    messages = _chat(3) + [{"role": "assistant", "content": "long answer " * 400}]
+    history = memory.history(messages)
+    assert all("long answer" not in m.content for m in history)
+
+
+def test_without_an_llm_the_summary_falls_back_locally_and_tables_are_kept():
+    memory = ConversationMemory(llm=None, keep_turns=1, keep_tables=1)
+    memory.remember_table("old", pd.DataFrame({"vid": [1]}))
+    memory.remember_table("soc by bus", pd.DataFrame({"vid": [2402, 2403], "soc": [55.0, 61.5]}))
+    messages = _chat(3)
+    memory.update(messages)
+    assert memory.summary
+    tables = memory.history(messages)[1].content
+    assert "soc by bus" in tables and "2402,55.0" in tables and "old" not in tables
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+import pytest
+
+import db_pool
+
+
+def make_db(path, value):
+    tmp = path.with_suffix(".tmp")
+    conn = sqlite3.connect(tmp)
+    conn.execute("CREATE TABLE t (v TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(value,)] * (10 if value == "old" else 500))
+    conn.commit()
+    conn.close()
+    os.replace(tmp, path)  # a rebuild, the way ingest.py replaces vehicles.db
+
+
+def test_connections_are_read_only_and_run_connect_hooks(tmp_path):
+    db = tmp_path / "v.db"
+    make_db(db, "old")
+    seen = []
+    db_pool.add_connect_hook(lambda conn, path: seen.append(path))
+    with db_pool.get_pool(db).connection() as conn:
+        assert conn.execute("SELECT v FROM t").fetchone() == ("old",)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO t VALUES ('x')")
+    assert seen and seen[-1] == db.resolve()
+
+
+def test_pool_is_rebuilt_when_the_file_changes(tmp_path):
+    db = tmp_path / "v.db"
+    make_db(db, "old")
+    pool = db_pool.get_pool(db)
+    assert db_pool.get_pool(db) is pool
+    make_db(db, "new")
+    fresh = db_pool.get_pool(db)
+    assert fresh is not pool
+    with fresh.connection() as conn:
+        assert conn.execute("SELECT v FROM t").fetchone() == ("new",)
+
+
+def test_sqlalchemy_engine_drops_connections_opened_before_a_rebuild(tmp_path):
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    from sqlalchemy.pool import QueuePool
+
+    db = tmp_path / "v.db"
+    make_db(db, "old")
+    engine = sqlalchemy.create_engine("sqlite://", creator=lambda: db_pool.get_pool(db).connect(),
+                                      poolclass=QueuePool, pool_size=1, max_overflow=0)
+    db_pool.recycle_on_change(engine, db)
+    query = sqlalchemy.text("SELECT v, COUNT(*) FROM t")
+    with engine.connect() as conn:
+        assert tuple(conn.execute(query).one()) == ("old", 10)
+    make_db(db, "new")
+    with engine.connect() as conn:
+        assert tuple(conn.execute(query).one()) == ("new", 500)
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+
+from domain_classifier import classify_domain, normalize
+
+PROMPTS = str(Path(__file__).resolve().parents[1] / "modular_prompt")
+DOMAIN_CONFIDENCE = 0.8  # app.py: below this the LLM decides
+
+
+def classify(question):
+    return classify_domain(normalize(question), PROMPTS)
+
+
+@pytest.mark.parametrize("question", [
+    "How many records were loaded today?",
+    "How many kilowatt hours did we use last week",
+    "what time did 2402 pull out",
+    "give me the top 5 consumers",
+    "explain quantum entanglement in detail please",  # not covered by the lexicon at all
+    "tell me a joke about buses",                      # mixed signals
+])
+def test_questions_without_a_clear_off_topic_signal_are_never_rejected_locally(question):
+    is_transit, confidence = classify(question)
+    assert is_transit or confidence < DOMAIN_CONFIDENCE
+
+
+def test_longer_unknown_questions_do_not_become_more_confidently_off_topic():
+    short = classify("explain entanglement")
+    long = classify("explain quantum entanglement to me in great detail with several worked examples")
+    assert short == long == (True, 0.0)
+
+
+@pytest.mark.parametrize("question", ["SOC of bus 2402", "which blocks ran on route 3 yesterday"])
+def test_fleet_questions_are_accepted_locally(question):
+    is_transit, confidence = classify(question)
+    assert is_transit and confidence >= DOMAIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("question", ["write me a poem about cats", "what is the capital of France"])
+def test_explicit_off_topic_questions_are_rejected_locally(question):
+    is_transit, confidence = classify(question)
+    assert not is_transit and confidence >= DOMAIN_CONFIDENCE
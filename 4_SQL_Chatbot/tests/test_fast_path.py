@@ -0,0 +1,36 @@
+import pytest
+
+from fast_path import match
+
+
+@pytest.mark.parametrize("question", [
+    "What was the SOC of bus 2402 on June 18, 2025?",
+    "where was bus 2401 at 10:00 on 2025-06-18",
+    "location of bus 2401 and 2402",
+    "where is route 2401",
+    "which buses have SOC below 2400",
+    "lowest soc of bus 2402 today",
+    "soc of bus 2402 yesterday",
+    "where was bus 2401 2 hours ago",
+    "average soc of bus 2402",
+    "soc of all buses",
+])
+def test_anything_but_the_current_state_of_one_bus_falls_back_to_the_agent(question):
+    assert match(question) is None
+
+
+@pytest.mark.parametrize("question, intent, params", [
+    ("where is bus 2401", "location", ("2401",)),
+    ("current SOC of bus 2402", "current_soc", ("2402",)),
+    ("bus 2403's most recent trip", "last_trip", ("2403",)),
+    ("list all tables", "list_tables", ()),
+    ("block 102 schedule", "block_schedule", ("102",)),
+])
+def test_single_bus_current_state_questions_match(question, intent, params):
+    matched = match(question)
+    assert matched is not None
+    assert (matched[0].name, matched[1]) == (intent, params)
+
+
+def test_a_block_number_is_not_taken_for_a_bus():
+    assert match("location of block 1502") is None
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from history_store import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(tmp_path / "history.db")
+
+
+def test_messages_are_kept_per_session_in_order(store):
+    store.append("a", "user", "soc of bus 2402?")
+    store.append("b", "user", "where is bus 2401?")
+    store.append("a", "assistant", "55%")
+    assert store.recent("a") == [{"role": "user", "content": "soc of bus 2402?"},
+                                 {"role": "assistant", "content": "55%"}]
+    assert store.recent("a", limit=1) == [{"role": "assistant", "content": "55%"}]
+
+
+def test_clear_hides_earlier_messages_and_compact_removes_them(store):
+    store.append("a", "user", "old question")
+    store.clear("a")
+    store.append("a", "user", "new question")
+    store.append("b", "user", "other session")
+    assert store.recent("a") == [{"role": "user", "content": "new question"}]
+    assert store.compact() == 2  # the old message and the marker
+    assert store.recent("a") == [{"role": "user", "content": "new question"}]
+    assert store.recent("b") == [{"role": "user", "content": "other session"}]
+
+
+def test_compact_drops_idle_sessions(store):
+    store.append("idle", "user", "hello")
+    store._conn.execute("UPDATE messages SET ts = ?", (time.time() - 40 * 86400,))
+    store.append("active", "user", "hi")
+    store.compact(max_idle_days=30)
+    assert store.recent("idle") == [] and len(store.recent("active")) == 1
+
+
+def test_concurrent_appends_are_all_kept(store):
+    def write(session):
+        for i in range(50):
+            store.append(session, "user", str(i))
+
+    threads = [threading.Thread(target=write, args=(f"s{n}",)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all([m["content"] for m in store.recent(f"s{n}")] == [str(i) for i in range(50)] for n in range(4))
@@ -0,0 +1,40 @@
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from ingest import build, normalize_times, to_epoch
+from schema_catalog import SchemaCatalog
+from timeseries import FLEET_TZ
+
+JUNE_18_8AM = int(datetime(2025, 6, 18, 8, 0, tzinfo=FLEET_TZ).timestamp())
+
+
+def test_to_epoch_reads_seconds_milliseconds_and_local_text():
+    values = pd.Series([JUNE_18_8AM, JUNE_18_8AM * 1000, "2025-06-18 08:00:00", None, "garbage"], dtype=object)
+    assert to_epoch(values).tolist()[:3] == [JUNE_18_8AM] * 3
+    assert to_epoch(values).isna().tolist()[3:] == [True, True]
+
+
+def test_missing_epochs_fall_back_to_text_and_dates_gain_epoch_columns():
+    df = pd.DataFrame({"timestamp": [None, JUNE_18_8AM], "tmstmp": ["20250618 08:00:00", None],
+                       "stsd": ["2025-06-18", "2025-06-18"]})
+    out = normalize_times("getvehicles", df)
+    assert out["timestamp"].tolist() == [JUNE_18_8AM, JUNE_18_8AM]
+    assert out["stsd_epoch"].tolist() == [JUNE_18_8AM - 8 * 3600] * 2  # local midnight
+
+
+def test_partitioned_tables_are_a_view_over_indexed_partitions(tmp_path):
+    rows = [(i, 2401 + i % 2, JUNE_18_8AM + i * 86400 * 5, "2025-06-18", 41.8, -87.6) for i in range(6)]
+    pd.DataFrame(rows, columns=["idx", "vid", "timestamp", "stsd", "lat", "lon"]).to_csv(
+        tmp_path / "getvehicles.csv", index=False)
+    db = tmp_path / "vehicles.db"
+    build(tmp_path, db, partition="month")
+    conn = sqlite3.connect(db)
+    parts = [r[0] for r in conn.execute("SELECT name FROM _partitions WHERE parent = 'getvehicles' ORDER BY name")]
+    assert parts == ["getvehicles__p202506", "getvehicles__p202507"]
+    assert conn.execute("SELECT COUNT(*) FROM getvehicles").fetchone() == (6,)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'getvehicles'").fetchone() == ("view",)
+    indexes = {r[1] for r in conn.execute("PRAGMA index_list('getvehicles__p202506')")}
+    assert {"ix_getvehicles__p202506_timestamp", "ix_getvehicles__p202506_vid_timestamp"} <= indexes
+    assert set(SchemaCatalog(db).tables()) == {"getvehicles"}  # partitions stay hidden
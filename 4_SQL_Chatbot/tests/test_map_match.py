@@ -0,0 +1,52 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from map_match import TABLE, match_pings, rebuild
+from shape_index import ShapeIndex
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "fleet.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE gtfs_shape (shape_id TEXT, route_id TEXT, latitude REAL, longitude REAL, "
+                     "distance REAL, sequence INTEGER)")
+        rows = [("a", "10", 41.80, lon, i * 440.0, i) for i, lon in enumerate(np.linspace(-87.70, -87.60, 20))]
+        rows += [("b", "20", lat, -87.65, i * 550.0, i) for i, lat in enumerate(np.linspace(41.75, 41.85, 20))]
+        conn.executemany("INSERT INTO gtfs_shape VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE TABLE gtfs_trip (TRIP_ID INTEGER, SHAPE_ID TEXT)")
+        conn.execute("INSERT INTO gtfs_trip VALUES (668020, 'b')")
+        conn.execute("CREATE TABLE getvehicles (vid TEXT, timestamp INTEGER, tripid TEXT, rt TEXT, lat REAL, lon REAL)")
+        conn.executemany("INSERT INTO getvehicles VALUES (?, ?, ?, ?, ?, ?)", [
+            ("2401", 1, "668020.0", "20", 41.8001, -87.6501),  # near both shapes: the trip decides
+            ("2402", 2, None, "10", 41.801, -87.68),            # no trip: its route's shape
+            ("2403", 3, None, None, 41.84, -87.6499),           # nothing known: nearest shape
+            ("2404", 4, None, None, None, None),                # no position
+        ])
+    return path
+
+
+def test_pings_match_trip_then_route_then_nearest(db_path):
+    with sqlite3.connect(db_path) as conn:
+        index = ShapeIndex.from_connection(conn)
+        pings = pd.read_sql_query("SELECT * FROM getvehicles", conn)
+    shapes = pd.Series({"668020": "b"})
+    out = match_pings(pings, index, shapes).set_index("vid")
+    assert out.loc["2401", ["shape_id", "matched_by"]].tolist() == ["b", "trip"]
+    assert out.loc["2402", ["shape_id", "route_id", "matched_by"]].tolist() == ["a", "10", "route"]
+    assert out.loc["2403", ["shape_id", "matched_by"]].tolist() == ["b", "nearest"]
+    assert pd.isna(out.loc["2404", "matched_by"]) and pd.isna(out.loc["2404", "along_m"])
+    assert out.loc["2402", "offset_m"] == pytest.approx(111, abs=2)
+    assert out.loc["2401", "remaining_m"] == pytest.approx(19 * 550 - out.loc["2401", "along_m"])
+
+
+def test_rebuild_writes_an_indexed_table(db_path):
+    assert rebuild(db_path, chunk_rows=2) == 4
+    with sqlite3.connect(db_path) as conn:
+        matched = dict(conn.execute(f"SELECT vid, matched_by FROM {TABLE}").fetchall())
+        indexes = {r[1] for r in conn.execute(f"PRAGMA index_list({TABLE})")}
+    assert matched == {"2401": "trip", "2402": "route", "2403": "nearest", "2404": None}
+    assert {f"ix_{TABLE}_vid_ts", f"ix_{TABLE}_shape"} <= indexes
@@ -0,0 +1,44 @@
+import json
+import os
+
+import pytest
+
+from prompt_builder import PromptBuilder, count_tokens
+
+
+@pytest.fixture
+def folder(tmp_path):
+    (tmp_path / "a_rules.txt").write_text("Always answer with SQL results only.")
+    (tmp_path / "b_soc.md").write_text(
+        "# State of charge\nSOC battery percentage per bus.\n\n# Charging\nCharger sessions and kWh delivered.")
+    (tmp_path / "c_routes.md").write_text("# Routes\nRoute shapes, stops and " + "geometry " * 200)
+    (tmp_path / "d_memory.json").write_text(json.dumps({"soc_logs": {"keys": ["vid"]}, "gtfs_shape": {"keys": ["shape_id"]}}))
+    return tmp_path
+
+
+def test_pinned_files_are_always_included_and_the_rest_is_ranked(folder):
+    builder = PromptBuilder(folder, budget=200, pinned=("a_rules.txt",))
+    prompt = builder.build("battery SOC of bus 2402")
+    assert prompt.startswith("Always answer")
+    assert "SOC battery percentage" in prompt
+    assert "Route shapes" not in prompt and "Charger sessions" not in prompt
+
+
+def test_the_budget_is_respected_and_order_is_kept(folder):
+    builder = PromptBuilder(folder, budget=60)
+    prompt = builder.build("soc charging kwh routes geometry")
+    assert count_tokens(prompt) <= 60
+    assert prompt.index("State of charge") < prompt.index("Charging")
+
+
+def test_json_files_split_per_top_level_key(folder):
+    builder = PromptBuilder(folder, budget=500, include=["d_memory.json"])
+    assert builder.build("gtfs_shape shape_id") == json.dumps({"gtfs_shape": {"keys": ["shape_id"]}})
+
+
+def test_edited_files_are_reloaded(folder):
+    builder = PromptBuilder(folder, budget=500)
+    assert "Charger" in builder.full()
+    (folder / "b_soc.md").write_text("# State of charge\nOnly SOC now.")
+    os.utime(folder / "b_soc.md", ns=(1, 1))
+    assert "Charger" not in builder.full()
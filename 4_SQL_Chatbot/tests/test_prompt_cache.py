@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from prompt_cache import PromptCacheMonitor, _usage, prefix_hash
+
+
+def _ask(monitor, system, question):
+    llm = FakeListChatModel(responses=["ok"])
+    llm.invoke([SystemMessage(system), HumanMessage(question)], config={"callbacks": [monitor]})
+
+
+def test_a_byte_stable_prefix_is_reported_stable():
+    monitor = PromptCacheMonitor()
+    _ask(monitor, "static rules", "soc of bus 2402")
+    _ask(monitor, "static rules", "where is bus 2401")
+    summary = monitor.summary()
+    assert summary["calls"] == 2 and summary["prefix_stable"] is True
+
+
+def test_a_changed_prefix_is_reported():
+    monitor = PromptCacheMonitor()
+    _ask(monitor, "static rules", "soc of bus 2402")
+    _ask(monitor, "static rules, now at 10:31", "soc of bus 2402")
+    assert monitor.summary()["prefix_stable"] is False
+
+
+def test_prefix_hash_only_covers_the_static_messages():
+    assert prefix_hash(["rules", "question a"]) == prefix_hash(["rules", "question b"])
+    assert prefix_hash(["rules", "question a"], n=2) != prefix_hash(["rules", "question b"], n=2)
+
+
+def test_cached_tokens_are_read_from_either_usage_shape():
+    openai = LLMResult(generations=[[]], llm_output={
+        "token_usage": {"prompt_tokens": 2000, "prompt_tokens_details": {"cached_tokens": 1536}}})
+    assert _usage(openai) == (2000, 1536)
+    message = AIMessage("ok", usage_metadata={"input_tokens": 1800, "output_tokens": 5, "total_tokens": 1805,
+                                              "input_token_details": {"cache_read": 1024}})
+    streamed = LLMResult(generations=[[ChatGeneration(message=message)]])
+    assert _usage(streamed) == (1800, 1024)
@@ -0,0 +1,43 @@
+from result_cache import LRUCache, ResultCache, conversation_key, normalize_question, normalize_sql
+
+
+def test_normalize_sql_ignores_case_whitespace_and_comments_but_not_literals():
+    assert normalize_sql("SELECT  *\nFROM t -- note\nWHERE x = 'A  b';") == "select * from t where x = 'A  b'"
+
+
+def test_normalize_question_drops_punctuation():
+    assert normalize_question("Where is  bus 2402?") == "where is bus 2402"
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_results_are_dropped_when_the_db_file_changes(tmp_path):
+    db = tmp_path / "x.db"
+    db.write_bytes(b"one")
+    cache = ResultCache(db)
+    cache.put_result("select 1", "rows")
+    assert cache.get_result("SELECT 1") == "rows"
+    db.write_bytes(b"changed")
+    assert cache.get_result("select 1") is None
+
+
+def test_answers_are_not_shared_across_sessions_or_conversations(tmp_path):
+    db = tmp_path / "x.db"
+    db.write_bytes(b"")
+    cache = ResultCache(db)
+    history = [{"role": "user", "content": "SOC of route 1"}, {"role": "assistant", "content": "..."}]
+    mine = conversation_key("session-a", history)
+    cache.put_answer("what about route 2?", "answer for a", context=mine)
+
+    assert cache.get_answer("What about route 2", mine) == "answer for a"
+    assert cache.get_answer("what about route 2?", conversation_key("session-b", history)) is None
+    other_chat = [{"role": "user", "content": "energy of block 3"}, {"role": "assistant", "content": "..."}]
+    assert cache.get_answer("what about route 2?", conversation_key("session-a", other_chat)) is None
+    assert cache.get_answer("what about route 2?") is None
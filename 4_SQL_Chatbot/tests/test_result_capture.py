@@ -0,0 +1,41 @@
+from result_capture import QueryRows, capture, linked_frame, parse_markdown_table, record
+
+ANSWER = """Here are the buses:
+
+| vid | note | soc |
+|-----|------|----:|
+| 2402 | a \\| b | 55.2 |
+| 2403 | x, y | 61 |
+
+Bus 2402 is lowest."""
+
+
+def test_markdown_tables_parse_with_escaped_pipes_and_numbers():
+    df = parse_markdown_table(ANSWER)
+    assert df.columns.tolist() == ["vid", "note", "soc"]
+    assert df["note"].tolist() == ["a | b", "x, y"]
+    assert df["soc"].tolist() == [55.2, 61.0] and df["vid"].dtype.kind == "i"
+    assert parse_markdown_table("no table here") is None
+
+
+def test_capture_only_records_inside_the_block():
+    record(QueryRows("SELECT 0", ("x",), [(0,)]))
+    with capture() as captured:
+        record(QueryRows("SELECT 1", ("x",), [(1,)]))
+    record(QueryRows("SELECT 2", ("x",), [(2,)]))
+    assert [q.sql for q in captured] == ["SELECT 1"]
+
+
+def test_the_answer_is_linked_to_the_query_behind_its_table():
+    rows = [(2401, "a | b", 70.0), (2402, "a | b", 55.2), (2403, "x, y", 61.0)]  # the LLM left out 2401
+    captured = [QueryRows("SELECT vid, note, soc FROM t", ("vid", "note", "soc"), rows),
+                QueryRows("SELECT vid, soc FROM t", ("vid", "soc"), [(2402, 55.2)])]
+    df = linked_frame(ANSWER, captured)
+    assert df["vid"].tolist() == [2401, 2402, 2403]
+    assert df["soc"].tolist() == [70.0, 55.2, 61.0]
+
+
+def test_without_a_matching_query_the_markdown_is_parsed():
+    captured = [QueryRows("SELECT 1, 2, 3", ("a", "b", "c"), [(9, 9, 9)])]
+    assert linked_frame(ANSWER, captured)["vid"].tolist() == [2402, 2403]
+    assert linked_frame("No table in this answer.", captured) is None
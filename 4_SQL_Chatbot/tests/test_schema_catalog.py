@@ -0,0 +1,60 @@
+import os
+import sqlite3
+
+from schema_catalog import SchemaCatalog, is_partition, partition_name
+
+
+def build(path, extra_column=False):
+    tmp = path.with_suffix(".tmp")
+    conn = sqlite3.connect(tmp)
+    cols = "vid INTEGER, soc REAL" + (", odometer REAL" if extra_column else "")
+    conn.execute(f"CREATE TABLE getvehicles__p202506 ({cols})")
+    conn.execute(f"CREATE TABLE getvehicles__p202507 ({cols})")
+    conn.execute("CREATE VIEW getvehicles AS SELECT * FROM getvehicles__p202506 UNION ALL SELECT * FROM getvehicles__p202507")
+    conn.execute("CREATE TABLE _partitions (parent TEXT, name TEXT, column TEXT, lo INTEGER, hi INTEGER)")
+    conn.execute("CREATE TABLE bus_vid (vid INTEGER PRIMARY KEY, model TEXT)")
+    conn.execute("CREATE INDEX ix_vid ON getvehicles__p202506 (vid)")
+    conn.executemany("INSERT INTO bus_vid VALUES (?, ?)", [(2401, "a"), (2402, "b")])
+    conn.execute(f"INSERT INTO getvehicles__p202506 VALUES ({'2402, 80' + (', 1' if extra_column else '')})")
+    conn.commit()
+    conn.close()
+    os.replace(tmp, path)
+
+
+def test_partitions_appear_once_under_their_view(tmp_path):
+    db = tmp_path / "v.db"
+    build(db)
+    catalog = SchemaCatalog(db)
+    assert catalog.table_names() == {"getvehicles", "bus_vid"}
+    assert catalog.get("getvehicles").row_count == 1
+    assert catalog.get("bus_vid").columns[0].pk and catalog.get("bus_vid").columns[0].samples == [2401, 2402]
+    assert sorted(catalog.hidden_tables()) == ["_partitions", "getvehicles__p202506", "getvehicles__p202507"]
+    assert is_partition(partition_name("getvehicles", "20250618")) and not is_partition("getvehicles")
+
+
+def test_catalog_is_rebuilt_when_the_file_changes(tmp_path):
+    db = tmp_path / "v.db"
+    build(db)
+    catalog = SchemaCatalog(db)
+    assert catalog.get("getvehicles").column_names == ["vid", "soc"]
+    build(db, extra_column=True)
+    assert catalog.get("getvehicles").column_names == ["vid", "soc", "odometer"]
+
+
+def test_row_counts_are_estimated_and_samples_read_only_the_first_rows(tmp_path):
+    db = tmp_path / "big.db"
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE pings (vid INTEGER, note TEXT)")
+        conn.executemany("INSERT INTO pings VALUES (?, ?)", [(i, None if i < 1500 else "late") for i in range(3000)])
+        conn.execute("CREATE TABLE stats (k TEXT PRIMARY KEY, v INTEGER) WITHOUT ROWID")
+        conn.executemany("INSERT INTO stats VALUES (?, ?)", [(f"k{i}", i) for i in range(40)])
+        conn.execute("CREATE VIEW recent AS SELECT * FROM pings WHERE vid >= 2000")
+    catalog = SchemaCatalog(db)
+    assert catalog.get("pings").row_count == 3000  # rowid range
+    assert catalog.get("stats").row_count == 40 and catalog.get("recent").row_count == 1000
+    assert catalog.get("pings").columns[1].samples == []  # only the first SAMPLE_SCAN_ROWS rows are read
+
+    with sqlite3.connect(db) as conn:
+        conn.execute("DELETE FROM pings WHERE vid < 1000")
+        conn.execute("ANALYZE")
+    assert SchemaCatalog(db).get("pings").row_count == 2000  # sqlite_stat1
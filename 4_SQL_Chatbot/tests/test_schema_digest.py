@@ -0,0 +1,52 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from schema_catalog import SchemaCatalog
+from schema_digest import build_digest, count_tool_calls, join_edges, schema_digest
+
+MEMORY = {
+    "trips": {"relationships": {"blocks": ["block_id"], "buses": ["vid → bus_id"]}},
+    "blocks": {"relationships": {"trips": ["block_id"], "ghosts": ["x"]}},
+}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "fleet.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE trips (trip_id TEXT, block_id TEXT, vid INTEGER)")
+        conn.execute("CREATE TABLE blocks (block_id TEXT, start_time TEXT)")
+        conn.execute("INSERT INTO trips VALUES ('t1', 'b1', 2402)")
+    return SchemaCatalog(path)
+
+
+def test_join_edges_are_deduplicated_and_use_both_key_names():
+    assert join_edges(MEMORY) == ["blocks.block_id = trips.block_id", "blocks.x = ghosts.x",
+                                  "buses.bus_id = trips.vid"]
+
+
+def test_digest_has_ddl_samples_and_only_joins_between_known_columns(catalog):
+    digest = build_digest(catalog.tables(), MEMORY)
+    assert "CREATE TABLE trips (trip_id TEXT, block_id TEXT, vid INTEGER); -- 1 rows" in digest
+    assert "vid=[2402]" in digest
+    assert "blocks.block_id = trips.block_id" in digest
+    assert "ghosts" not in digest and "buses" not in digest
+
+
+def test_digest_is_rebuilt_only_when_the_catalog_changes(catalog, tmp_path):
+    memory = tmp_path / "memory.json"
+    memory.write_text(json.dumps(MEMORY))
+    first = schema_digest(catalog, memory)
+    assert schema_digest(catalog, memory) is first
+    with sqlite3.connect(catalog.db_path) as conn:
+        conn.execute("CREATE TABLE buses (bus_id INTEGER)")
+        conn.execute("INSERT INTO buses VALUES (2402)")
+    assert "buses.bus_id = trips.vid" in schema_digest(catalog, memory)
+
+
+def test_count_tool_calls_separates_discovery_calls():
+    steps = [(SimpleNamespace(tool=t), "") for t in ("sql_db_list_tables", "sql_db_schema", "sql_db_query")]
+    assert count_tool_calls(steps) == (3, 2)
@@ -0,0 +1,64 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from shape_index import ShapeIndex, register_sql_functions
+
+
+@pytest.fixture
+def index():
+    # Two shapes: an east-west line on route 10 and a north-south line on route 20
+    lat = [41.80] * 20 + list(np.linspace(41.75, 41.85, 20))
+    lon = list(np.linspace(-87.70, -87.60, 20)) + [-87.55] * 20
+    along = list(np.arange(20) * 440.0) * 2
+    return ShapeIndex(["a"] * 20 + ["b"] * 20, [10] * 20 + [20] * 20, lat, lon, along)
+
+
+def test_nearest_finds_the_closest_shape(index):
+    assert index.nearest(41.801, -87.65).route_id == "10"
+    assert index.nearest(41.80, -87.551).route_id == "20"
+    assert index.nearest(42.5, -87.65) is None  # beyond MAX_SEARCH_M
+
+
+def test_grid_snap_agrees_with_a_full_scan(index):
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(41.74, 41.86, 300), rng.uniform(-87.72, -87.53, 300)
+    segs = np.arange(len(index.x1))
+    dist, along, shape = index.snap(segs, lat, lon)
+    for i in range(len(lat)):
+        x, y = index.project(lat[i], lon[i])
+        full, _ = index._project_onto(segs, float(x), float(y))
+        assert dist[i] == pytest.approx(full.min(), abs=1e-6)
+
+
+def test_sql_functions_are_not_deterministic(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    register_sql_functions(conn, tmp_path / "fleet.db")
+    conn.execute("CREATE TABLE pings (lat REAL, lon REAL)")
+    with pytest.raises(sqlite3.OperationalError, match="non-deterministic"):
+        conn.execute("CREATE INDEX pings_route ON pings (nearest_route(lat, lon))")
+
+
+def _gtfs_db(path, lon_of_b):
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE IF EXISTS gtfs_shape")
+        conn.execute("CREATE TABLE gtfs_shape (shape_id TEXT, route_id TEXT, latitude REAL, longitude REAL, "
+                     "distance REAL, sequence INTEGER)")
+        rows = [("a", "10", 41.80, lon, i * 440.0, i) for i, lon in enumerate(np.linspace(-87.70, -87.60, 20))]
+        rows += [("b", "20", lat, lon_of_b, i * 550.0, i) for i, lat in enumerate(np.linspace(41.75, 41.85, 20))]
+        conn.executemany("INSERT INTO gtfs_shape VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def test_sql_functions_answer_from_the_current_file(tmp_path):
+    path = tmp_path / "fleet.db"
+    _gtfs_db(path, -87.55)
+    conn = sqlite3.connect(":memory:")
+    register_sql_functions(conn, path)
+    route, off = conn.execute("SELECT nearest_route(41.80, -87.551), distance_to_route_m(41.80, -87.551, 20)").fetchone()
+    assert route == "20" and off == pytest.approx(83, abs=2)
+    assert conn.execute("SELECT distance_to_route_m(41.80, -87.551, 99)").fetchone() == (None,)
+    assert conn.execute("SELECT shape_progress_m(41.80, -87.65, 'a')").fetchone()[0] == pytest.approx(9.5 * 440)
+
+    _gtfs_db(path, -87.40)  # shape b moved away: the index is rebuilt
+    assert conn.execute("SELECT nearest_route(41.80, -87.551)").fetchone() == ("10",)
@@ -0,0 +1,51 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from timeseries import FLEET_TZ, bucket_seconds, epoch, register_timeseries_functions, time_bucket
+
+
+@pytest.fixture
+def conn():
+    db = sqlite3.connect(":memory:")
+    register_timeseries_functions(db)
+    db.execute("CREATE TABLE soc (vid INTEGER, ts, value REAL)")
+    # Out of order on purpose; bus 1 drains 90 → 70, charges to 80, drains to 60
+    db.executemany("INSERT INTO soc VALUES (?, ?, ?)", [
+        (1, 1750000000 + 3600, 70.0), (1, 1750000000, 90.0), (1, 1750000000 + 7200, 80.0),
+        (1, (1750000000 + 10800) * 1000, 60.0), (2, "2025-06-18 08:00:00", 50.0), (2, None, 99.0),
+    ])
+    return db
+
+
+def test_epoch_reads_seconds_milliseconds_and_local_text():
+    assert epoch(1750000000) == epoch(1750000000000) == 1750000000.0
+    local = datetime(2025, 6, 18, 8, 0, tzinfo=FLEET_TZ).timestamp()
+    assert epoch("2025-06-18 08:00:00") == epoch("20250618 08:00:00") == local
+    assert epoch("20250618") == datetime(2025, 6, 18, tzinfo=FLEET_TZ).timestamp()  # a date, not an epoch
+    assert epoch("1750000000") == 1750000000.0
+    assert epoch("not a time") is None and epoch(None) is None
+
+
+def test_bucket_widths_and_local_day_and_week_starts():
+    assert bucket_seconds("15 minutes") == 900 and bucket_seconds("2w") == 2 * 604800
+    with pytest.raises(ValueError):
+        bucket_seconds("fortnight")
+    assert time_bucket("2025-06-18 08:07:00", "15 minutes") == "2025-06-18 08:00"
+    assert time_bucket("2025-06-18 23:30:00", "1 day") == "2025-06-18 00:00"
+    assert time_bucket("20250618", "1 day") == "2025-06-18 00:00"
+    assert time_bucket("2025-06-18 08:00:00", "1 week") == "2025-06-16 00:00"  # a Monday
+
+
+def test_aggregates_follow_time_order_not_row_order(conn):
+    row = conn.execute("""
+        SELECT latest(value, ts), earliest(value, ts), delta(value, ts), total_drop(value, ts),
+               total_rise(value, ts), rate_per_hour(value, ts)
+        FROM soc WHERE vid = 1""").fetchone()
+    assert row == (60.0, 90.0, -30.0, 40.0, 10.0, -10.0)
+
+
+def test_null_timestamps_are_ignored_and_rates_handle_zero(conn):
+    assert conn.execute("SELECT latest(value, ts), rate_per_hour(value, ts) FROM soc WHERE vid = 2").fetchone() == (50.0, None)
+    assert conn.execute("SELECT rate(1, 0), rate(3, 2), sum_rate(value, NULL) FROM soc").fetchone() == (None, 1.5, None)
@@ -0,0 +1,59 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from tracing import SpanSink, Tracer, _tool_rows, stage_stats
+
+
+@pytest.fixture(params=["traces.db", "traces.jsonl"])
+def tracer(request, tmp_path):
+    return Tracer(SpanSink(tmp_path / request.param))
+
+
+def test_nested_spans_share_a_trace_and_record_errors(tracer):
+    with tracer.span("request", kind="request") as root:
+        with tracer.span("execute_sql", kind="sql") as child:
+            child.set(rows=12, backend="sqlite")
+        with pytest.raises(ValueError):
+            with tracer.span("evaluate", kind="llm"):
+                raise ValueError("boom")
+    spans = tracer.sink.load().set_index("name")
+    assert set(spans["trace_id"]) == {root.trace_id}
+    assert spans.loc["execute_sql", "parent_id"] == root.span_id
+    assert spans.loc["execute_sql", "rows"] == 12
+    assert spans.loc["evaluate", "error"] == "ValueError: boom"
+
+
+def test_graph_nodes_on_other_threads_attach_to_the_request(tracer):
+    def execute_sql(state):
+        return {"row_count": 3}
+
+    node = tracer.node("execute_sql", execute_sql)
+    with tracer.span("request", kind="request") as root:
+        parent = tracer.current()
+        worker = threading.Thread(target=node, args=({"trace_parent": parent},))
+        worker.start()
+        worker.join()
+    spans = tracer.sink.load().set_index("name")
+    assert spans.loc["execute_sql", "parent_id"] == root.span_id
+    assert spans.loc["execute_sql", "rows"] == 3
+
+
+def test_stage_stats_reports_percentiles_and_share():
+    spans = pd.DataFrame({
+        "kind": ["request", "request", "sql", "sql"],
+        "name": ["request", "request", "execute_sql", "execute_sql"],
+        "duration_ms": [100.0, 300.0, 50.0, 150.0],
+        "parent_id": [None, None, "r1", "r2"],
+    })
+    stats = stage_stats(spans).set_index("name")
+    assert stats.loc["execute_sql", "p50_ms"] == 100.0
+    assert stats.loc["execute_sql", "share"] == 0.5
+    assert stats.loc["request", "share"] == 1.0
+
+
+def test_tool_rows_counts_sql_tool_output():
+    assert _tool_rows("[(1, 'a'), (2, 'b')]") == 2
+    assert _tool_rows("[]") == 0
+    assert _tool_rows("Error: no such table") is None
@@ -0,0 +1,305 @@
+"""
+Time-series SQL functions for SOC / energy questions.
+
+"Latest value", "SOC used since ..." and "kWh per mile" questions otherwise
+turn into correlated subqueries or self-joins (quadratic without an index)
+or nested window queries. These single-pass user functions and aggregates
+replace them. Register them on every pooled connection:
+
+    add_connect_hook(register_timeseries_functions)
+
+Timestamps may be epoch seconds, epoch milliseconds, or text
+('2025-06-18 17:27:02', '20250618 17:27:02', '2025-06-18'). Text timestamps
+are read as fleet-local time (`FLEET_TZ`).
+
+    python timeseries.py vehicles.db          # benchmark vs. plain SQL
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+FLEET_TZ = ZoneInfo(os.getenv("FLEET_TZ", "America/Los_Angeles"))
+
+_UNITS = {"s": 1, "sec": 1, "second": 1, "m": 60, "min": 60, "minute": 60,
+          "h": 3600, "hour": 3600, "d": 86400, "day": 86400, "w": 604800, "week": 604800}
+_WIDTH = re.compile(r"^\s*(\d+(?:\.\d+)?)?\s*([a-z]+?)s?\s*$", re.I)
+_EPOCH = datetime(1970, 1, 1)
+_TEXT_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y%m%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y%m%d")
+
+
+@lru_cache(maxsize=4096)
+def _parse_text(text: str) -> Optional[float]:
+    text = text.strip()
+    if not (len(text) == 8 and text.isdigit()):  # '20250618' is a date (as an epoch it would be 1970)
+        try:
+            return float(text)
+        except ValueError:
+            pass
+    for fmt in _TEXT_FORMATS:
+        try:
+            return datetime.strptime(text[:19], fmt).replace(tzinfo=FLEET_TZ).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def epoch(ts) -> Optional[float]:
+    """Epoch seconds for an epoch (s or ms) or a text timestamp; None if unreadable."""
+    if ts is None:
+        return None
+    if isinstance(ts, (bytes, str)):
+        ts = _parse_text(ts.decode() if isinstance(ts, bytes) else ts)
+        if ts is None:
+            return None
+    return ts / 1000.0 if ts > 1e11 else float(ts)
+
+
+@lru_cache(maxsize=256)
+def bucket_seconds(width) -> int:
+    """900, '15 minutes', '1 hour', 'day', '2w' → width in seconds."""
+    if isinstance(width, (int, float)):
+        return int(width)
+    m = _WIDTH.match(str(width))
+    unit = _UNITS.get(m.group(2).lower()) if m else None
+    if unit is None:
+        raise ValueError(f"unknown time bucket width: {width!r}")
+    return int(float(m.group(1) or 1) * unit)
+
+
+@lru_cache(maxsize=65536)
+def _utc_offset(hour: int) -> float:
+    """Fleet-local UTC offset during the given UTC hour (DST changes on the hour)."""
+    return datetime.fromtimestamp(hour * 3600, FLEET_TZ).utcoffset().total_seconds()
+
+
+@lru_cache(maxsize=65536)
+def _label(local_seconds: float) -> str:
+    return (_EPOCH + timedelta(seconds=local_seconds)).strftime("%Y-%m-%d %H:%M")
+
+
+def time_bucket(ts, width) -> Optional[str]:
+    """Local start of the `width` bucket containing `ts`, as 'YYYY-MM-DD HH:MM'.
+
+    Day and week buckets start at local midnight (weeks on Monday), so they
+    line up with `stsd` dates.
+    """
+    seconds = epoch(ts)
+    if seconds is None:
+        return None
+    size = bucket_seconds(width)
+    local = seconds + _utc_offset(int(seconds // 3600))
+    if size % 86400 == 0:
+        day = int(local // 86400)
+        # 1970-01-01 was a Thursday: shift so weeks start on Monday
+        shift = 3 if size == 604800 else 0
+        return _label((day - (day + shift) % (size // 86400)) * 86400)
+    return _label(local // size * size)
+
+
+def rate(numerator, denominator) -> Optional[float]:
+    """numerator / denominator, NULL when either is NULL or the denominator is 0."""
+    if numerator is None or not denominator:
+        return None
+    return numerator / denominator
+
+
+class _Latest:
+    """latest(value, ts): value at the greatest ts (ties: last row seen)."""
+    __slots__ = ("ts", "value")
+    _newer = staticmethod(lambda t, best: t >= best)
+
+    def __init__(self):
+        self.ts = None
+        self.value = None
+
+    def step(self, value, ts):
+        t = epoch(ts)
+        if t is not None and value is not None and (self.ts is None or self._newer(t, self.ts)):
+            self.ts, self.value = t, value
+
+    def finalize(self):
+        return self.value
+
+
+class _Earliest(_Latest):
+    """earliest(value, ts): value at the smallest ts."""
+    __slots__ = ()
+    _newer = staticmethod(lambda t, best: t < best)
+
+
+class _Delta:
+    """delta(value, ts): latest value minus earliest value (e.g. SOC change)."""
+    __slots__ = ("first_ts", "first", "last_ts", "last")
+
+    def __init__(self):
+        self.first_ts = self.first = self.last_ts = self.last = None
+
+    def step(self, value, ts):
+        t = epoch(ts)
+        if t is None or value is None:
+            return
+        if self.first_ts is None or t < self.first_ts:
+            self.first_ts, self.first = t, value
+        if self.last_ts is None or t >= self.last_ts:
+            self.last_ts, self.last = t, value
+
+    def finalize(self):
+        return None if self.first is None else self.last - self.first
+
+
+class _RatePerHour(_Delta):
+    """rate_per_hour(value, ts): (latest - earliest) / hours between them."""
+    __slots__ = ()
+
+    def finalize(self):
+        if self.first is None or self.last_ts == self.first_ts:
+            return None
+        return (self.last - self.first) / ((self.last_ts - self.first_ts) / 3600.0)
+
+
+class _TotalDrop:
+    """total_drop(value, ts): sum of decreases between consecutive readings.
+
+    For SOC this is the charge used, ignoring any charging in between.
+    """
+    __slots__ = ("points", "sorted")
+    _sign = 1
+
+    def __init__(self):
+        self.points = []
+        self.sorted = True
+
+    def step(self, value, ts):
+        t = epoch(ts)
+        if t is None or value is None:
+            return
+        if self.points and t < self.points[-1][0]:
+            self.sorted = False
+        self.points.append((t, value))
+
+    def finalize(self):
+        if not self.points:
+            return None
+        if not self.sorted:
+            self.points.sort(key=lambda p: p[0])
+        total = 0.0
+        for (_, a), (_, b) in zip(self.points, self.points[1:]):
+            change = (a - b) * self._sign
+            if change > 0:
+                total += change
+        return total
+
+
+class _TotalRise(_TotalDrop):
+    """total_rise(value, ts): sum of increases between consecutive readings (charging)."""
+    __slots__ = ()
+    _sign = -1
+
+
+class _SumRate:
+    """sum_rate(numerator, denominator): SUM(num) / SUM(den) over rows where both are set."""
+    __slots__ = ("num", "den")
+
+    def __init__(self):
+        self.num = self.den = 0.0
+
+    def step(self, numerator, denominator):
+        if numerator is not None and denominator is not None:
+            self.num += numerator
+            self.den += denominator
+
+    def finalize(self):
+        return self.num / self.den if self.den else None
+
+
+def register_timeseries_functions(conn: sqlite3.Connection, db_path=None) -> None:
+    """Add epoch/time_bucket/rate and the latest/delta/... aggregates to `conn`."""
+    conn.create_function("epoch", 1, epoch, deterministic=True)
+    conn.create_function("time_bucket", 2, time_bucket, deterministic=True)
+    conn.create_function("rate", 2, rate, deterministic=True)
+    conn.create_aggregate("latest", 2, _Latest)
+    conn.create_aggregate("earliest", 2, _Earliest)
+    conn.create_aggregate("delta", 2, _Delta)
+    conn.create_aggregate("rate_per_hour", 2, _RatePerHour)
+    conn.create_aggregate("total_drop", 2, _TotalDrop)
+    conn.create_aggregate("total_rise", 2, _TotalRise)
+    conn.create_aggregate("sum_rate", 2, _SumRate)
+
+
+TIMESERIES_FUNCTIONS_DOC = """\
+Time-series SQL functions (ts = epoch seconds/ms or text timestamp; prefer them to self-joins and window subqueries):
+- latest(value, ts), earliest(value, ts) – value at the newest/oldest ts in the group, e.g. current SOC per bus:
+  SELECT bus_id, latest(current_soc, timestamp) FROM clever_pred GROUP BY bus_id
+- delta(value, ts) – newest minus oldest; rate_per_hour(value, ts) – that change per hour
+- total_drop(value, ts), total_rise(value, ts) – summed decreases/increases between consecutive readings (SOC used / charged)
+- sum_rate(num, den) – SUM(num)/SUM(den), e.g. sum_rate(energy_used, miles_driven) = kWh per mile
+- rate(a, b) – a/b, NULL when b is 0; time_bucket(ts, '15 minutes' | '1 hour' | '1 day' | '1 week') – local bucket start text; epoch(ts)"""
+
+
+BENCHMARKS = {
+    "latest SOC per bus": (
+        """SELECT vid, end_soc FROM trip_event_bustime t
+           WHERE start_timestamp = (SELECT MAX(start_timestamp) FROM trip_event_bustime WHERE vid = t.vid)""",
+        """SELECT vid, latest(end_soc, start_timestamp) FROM trip_event_bustime GROUP BY vid""",
+    ),
+    "SOC change per bus/day": (
+        """SELECT vid, stsd, MAX(CASE WHEN rn_desc = 1 THEN end_soc END) - MAX(CASE WHEN rn_asc = 1 THEN start_soc END)
+           FROM (SELECT vid, stsd, start_soc, end_soc,
+                        ROW_NUMBER() OVER (PARTITION BY vid, stsd ORDER BY start_timestamp) AS rn_asc,
+                        ROW_NUMBER() OVER (PARTITION BY vid, stsd ORDER BY start_timestamp DESC) AS rn_desc
+                 FROM trip_event_bustime) GROUP BY vid, stsd""",
+        """SELECT vid, stsd, latest(end_soc, start_timestamp) - earliest(start_soc, start_timestamp)
+           FROM trip_event_bustime GROUP BY vid, stsd""",
+    ),
+    "SOC used between trips": (
+        """SELECT a.vid, SUM(MAX(0, a.end_soc - (SELECT b.end_soc FROM trip_event_bustime b
+                 WHERE b.vid = a.vid AND b.start_timestamp > a.start_timestamp ORDER BY b.start_timestamp LIMIT 1)))
+           FROM trip_event_bustime a GROUP BY a.vid""",
+        """SELECT vid, total_drop(end_soc, start_timestamp) FROM trip_event_bustime GROUP BY vid""",
+    ),
+    "kWh/mile per route": (
+        """SELECT rt, SUM(energy_used) / NULLIF(SUM(miles_driven), 0) FROM trip_event_bustime
+           WHERE energy_used IS NOT NULL AND miles_driven IS NOT NULL GROUP BY rt""",
+        """SELECT rt, sum_rate(energy_used, miles_driven) FROM trip_event_bustime GROUP BY rt""",
+    ),
+    "trips per hour bucket": (
+        """SELECT strftime('%Y-%m-%d %H:00', start_timestamp, 'unixepoch', 'localtime') AS h, COUNT(*)
+           FROM trip_event_bustime GROUP BY h""",
+        """SELECT time_bucket(start_timestamp, '1 hour') AS h, COUNT(*) FROM trip_event_bustime GROUP BY h""",
+    ),
+}
+
+
+def bench(db_path, repeat: int = 3) -> None:
+    """Plain SQL vs. the registered functions on the same questions."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    register_timeseries_functions(conn)
+
+    def best(sql):
+        elapsed, rows = float("inf"), None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = conn.execute(sql).fetchall()
+            elapsed = min(elapsed, time.perf_counter() - start)
+        return elapsed, rows
+
+    print(f"{'pattern':24} {'plain SQL ms':>13} {'functions ms':>13} {'speed-up':>9}  rows")
+    for name, (plain, short) in BENCHMARKS.items():
+        (t_plain, r_plain), (t_short, r_short) = best(plain), best(short)
+        print(f"{name:24} {t_plain * 1000:13.1f} {t_short * 1000:13.1f} {t_plain / t_short:8.1f}x  "
+              f"{len(r_plain)}/{len(r_short)}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("db", nargs="?", default="vehicles.db")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    bench(args.db, args.repeat)
@@ -0,0 +1,306 @@
+"""
+Step tracing and latency profiling for the SQL chatbots.
+
+Every graph node, LLM call, tool call and SQL execution is recorded as a span
+(trace id, parent span, wall time, token counts, row count). Spans go to a
+local sink: SQLite by default (`traces.db`, WAL, one INSERT per span) or JSON
+lines if the path ends in `.jsonl`. `stage_stats` turns the spans into
+p50/p95 per stage for the trace dashboard page.
+
+    tracer = get_tracer()
+    with tracer.span("request", kind="request"):
+        with tracer.span("execute_sql", kind="sql") as s:
+            ...
+            s.set(rows=len(df))
+"""
+import contextvars
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+try:  # LangChain is only needed for the agent callback handler
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:  # pragma: no cover
+    BaseCallbackHandler = object
+
+TRACE_PATH = os.getenv("TRACE_PATH", "traces.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spans (
+    span_id           TEXT PRIMARY KEY,
+    trace_id          TEXT NOT NULL,
+    parent_id         TEXT,
+    name              TEXT NOT NULL,
+    kind              TEXT NOT NULL,
+    start_ts          REAL NOT NULL,
+    duration_ms       REAL NOT NULL,
+    prompt_tokens     INTEGER,
+    completion_tokens INTEGER,
+    rows              INTEGER,
+    error             TEXT,
+    attrs             TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_spans_trace ON spans (trace_id);
+CREATE INDEX IF NOT EXISTS ix_spans_start ON spans (start_ts);
+"""
+_COLUMNS = ("span_id", "trace_id", "parent_id", "name", "kind", "start_ts", "duration_ms",
+            "prompt_tokens", "completion_tokens", "rows", "error", "attrs")
+
+# (trace_id, span_id) of the span that is open in the current context
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=_new_id)
+    start_ts: float = field(default_factory=time.time)
+    duration_ms: float = 0.0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    rows: Optional[int] = None
+    error: Optional[str] = None
+    attrs: dict = field(default_factory=dict)
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set(self, **values: Any) -> "Span":
+        """Set tokens/rows/error; anything else goes into `attrs`."""
+        for key, value in values.items():
+            if key in ("prompt_tokens", "completion_tokens", "rows", "error"):
+                setattr(self, key, value)
+            else:
+                self.attrs[key] = value
+        return self
+
+    def record_usage(self, response) -> "Span":
+        """Token counts from an OpenAI chat completion response."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.set(prompt_tokens=getattr(usage, "prompt_tokens", None),
+                     completion_tokens=getattr(usage, "completion_tokens", None))
+        return self
+
+    def row(self) -> tuple:
+        data = asdict(self)
+        data["attrs"] = json.dumps(self.attrs, default=str) if self.attrs else None
+        return tuple(data[c] for c in _COLUMNS)
+
+
+class SpanSink:
+    """Append-only span store: SQLite (default) or JSON lines (`*.jsonl`)."""
+
+    def __init__(self, path=TRACE_PATH):
+        self.path = Path(path)
+        self.jsonl = self.path.suffix == ".jsonl"
+        self._lock = threading.Lock()
+        self._conn = None
+        if not self.jsonl:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def write(self, span: Span) -> None:
+        row = span.row()
+        with self._lock:
+            if self.jsonl:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(dict(zip(_COLUMNS, row))) + "\n")
+                return
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO spans ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    row,
+                )
+
+    def load(self, since: Optional[float] = None) -> pd.DataFrame:
+        """All spans (started after `since` if given) as a DataFrame."""
+        if self.jsonl:
+            if not self.path.exists():
+                return pd.DataFrame(columns=_COLUMNS)
+            df = pd.read_json(self.path, lines=True)
+            if df.empty:
+                return pd.DataFrame(columns=_COLUMNS)
+            return df[df["start_ts"] >= since] if since else df
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT * FROM spans WHERE start_ts >= ? ORDER BY start_ts", self._conn, params=(since or 0,)
+            )
+
+
+class Tracer:
+    """Creates nested spans and writes each one to the sink when it ends."""
+
+    def __init__(self, sink: SpanSink):
+        self.sink = sink
+
+    def start(self, name: str, kind: str = "stage", parent: Optional[Span] = None, **attrs: Any) -> Span:
+        """Open a span explicitly (for callbacks); close it with `finish`."""
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = _CURRENT.get() or (_new_id(), None)
+        return Span(name=name, kind=kind, trace_id=trace_id, parent_id=parent_id, attrs=dict(attrs))
+
+    def finish(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.duration_ms = (time.perf_counter() - span._t0) * 1000
+        if error is not None and span.error is None:
+            span.error = f"{type(error).__name__}: {error}"
+        try:
+            self.sink.write(span)
+        except Exception:
+            pass  # tracing must never break a request
+
+    @contextmanager
+    def span(self, name: str, kind: str = "stage", **attrs: Any):
+        span = self.start(name, kind, **attrs)
+        token = _CURRENT.set((span.trace_id, span.span_id))
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, e)
+            raise
+        else:
+            self.finish(span)
+        finally:
+            _CURRENT.reset(token)
+
+    def node(self, name: str, fn):
+        """Wrap a LangGraph node; rows come from the `row_count` it returns, if any.
+
+        Nodes may run on executor threads that do not inherit the caller's
+        context, so the request span can also be passed in `state["trace_parent"]`.
+        """
+        @functools.wraps(fn)
+        def wrapper(state, *args, **kwargs):
+            parent = state.get("trace_parent") if _CURRENT.get() is None else None
+            token = _CURRENT.set(tuple(parent)) if parent else None
+            try:
+                with self.span(name, kind="node") as span:
+                    out = fn(state, *args, **kwargs)
+                    if isinstance(out, dict):
+                        if out.get("row_count") is not None:
+                            span.set(rows=out["row_count"])
+                        if out.get("has_error"):
+                            span.set(error=str(out.get("sql_result", "error"))[:500])
+                    return out
+            finally:
+                if token is not None:
+                    _CURRENT.reset(token)
+        return wrapper
+
+    def current(self) -> Optional[tuple]:
+        """(trace_id, span_id) of the open span, for handing to another thread."""
+        return _CURRENT.get()
+
+
+def _tool_rows(output: Any) -> Optional[int]:
+    """Row count of an SQLDatabase.run() result string such as "[(1, 'a'), (2, 'b')]"."""
+    text = str(output).strip()
+    if text == "[]" or not text:
+        return 0
+    if text.startswith("[(") and text.endswith(")]"):
+        return text.count("), (") + 1
+    return None
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """LangChain callback that records LLM and tool calls as child spans of `parent`."""
+
+    def __init__(self, tracer: Tracer, parent: Optional[Span] = None):
+        self.tracer = tracer
+        self.parent = parent
+        self._open: dict = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, name: str, kind: str, **attrs: Any) -> None:
+        span = self.tracer.start(name, kind, parent=self.parent, **attrs)
+        with self._lock:
+            self._open[run_id] = span
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **values: Any) -> None:
+        with self._lock:
+            span = self._open.pop(run_id, None)
+        if span is not None:
+            span.set(**{k: v for k, v in values.items() if v is not None})
+            self.tracer.finish(span, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> None:
+        self._start(run_id, "llm", "llm")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs: Any) -> None:
+        self._start(run_id, "llm", "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if not usage:
+            for gens in response.generations:
+                for gen in gens:
+                    meta = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                    prompt, completion = meta.get("input_tokens", prompt), meta.get("output_tokens", completion)
+        self._end(run_id, prompt_tokens=prompt, completion_tokens=completion)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str: str, *, run_id, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start(run_id, name, "sql" if name == "sql_db_query" else "tool", input=str(input_str)[:500])
+
+    def on_tool_end(self, output: Any, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, rows=_tool_rows(getattr(output, "content", output)))
+
+    def on_tool_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+
+def stage_stats(spans: pd.DataFrame) -> pd.DataFrame:
+    """p50/p95/mean wall time per (kind, name), plus its share of all request time."""
+    if spans.empty:
+        return pd.DataFrame(columns=["kind", "name", "count", "p50_ms", "p95_ms", "mean_ms", "share"])
+    grouped = spans.groupby(["kind", "name"])["duration_ms"]
+    stats = pd.DataFrame({
+        "count": grouped.size(),
+        "p50_ms": grouped.quantile(0.5),
+        "p95_ms": grouped.quantile(0.95),
+        "mean_ms": grouped.mean(),
+        "total_ms": grouped.sum(),
+    }).reset_index()
+    roots = spans.loc[spans["parent_id"].isna(), "duration_ms"].sum()
+    stats["share"] = stats["total_ms"] / roots if roots else 0.0
+    stats.loc[stats["kind"] == "request", "share"] = 1.0
+    stats[["p50_ms", "p95_ms", "mean_ms"]] = stats[["p50_ms", "p95_ms", "mean_ms"]].round(1)
+    stats["share"] = stats["share"].round(3)
+    return stats.drop(columns="total_ms").sort_values("p95_ms", ascending=False)
+
+
+_TRACERS: dict = {}
+_TRACERS_LOCK = threading.Lock()
+
+
+def get_tracer(path=TRACE_PATH) -> Tracer:
+    """Return the process-wide tracer for the sink at `path`."""
+    key = str(Path(path).resolve())
+    with _TRACERS_LOCK:
+        tracer = _TRACERS.get(key)
+        if tracer is None:
+            tracer = _TRACERS[key] = Tracer(SpanSink(key))
+        return tracer
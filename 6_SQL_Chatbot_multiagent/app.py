@@ -1,18 +1,32 @@
 import streamlit as st
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, Optional, Any, Dict
+from typing import Annotated, TypedDict, Optional, Any, Dict
 from openai import OpenAI
 from pathlib import Path
 import json
 import os
-import sqlite3
 import logging
+import operator
 import pandas as pd
 import csv
 import pathlib
 import datetime as dt
-import functools
-from shapely.geometry import Point, Polygon
+import uuid
+from result_cache import Timer, conversation_key, get_result_cache, render_cache_stats
+from result_engine import run_query
+from analytics_backend import get_router
+from query_guard import QueryRejected, check_query, time_budget
+from db_pool import add_connect_hook, get_pool
+from schema_catalog import get_catalog
+from schema_retriever import get_retriever, openai_embedder, table_documents
+from prompt_builder import PromptBuilder
+from tracing import get_tracer
+from pipeline_graph import build_graph
+from sql_templates import get_template_store, schema_key
+from sql_repair import clean_sql, local_fix, repair_messages
+from result_digest import cap, digest
+from geofence import load_yards
+from shape_index import SQL_FUNCTIONS_DOC, register_sql_functions
+from timeseries import TIMESERIES_FUNCTIONS_DOC, register_timeseries_functions
 
 # ---------- 1. Define State and Constants ----------
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -20,20 +34,17 @@ MAX_RETRIES = 3
 LOG_PATH = os.getenv("STEP_LOG", "query_log.csv")
 MAX_DISPLAY_ROWS = 20
 MAX_PREVIEW_ROWS = 20
-
-# Define bus yard polygon from provided GPS points
-yard_coords = [
-    (33.90569271628536, -118.31175238807698),
-    (33.90567242912735, -118.31055159492222),
-    (33.90498900267104, -118.30926830452778),
-    (33.90410954017733, -118.30927448909796),
-    (33.90370429579649, -118.30925946566806),
-    (33.90372299942574, -118.31049389062383),
-    (33.903750015771855, -118.3114203353168),
-    (33.90465609749877, -118.31141532750766),
-    (33.90560581044806, -118.31155554617293)
-]
-YARD_POLYGON = Polygon(yard_coords)
+MAX_FETCH_ROWS = int(os.getenv("MAX_FETCH_ROWS", "5000"))  # rows held in memory per query
+QUERY_TIME_BUDGET = float(os.getenv("QUERY_TIME_BUDGET", "15"))  # seconds per query
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "4"))  # tables whose DDL goes into the SQL prompt
+PARALLEL_GRAPH = os.getenv("PARALLEL_GRAPH", "1") != "0"  # fan out independent nodes
+EVAL_DIGEST_CHARS = int(os.getenv("EVAL_DIGEST_CHARS", "4000"))  # result text in the evaluation prompt
+SKIP_EVAL_FOR_TABLES = os.getenv("SKIP_EVAL_FOR_TABLES", "1") != "0"  # "show/list ..." gets the table only
+TRACER = get_tracer()  # spans per node / LLM call / SQL execution → traces.db
+SQL_TEMPLATES = get_template_store()  # question shape → validated SQL, learned in log_step
+
+# Bus yards/depots (main yard + any in yards.json), tested vectorized per result set
+YARDS = load_yards()
 
 class AgentState(TypedDict, total=False):
     user_query: str
@@ -45,7 +56,17 @@ class AgentState(TypedDict, total=False):
     schema: dict
     candidate_tables: list[str]
     df_raw: pd.DataFrame
+    row_count: int
+    row_count_exact: bool  # False when counting hit the time budget (row_count is a lower bound)
+    result_path: Optional[str]
     skip_sql_generation: bool
+    sql_template: Optional[str]  # shape of the stored template the SQL came from
+    has_error: bool
+    retry_count: int
+    route: Optional[str]  # "repair_sql" / "sql_generator" after a failure
+    skip_eval: bool
+    trace_parent: tuple
+    steps: Annotated[list[str], operator.add]  # nodes run so far; lets branches run in parallel
 
 FEW_SHOTS = [
     ("How many records were loaded today?", "current"),
@@ -72,7 +93,18 @@ BUSINESS_RULES = read_md("business_rules.md")
 EXAMPLES = read_md("examples.md")
 
 MEMORY = json.loads(Path("prompts/structured_memory.json").read_text())
+
+# Rules for the SQL generator, trimmed per question to PROMPT_TOKEN_BUDGET
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+SQL_RULES = PromptBuilder(
+    "prompts",
+    budget=PROMPT_TOKEN_BUDGET,
+    pinned=("global_rules.txt",),
+    include=["global_rules.txt", "table_selection_heuristics.md", "join_keys.md", "query_selection.md", "value_recency_policy.md"],
+)
 DEFAULT_DB_PATH = os.getenv("SQLITE_DB_PATH", "vehicle.db")
+add_connect_hook(register_sql_functions)  # nearest_route(), distance_to_route_m(), ... on every pooled connection
+add_connect_hook(register_timeseries_functions)  # latest(), delta(), total_drop(), time_bucket(), ...
 
 if not logging.getLogger("sql_graph").handlers:
     logging.basicConfig(
@@ -84,39 +116,21 @@ lg = logging.getLogger("sql_graph")
 
 # ---------- 3. Pipeline Nodes ----------
 
-@functools.lru_cache(maxsize=4)
-def _load_schema(db_path: str) -> dict:
-    with sqlite3.connect(db_path) as conn:
-        tables = conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
-        ).fetchall()
-        schema = {}
-        for (tbl,) in tables:
-            cols = [r[1] for r in conn.execute(f"PRAGMA table_info({tbl})")]
-            schema[tbl] = cols
-    return schema
-
 def schema_loader(state: AgentState) -> dict:
     db_path = state.get("db_path", DEFAULT_DB_PATH)
     if not db_path or not os.path.isfile(db_path):
         lg.error(f"Database file not found: {db_path}")
         return {"schema": {}}
-    schema = _load_schema(db_path)
+    schema = get_catalog(db_path).columns()
     return {"schema": schema}
 
 def table_selector_agent(state: AgentState) -> dict:
-    q_words = set(state["user_query"].lower().split())
-    hits = []
-    for tbl, cols in state["schema"].items():
-        score = 0
-        if tbl.lower() in q_words:
-            score += 3
-        score += sum(col.lower() in q_words for col in cols)
-        if score:
-            hits.append((score, tbl))
-    hits.sort(reverse=True)
-    cand = [tbl for _, tbl in hits[:5]] or list(state["schema"].keys())[:3]
-    return {"candidate_tables": cand}
+    schema = state["schema"]
+    if not schema:
+        return {"candidate_tables": []}
+    docs = table_documents(TABLE_DEFS, MEMORY, schema)
+    retriever = get_retriever(docs, openai_embedder(client))
+    return {"candidate_tables": retriever.top_k(state["user_query"], SCHEMA_TOP_K)}
 
 def handle_metadata_query(state: AgentState) -> dict:
     query_lower = state["user_query"].lower()
@@ -135,24 +149,43 @@ def handle_metadata_query(state: AgentState) -> dict:
 def generate_sql(state: AgentState) -> AgentState:
     if state.get("skip_sql_generation", False):
         return {}
-    table_hint = ", ".join(state.get("candidate_tables", [])) or "ALL"
-    schema_json = json.dumps(state.get("schema", {}), indent=2)[:4000]
+    key = schema_key(state.get("schema", {}))
+    if state.get("retry_count", 0) == 0:
+        with TRACER.span("sql_template.lookup", kind="cache") as span:
+            template = SQL_TEMPLATES.lookup(state["user_query"], key)
+            span.set(hit=template is not None)
+        if template is not None:
+            lg.info(f"generate_sql: template hit for '{template.shape}'")
+            return {"sql_query": template.sql, "sql_template": template.shape}
+    elif state.get("sql_template"):
+        SQL_TEMPLATES.forget(state["sql_template"])  # the stored SQL failed here; relearn it
+    candidates = state.get("candidate_tables", [])
+    table_hint = ", ".join(candidates) or "ALL"
+    catalog = get_catalog(state.get("db_path", DEFAULT_DB_PATH)) if candidates else None
+    schema_ddl = "\n".join(catalog.get(t).ddl() for t in candidates if catalog.get(t)) if catalog else ""
     scope = state.get("data_scope", "unknown")
+    all_columns = {c for cols in state.get("schema", {}).values() for c in cols}  # get_catalog(...).columns()
+    date_epochs = [c for c in ("stsd_epoch", "date_epoch") if c in all_columns]  # only in DBs built by ingest.py
+    date_rule = ("" if date_epochs else
+                 " The stsd and date columns are 'YYYY-MM-DD' text; compare them as text, e.g. stsd < date('now', 'localtime').")
     scope_rules = {
-        "historical": "Add a WHERE clause with tmstmp < CURRENT_DATE for historical data.",
-        "current": "Filter for tmstmp >= CURRENT_TIMESTAMP for current data.",
+        "historical": f"Filter on the integer epoch columns ({', '.join(['timestamp', 'start_timestamp', *date_epochs])}), "
+                      "e.g. start_timestamp < CAST(strftime('%s', 'now', 'start of day') AS INTEGER); never compare tmstmp text."
+                      + date_rule,
+        "current": "Filter on the integer epoch timestamp column, e.g. timestamp >= CAST(strftime('%s', 'now', '-1 hour') AS INTEGER).",
         "future": "Use prediction functions or join with prediction_models table for future values."
     }
     system_prompt = (
-        f"{GLOBAL_RULES}\n\n"
+        "## Rules\n"
+        f"{SQL_RULES.build(state['user_query'])}\n\n"
         "## Scope Rules\n"
         f"{scope_rules.get(scope, '')}\n"
-        "## Table Selection & Query Construction Rules\n"
-        f"{TABLE_SELECTION}\n{JOIN_KEYS}\n{QUERY_SELECTION}\n{RECENCY_POLICY}\n\n"
         "## Candidate Tables\n"
         f"{table_hint}\n\n"
-        "## Schema JSON\n"
-        f"{schema_json}\n\n"
+        "## Schema (candidate tables only)\n"
+        f"{schema_ddl}\n\n"
+        f"{SQL_FUNCTIONS_DOC}\n\n"
+        f"{TIMESERIES_FUNCTIONS_DOC}\n\n"
         "You are an autonomous SQLite query planner. For queries about database metadata (e.g., listing tables), use `sqlite_master`. "
         "For descriptive queries about a table's purpose, return a brief summary based on its name and columns, not SQL. "
         "For queries involving GPS positions, location, yard, points, or buses, include lat and lon columns if available. "
@@ -163,20 +196,22 @@ def generate_sql(state: AgentState) -> AgentState:
         "Write a valid SQLite query or a brief summary if the query asks for a table's purpose."
     )
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.7,
-            response_format={"type": "text"}
-        )
+        with TRACER.span("llm.generate_sql", kind="llm") as span:
+            response = client.chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.7,
+                response_format={"type": "text"}
+            )
+            span.record_usage(response)
         output = response.choices[0].message.content.strip()
         output = output.split("Action Input:")[-1].strip() if "Action Input:" in output else output
         output = output.split("```sql")[-1].strip().split("```")[0].strip() if "```sql" in output else output
         if "Action: sql_db_list_tables" in output:
-            output = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
+            output = "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' AND name NOT GLOB '*__p[0-9n]*' AND name != '_partitions';"
         elif any(kw in state["user_query"].lower() for kw in ["what does", "summarize", "describe"]):
             return {"sql_result": output, "skip_sql_generation": True}
         return {"sql_query": output}
@@ -190,12 +225,23 @@ def validate_sql(state: AgentState) -> Dict[str, Any]:
     sql = state.get("sql_query", "")
     if not sql:
         return {"sql_result": "[SQL ERROR] No query provided", "has_error": True}
+    db_path = state.get("db_path", DEFAULT_DB_PATH)
+    if not os.path.isfile(db_path):
+        return {"sql_result": f"[SQL ERROR] file not found → {db_path}", "has_error": True}
     try:
-        with sqlite3.connect(":memory:") as mem:
-            mem.execute(f"EXPLAIN {sql}")
-        return {}
+        with get_pool(db_path).connection() as conn:
+            report = check_query(conn, sql, MAX_FETCH_ROWS)
+    except QueryRejected as e:
+        return {"sql_result": f"[SQL ERROR] {e}", "has_error": True}
     except Exception as e:
         return {"sql_result": f"[SQL ERROR] {e}", "has_error": True}
+    for warning in report.warnings:
+        lg.warning(f"validate_sql: {warning} – {sql}")
+    return {"sql_query": report.sql} if report.sql != sql else {}
+
+def _run_on_sqlite(db_path: str, sql: str):
+    with get_pool(db_path).connection() as conn, time_budget(conn, QUERY_TIME_BUDGET):
+        return run_query(conn, sql, MAX_FETCH_ROWS)
 
 def execute_sql(state: AgentState) -> Dict[str, Any]:
     if state.get("skip_sql_generation", False):
@@ -207,8 +253,23 @@ def execute_sql(state: AgentState) -> Dict[str, Any]:
     if not os.path.isfile(db_path):
         return {"sql_result": f"[SQL ERROR] file not found → {db_path}", "has_error": True}
     try:
-        with sqlite3.connect(db_path) as conn:
-            result_df = pd.read_sql_query(sql, conn)
+        cache = get_result_cache(db_path)
+        with TRACER.span("sqlite.run_query", kind="sql") as span:
+            result = cache.get_result(sql)
+            span.set(cached=result is not None)
+            if result is None:
+                with Timer() as t:
+                    backend, result = get_router(db_path).run(
+                        sql,
+                        columnar=lambda conn: run_query(conn, sql, MAX_FETCH_ROWS),
+                        row_store=lambda: _run_on_sqlite(db_path, sql),
+                        timeout=QUERY_TIME_BUDGET,
+                    )
+                if result.count_exact:
+                    cache.put_result(sql, result, t.elapsed)
+                span.set(backend=backend)
+            span.set(rows=result.row_count)
+        result_df = result.df.copy()
         if "lat" in result_df.columns and "lon" in result_df.columns:
             result_df = result_df.rename(columns={"lat": "latitude", "lon": "longitude"})
         elif "latitude" in result_df.columns and "longitude" in result_df.columns:
@@ -217,11 +278,14 @@ def execute_sql(state: AgentState) -> Dict[str, Any]:
             preview_df = result_df.head(MAX_DISPLAY_ROWS)
         preview_df = result_df.head(MAX_DISPLAY_ROWS)
         markdown_preview = preview_df.to_markdown(index=False)
-        if len(result_df) > MAX_DISPLAY_ROWS:
-            markdown_preview += f"\n\n… {len(result_df)-MAX_DISPLAY_ROWS} more rows truncated …"
+        if not result.count_exact:
+            markdown_preview += f"\n\n… at least {result.row_count-MAX_DISPLAY_ROWS} more rows (counting stopped at the time budget) …"
+        elif result.row_count > MAX_DISPLAY_ROWS:
+            markdown_preview += f"\n\n… {result.row_count-MAX_DISPLAY_ROWS} more rows truncated …"
     except Exception as e:
         return {"sql_result": f"[SQL ERROR] {e}", "has_error": True}
-    return {"sql_result": markdown_preview, "df_raw": result_df}
+    return {"sql_result": markdown_preview, "df_raw": result_df, "row_count": result.row_count,
+            "row_count_exact": result.count_exact, "result_path": result.spill_path}
 
 def yard_location_checker(state: AgentState) -> Dict[str, Any]:
     if state.get("skip_sql_generation", False):
@@ -239,11 +303,7 @@ def yard_location_checker(state: AgentState) -> Dict[str, Any]:
         lg.info(f"yard_location_checker: Adding location_status for query '{state['user_query']}'")
         if "lat" in df_raw.columns and "lon" in df_raw.columns and "latitude" not in df_raw.columns:
             df_raw = df_raw.rename(columns={"lat": "latitude", "lon": "longitude"})
-        df_raw["location_status"] = df_raw.apply(
-            lambda row: "inside_yard" if Point(row["longitude"], row["latitude"]).within(YARD_POLYGON) else "in-transit",
-            axis=1
-        )
-        return {"df_raw": df_raw}
+        return {"df_raw": YARDS.annotate(df_raw)}
     lg.debug(f"yard_location_checker: Skipping location_status for query '{state['user_query']}'")
     return {}
 
@@ -267,7 +327,7 @@ def error_handler(state: AgentState) -> Dict[str, Any]:
     err = state.get("has_error", False) or str(msg).startswith(("[SQL ERROR]", "[FORMAT ERROR]", "[LLM ERROR]"))
     tries = state.get("retry_count", 0)
     if not err:
-        return {}
+        return {"route": None}
     lg.error(f"Failed query: {state.get('sql_query', 'N/A')}, Error: {msg}")
     if tries >= MAX_RETRIES:
         query_lower = state.get("user_query", "").lower()
@@ -281,12 +341,40 @@ def error_handler(state: AgentState) -> Dict[str, Any]:
         else:
             friendly = "I couldn’t execute a valid SQL query for your request. Please rephrase or check table/column names."
         return {"evaluation": friendly, "skip_eval": True}
+    # SQL that failed with an error gets repaired; anything else is regenerated
+    repairable = state.get("sql_query") and str(msg).startswith("[SQL ERROR]")
     return {
         "retry_count": tries + 1,
-        "route": "sql_generator",
+        "route": "repair_sql" if repairable else "sql_generator",
         "has_error": False
     }
 
+def repair_sql(state: AgentState) -> Dict[str, Any]:
+    sql = state.get("sql_query", "")
+    error = str(state.get("sql_result", "")).removeprefix("[SQL ERROR]").strip()
+    db_path = state.get("db_path", DEFAULT_DB_PATH)
+    catalog = get_catalog(db_path)
+    if state.get("sql_template"):
+        SQL_TEMPLATES.forget(state["sql_template"])
+    with TRACER.span("sql.repair", kind="repair") as span, get_pool(db_path).connection() as conn:
+        repair = local_fix(sql, error, catalog, lambda q: conn.execute(f"EXPLAIN {q}"))
+        span.set(method="local" if repair else "llm", fixes="; ".join(repair.notes) if repair else "")
+    if repair is not None:
+        lg.info(f"repair_sql: fixed locally ({'; '.join(repair.notes)})")
+        return {"sql_query": repair.sql, "sql_template": None}
+    try:
+        with TRACER.span("llm.repair_sql", kind="llm") as span:
+            response = client.chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=repair_messages(sql, error, catalog),
+                temperature=0,
+            )
+            span.record_usage(response)
+        return {"sql_query": clean_sql(response.choices[0].message.content), "sql_template": None}
+    except Exception as e:
+        lg.error(f"repair_sql: LLM repair failed ({e}), regenerating")
+        return generate_sql(state)
+
 def format_result_table(state: AgentState) -> dict:
     query_lower = state.get("user_query", "").lower()
     raw = state.get("sql_result")
@@ -339,7 +427,24 @@ def scope_detector(state: AgentState) -> dict:
     filtered_schema = {k: v for k, v in schema.items() if k in scope_tables[state["data_scope"]]}
     return {"schema": filtered_schema, "data_scope": state["data_scope"]}
 
+def is_table_request(query: str) -> bool:
+    """'show/list/get ...' with no ask for analysis: the table is the answer."""
+    q = query.lower().strip()
+    return q.startswith(("show", "list", "display", "give me", "get ", "fetch", "pull", "export", "print")) and not any(
+        kw in q for kw in ["why", "trend", "compare", "explain", "insight", "analy", "summar", "recommend", "should",
+                           "anomal", "unusual", "pattern", "change", "issue", "problem", "best", "worst"]
+    )
+
 def evaluate_result(state: AgentState) -> AgentState:
+    if SKIP_EVAL_FOR_TABLES and is_table_request(state["user_query"]):
+        return {"evaluation": ""}
+    df_raw = state.get("df_raw")
+    if isinstance(df_raw, pd.DataFrame) and not str(state.get("sql_result", "")).startswith("[SQL ERROR]"):
+        result_text = digest(df_raw, state.get("row_count"), max_chars=EVAL_DIGEST_CHARS)
+        if state.get("row_count_exact") is False:
+            result_text = "The query hit its time budget while counting, so the row count is a lower bound.\n" + result_text
+    else:
+        result_text = cap(state.get("sql_result", ""), EVAL_DIGEST_CHARS)
     scope = state.get("data_scope", "unknown")
     scope_context = {
         "historical": "Analyze historical trends based on the data.",
@@ -356,18 +461,20 @@ def evaluate_result(state: AgentState) -> AgentState:
     )
     user_prompt = (
         f"User question: {state['user_query']}\n\n"
-        f"SQL result:\n{state['sql_result']}\n\n"
+        f"SQL result:\n{result_text}\n\n"
         "Answer the user, applying the business rules where relevant."
     )
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.7,
-        )
+        with TRACER.span("llm.evaluate_result", kind="llm", result_chars=len(result_text)) as span:
+            resp = client.chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.7,
+            )
+            span.record_usage(resp)
         return {"evaluation": resp.choices[0].message.content.strip()}
     except Exception as e:
         lg.error(f"Evaluation error: {e}")
@@ -378,7 +485,7 @@ def log_step(state: AgentState) -> Dict[str, Any]:
         "ts": dt.datetime.utcnow().isoformat(),
         "user_query": state["user_query"],
         "sql": state.get("sql_query", ""),
-        "row_count": getattr(state.get("df_raw"), "shape", [0])[0] if isinstance(state.get("df_raw"), pd.DataFrame) else None,
+        "row_count": state.get("row_count", len(state["df_raw"]) if isinstance(state.get("df_raw"), pd.DataFrame) else None),
         "retry": state.get("retry_count", 0),
     }
     try:
@@ -390,63 +497,48 @@ def log_step(state: AgentState) -> Dict[str, Any]:
             w.writerow(row)
     except Exception as e:
         lg.error(f"Logging error: {e}")
+    succeeded = (
+        row["sql"] and row["row_count"] and not state.get("has_error")
+        and not str(state.get("sql_result", "")).startswith("[SQL ERROR]")
+    )
+    if succeeded and not (state.get("sql_template") and row["retry"] == 0):
+        SQL_TEMPLATES.learn(state["user_query"], row["sql"], schema_key(state.get("schema", {})))
     return {}
 
 def format_router(state: AgentState) -> str:
     query = state["user_query"].lower()
     if any(kw in query for kw in ["show", "list", "table", "rows", "columns", "select", "compare", "top", "group by", "gps_position", "location", "yard", "position", "gps", "points", "gps points", "buses"]):
-        return "format_result_table"
-    return "log_step"
-
-# ---------- 4. Graph Definition ----------
+        return "format"
+    return "answer"
 
-builder = StateGraph(AgentState)
-builder.add_node("schema_loader", schema_loader)
-builder.add_node("scope_detector", scope_detector)
-builder.add_node("table_selector", table_selector_agent)
-builder.add_node("metadata_handler", handle_metadata_query)
-builder.add_node("sql_generator", generate_sql)
-builder.add_node("validate_sql", validate_sql)
-builder.add_node("execute_sql", execute_sql)
-builder.add_node("yard_location_checker", yard_location_checker)
-builder.add_node("result_sampler", result_sampler)
-builder.add_node("error_handler", error_handler)
-builder.add_node("format_result_table", format_result_table)
-builder.add_node("log_step", log_step)
-builder.add_node("evaluate_result", evaluate_result)
-builder.set_entry_point("schema_loader")
-builder.add_edge("schema_loader", "scope_detector")
-builder.add_edge("scope_detector", "table_selector")
-builder.add_edge("table_selector", "metadata_handler")
-builder.add_conditional_edges(
-    "metadata_handler",
-    lambda state: "format_result_table" if state.get("skip_sql_generation") else "sql_generator",
-    {"format_result_table": "format_result_table", "sql_generator": "sql_generator"}
-)
-builder.add_edge("sql_generator", "validate_sql")
-builder.add_edge("validate_sql", "execute_sql")
-builder.add_edge("execute_sql", "yard_location_checker")
-builder.add_edge("yard_location_checker", "result_sampler")
-builder.add_edge("result_sampler", "error_handler")
 def post_error_router(state: AgentState) -> str:
+    if state.get("route") == "repair_sql":
+        return "repair"
     if state.get("route") == "sql_generator":
-        return "sql_generator"
+        return "retry"
     if state.get("skip_eval"):
-        return "log_step"
+        return "skip_eval"
     return format_router(state)
-builder.add_conditional_edges(
-    "error_handler",
-    post_error_router,
-    path_map={
-        "sql_generator": "sql_generator",
-        "format_result_table": "format_result_table",
-        "log_step": "log_step",
-    },
-)
-builder.add_edge("format_result_table", "log_step")
-builder.add_edge("log_step", "evaluate_result")
-builder.add_edge("evaluate_result", END)
-graph = builder.compile()
+
+# ---------- 4. Graph Definition ----------
+
+NODE_FUNCTIONS = {
+    "schema_loader": schema_loader,
+    "scope_detector": scope_detector,
+    "table_selector": table_selector_agent,
+    "metadata_handler": handle_metadata_query,
+    "sql_generator": generate_sql,
+    "validate_sql": validate_sql,
+    "execute_sql": execute_sql,
+    "yard_location_checker": yard_location_checker,
+    "result_sampler": result_sampler,
+    "error_handler": error_handler,
+    "repair_sql": repair_sql,
+    "format_result_table": format_result_table,
+    "log_step": log_step,
+    "evaluate_result": evaluate_result,
+}
+graph = build_graph(AgentState, NODE_FUNCTIONS, post_error_router, parallel=PARALLEL_GRAPH, wrap=TRACER.node)
 
 # ---------- 5. Streamlit Interface ----------
 
@@ -463,9 +555,23 @@ if st.button("Submit Query"):
         # Initialize state with the user query
         initial_state = AgentState(user_query=user_query)
         
-        # Execute the graph
-        with st.spinner("Processing your query..."):
-            final_state = graph.invoke(initial_state)
+        # Execute the graph (or reuse this session's cached answer for the same question)
+        answer_cache = get_result_cache(DEFAULT_DB_PATH)
+        answer_context = conversation_key(st.session_state.setdefault("session_id", uuid.uuid4().hex))
+        final_state = answer_cache.get_answer(user_query, answer_context)
+        if final_state is None:
+            with st.spinner("Processing your query..."), Timer() as t, \
+                    TRACER.span("request", kind="request", query=user_query[:200]) as request_span:
+                initial_state["trace_parent"] = (request_span.trace_id, request_span.span_id)
+                final_state = graph.invoke(initial_state)
+            if not final_state.get("has_error") and final_state.get("row_count_exact") is not False \
+                    and not str(final_state.get("evaluation", "")).startswith("[EVALUATION ERROR]"):
+                answer_cache.put_answer(
+                    user_query,
+                    {key: final_state.get(key) for key in ("sql_result", "evaluation", "row_count", "result_path")},
+                    t.elapsed,
+                    context=answer_context,
+                )
         
         # Display results
         st.subheader("Results")
@@ -475,17 +581,36 @@ if st.button("Submit Query"):
         if isinstance(sql_result, pd.DataFrame):
             st.write("Query Result:")
             st.dataframe(sql_result)
+            row_count = final_state.get("row_count")
+            if row_count and final_state.get("row_count_exact") is False:
+                st.caption(f"Showing {len(sql_result)} of at least {row_count:,} rows (counting stopped at the time budget).")
+            elif row_count and row_count > len(sql_result):
+                st.caption(f"Showing {len(sql_result)} of {row_count:,} rows.")
         elif isinstance(sql_result, str) and sql_result.startswith(("[SQL ERROR", "[FORMAT ERROR", "[LLM ERROR]")):
             st.error(sql_result)
         else:
             st.markdown(sql_result)
         
+        result_path = final_state.get("result_path")
+        if result_path and os.path.isfile(result_path):
+            with open(result_path, "rb") as f:
+                st.download_button(
+                    "📥 Download full result (Parquet)",
+                    data=f.read(),
+                    file_name="query_result.parquet",
+                    mime="application/octet-stream",
+                )
+        
         if evaluation:
             st.subheader("Analysis")
             st.write(evaluation)
     else:
         st.warning("Please enter a query.")
 
+render_cache_stats(st, get_result_cache(DEFAULT_DB_PATH))
+template_stats = SQL_TEMPLATES.stats()
+st.sidebar.caption(f"SQL templates: {template_stats['templates']} learned, {template_stats['hits']} LLM calls skipped")
+
 # Display logs (optional)
 if st.checkbox("Show Debug Logs"):
     if os.path.exists("sql_graph_debug.log"):
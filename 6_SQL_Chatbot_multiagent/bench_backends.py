@@ -0,0 +1,102 @@
+"""
+SQLite row store vs. the DuckDB/Parquet mirror on representative fleet aggregates.
+
+Each query runs on both backends (best of `--repeat`); results must match.
+`--scale N` first copies the DB to a temp file with `trip_event_bustime`,
+`gtfs_shape` and `getvehicles` repeated N times, to see how both engines grow
+with data volume. The router column shows where `QueryRouter` would send it.
+
+    python bench_backends.py vehicles.db --scale 20
+"""
+import argparse
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from analytics_backend import QueryRouter
+
+QUERIES = {
+    "kWh/mile per bus": """
+        SELECT vid, AVG(kwh_mile) AS kwh_mile, SUM(miles_driven) AS miles, COUNT(*) AS trips
+        FROM trip_event_bustime GROUP BY vid ORDER BY kwh_mile DESC""",
+    "energy per route": """
+        SELECT rt, SUM(energy_used) AS kwh, SUM(miles_driven) AS miles,
+               SUM(energy_used) / NULLIF(SUM(miles_driven), 0) AS kwh_mile
+        FROM trip_event_bustime GROUP BY rt ORDER BY kwh DESC""",
+    "SOC drop by bus/route": """
+        SELECT vid, rt, AVG(start_soc - end_soc) AS soc_drop, MAX(start_soc - end_soc) AS worst
+        FROM trip_event_bustime GROUP BY vid, rt""",
+    "rank buses per route": """
+        SELECT vid, rt, kwh_mile FROM (
+            SELECT vid, rt, AVG(kwh_mile) AS kwh_mile,
+                   RANK() OVER (PARTITION BY rt ORDER BY AVG(kwh_mile)) AS r
+            FROM trip_event_bustime GROUP BY vid, rt) WHERE r <= 3""",
+    "points per shape": """
+        SELECT shape_id, route_id, COUNT(*) AS points, MAX(distance) AS length
+        FROM gtfs_shape GROUP BY shape_id, route_id""",
+    "pings per bus/route": """
+        SELECT vid, rt, COUNT(*) AS pings, AVG(spd) AS avg_speed FROM getvehicles GROUP BY vid, rt""",
+    "one bus lookup": """
+        SELECT * FROM trip_event_bustime WHERE vid = 2402 ORDER BY start_timestamp DESC LIMIT 5""",
+}
+SCALED_TABLES = ("trip_event_bustime", "gtfs_shape", "getvehicles")
+
+
+def scaled_copy(db_path: str, factor: int) -> Path:
+    """Copy of `db_path` with SCALED_TABLES repeated `factor` times."""
+    out = Path(tempfile.mkdtemp()) / f"scaled_x{factor}.db"
+    shutil.copy(db_path, out)
+    conn = sqlite3.connect(out)
+    with conn:
+        for table in SCALED_TABLES:
+            rows = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+            for _ in range(factor - 1):
+                conn.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}" WHERE rowid <= ?', (rows,))
+    conn.close()
+    return out
+
+
+def best_of(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _normalized(rows) -> list:
+    return sorted(tuple(round(v, 6) if isinstance(v, float) else str(v) for v in row) for row in rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("db", nargs="?", default="vehicles.db")
+    parser.add_argument("--scale", type=int, default=1, help="repeat the big tables N times first")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = scaled_copy(args.db, args.scale) if args.scale > 1 else Path(args.db)
+    router = QueryRouter(db_path)
+    mirror = router.mirror
+    start = time.perf_counter()
+    mirror.build()
+    print(f"Parquet mirror of {db_path.name} built in {time.perf_counter() - start:.2f}s")
+    assert mirror.ready()
+    sqlite_conn = sqlite3.connect(f"file:{db_path.resolve()}?mode=ro", uri=True)
+
+    print(f"{'query':24} {'sqlite ms':>10} {'duckdb ms':>10} {'speed-up':>9}  router  same")
+    for name, sql in QUERIES.items():
+        lite, lite_rows = best_of(lambda: sqlite_conn.execute(sql).fetchall(), args.repeat)
+        with mirror.connection() as conn:
+            duck, duck_rows = best_of(lambda: conn.execute(sql).fetchall(), args.repeat)
+        same = _normalized(lite_rows) == _normalized(duck_rows)
+        print(f"{name:24} {lite * 1000:10.1f} {duck * 1000:10.1f} {lite / duck:8.1f}x  "
+              f"{router.backend_for(sql):6}  {'yes' if same else 'NO'}")
+    sqlite_conn.close()
+
+
+if __name__ == "__main__":
+    main()
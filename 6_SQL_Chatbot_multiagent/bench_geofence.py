@@ -0,0 +1,64 @@
+"""
+Per-row shapely `apply` vs. the vectorized geofence on synthetic GPS pings.
+
+Pings are scattered around the main yard (a share of them inside it), the
+same shape of data `yard_location_checker` sees for "where are the buses"
+questions. Both methods must agree on every point.
+
+    python bench_geofence.py --rows 200000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from geofence import MAIN_YARD, load_yards
+
+
+def pings(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    lat = np.array([p[0] for p in MAIN_YARD])
+    lon = np.array([p[1] for p in MAIN_YARD])
+    # 20 % near the yard, the rest spread over the service area
+    near = rng.random(rows) < 0.2
+    return pd.DataFrame({
+        "latitude": np.where(near, rng.uniform(lat.min() - 0.001, lat.max() + 0.001, rows), rng.uniform(33.7, 34.2, rows)),
+        "longitude": np.where(near, rng.uniform(lon.min() - 0.001, lon.max() + 0.001, rows), rng.uniform(-118.6, -118.0, rows)),
+    })
+
+
+def per_row(df: pd.DataFrame) -> pd.Series:
+    from shapely.geometry import Point, Polygon
+    polygon = Polygon([(lon, lat) for lat, lon in MAIN_YARD])
+    return df.apply(
+        lambda row: "inside_yard" if Point(row["longitude"], row["latitude"]).within(polygon) else "in-transit",
+        axis=1,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+    df = pings(args.rows)
+    yards = load_yards(None)
+
+    start = time.perf_counter()
+    fast = yards.annotate(df)["location_status"]
+    vectorized = time.perf_counter() - start
+    print(f"vectorized: {vectorized * 1000:9.1f} ms  ({args.rows / vectorized:,.0f} rows/s)")
+
+    try:
+        start = time.perf_counter()
+        slow = per_row(df)
+        apply_time = time.perf_counter() - start
+    except ImportError:
+        print("shapely not installed – skipping the per-row baseline")
+        return
+    print(f"   apply  : {apply_time * 1000:9.1f} ms  ({args.rows / apply_time:,.0f} rows/s)")
+    print(f"speed-up  : {apply_time / vectorized:,.0f}x, {int((fast == slow).sum()):,}/{len(df):,} labels agree")
+
+
+if __name__ == "__main__":
+    main()
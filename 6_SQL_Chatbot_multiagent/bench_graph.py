@@ -0,0 +1,99 @@
+"""
+End-to-end latency of the sequential vs. the parallel pipeline graph.
+
+Every node is a stub that sleeps for a typical duration of the real node
+(LLM and embedding calls, SQLite work, CSV logging), so the benchmark
+measures the graph topology alone and needs neither an API key nor a
+database. Override a stage with e.g. `--cost evaluate_result=2.0`.
+
+    python bench_graph.py --runs 20
+"""
+import argparse
+import operator
+import statistics
+import time
+from typing import Annotated, Any, TypedDict
+
+from pipeline_graph import NODES, build_graph
+
+# Seconds per node, measured on the real graph (see the trace dashboard)
+COSTS = {
+    "schema_loader": 0.005,
+    "scope_detector": 0.002,
+    "table_selector": 0.250,      # query embedding
+    "metadata_handler": 0.001,
+    "sql_generator": 0.900,       # LLM
+    "validate_sql": 0.010,
+    "execute_sql": 0.060,
+    "yard_location_checker": 0.005,
+    "result_sampler": 0.001,
+    "error_handler": 0.001,
+    "repair_sql": 0.002,          # local fix; an LLM repair is ~0.5
+    "format_result_table": 0.010,
+    "log_step": 0.040,            # CSV append
+    "evaluate_result": 1.200,     # LLM
+}
+
+
+class BenchState(TypedDict, total=False):
+    user_query: str
+    schema: dict
+    data_scope: str
+    candidate_tables: list
+    sql_query: str
+    sql_result: Any
+    evaluation: str
+    steps: Annotated[list, operator.add]
+
+
+def stub(name: str, seconds: float):
+    outputs = {
+        "schema_loader": {"schema": {"getvehicles": ["vid", "lat", "lon"]}},
+        "scope_detector": {"data_scope": "current"},
+        "table_selector": {"candidate_tables": ["getvehicles"]},
+        "sql_generator": {"sql_query": "SELECT vid, lat, lon FROM getvehicles"},
+        "execute_sql": {"sql_result": "| vid | lat | lon |"},
+        "evaluate_result": {"evaluation": "ok"},
+    }
+
+    def node(state):
+        time.sleep(seconds)
+        return outputs.get(name, {})
+    return node
+
+
+def run(parallel: bool, runs: int, costs: dict) -> list:
+    graph = build_graph(
+        BenchState,
+        {name: stub(name, costs[name]) for name in NODES},
+        lambda state: "format",
+        parallel=parallel,
+    )
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        graph.invoke({"user_query": "show the last GPS points of bus 2401"})
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--cost", action="append", default=[], help="node=seconds")
+    args = parser.parse_args()
+    costs = dict(COSTS)
+    for item in args.cost:
+        name, _, seconds = item.partition("=")
+        costs[name] = float(seconds)
+
+    results = {label: run(parallel, args.runs, costs) for label, parallel in (("sequential", False), ("parallel", True))}
+    for label, timings in results.items():
+        p95 = sorted(timings)[max(0, int(round(0.95 * len(timings))) - 1)]
+        print(f"{label:>10}: mean {statistics.mean(timings):.3f}s  p50 {statistics.median(timings):.3f}s  p95 {p95:.3f}s")
+    saved = statistics.mean(results["sequential"]) - statistics.mean(results["parallel"])
+    print(f"saved {saved:.3f}s per query ({saved / statistics.mean(results['sequential']):.1%})")
+
+
+if __name__ == "__main__":
+    main()
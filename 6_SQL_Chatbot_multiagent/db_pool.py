@@ -0,0 +1,115 @@
+"""
+Shared pool of read-only SQLite connections.
+
+Connections are opened with `mode=ro&immutable=1` (no file locking, no
+change detection) and tuned for reads: memory-mapped I/O, a large page
+cache and in-memory temp storage. Because immutable connections never see
+later writes, `get_pool` rebuilds the pool whenever the DB file signature
+changes. Pools are process-wide, so every Streamlit session shares them and
+reads in parallel. Functions added with `add_connect_hook` (SQL user
+functions, for example) run on every new connection.
+
+A SQLAlchemy engine that uses `ReadOnlyPool.connect` as its `creator` keeps
+its own pool of these connections. `recycle_on_change` makes it drop any
+connection opened before the file changed, the same way `get_pool` does.
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from result_cache import db_version
+
+POOL_SIZE = 8
+MMAP_SIZE = 256 * 1024 * 1024      # bytes
+CACHE_SIZE_KIB = 64 * 1024          # PRAGMA cache_size takes -KiB
+
+_CONNECT_HOOKS: list = []
+
+
+def add_connect_hook(hook) -> None:
+    """Run `hook(conn, db_path)` on every connection opened from now on."""
+    if hook not in _CONNECT_HOOKS:
+        _CONNECT_HOOKS.append(hook)
+
+
+class ReadOnlyPool:
+    """Bounded, thread-safe pool of tuned read-only connections to one DB file."""
+
+    def __init__(self, db_path, size: int = POOL_SIZE):
+        self.db_path = Path(db_path).resolve()
+        self.uri = f"file:{self.db_path}?mode=ro&immutable=1"
+        self.size = size
+        self.version = db_version(self.db_path)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a new tuned connection (also usable as a SQLAlchemy `creator`)."""
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=ON")
+        for hook in _CONNECT_HOOKS:
+            hook(conn, self.db_path)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; blocks while all `size` connections are in use."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.connect()
+            try:
+                yield conn
+            finally:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def recycle_on_change(engine, db_path) -> None:
+    """Invalidate `engine`'s pooled connections once the DB file signature changes."""
+    from sqlalchemy import event, exc
+
+    @event.listens_for(engine, "connect")
+    def _stamp(dbapi_conn, record):
+        record.info["db_version"] = db_version(db_path)
+
+    @event.listens_for(engine, "checkout")
+    def _check(dbapi_conn, record, proxy):
+        if record.info.get("db_version") != db_version(db_path):
+            raise exc.DisconnectionError("database file changed")  # the pool reconnects
+
+
+_POOLS: dict = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(db_path, size: int = POOL_SIZE) -> ReadOnlyPool:
+    """Return the shared pool for `db_path`, rebuilt if the file has changed."""
+    key = str(Path(db_path).resolve())
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or pool.version != db_version(key):
+            if pool is not None:
+                pool.close()
+            pool = _POOLS[key] = ReadOnlyPool(key, size)
+        return pool
@@ -0,0 +1,113 @@
+"""
+Vectorized geofences for yard/depot detection.
+
+Each `Geofence` is a polygon of (lat, lon) vertices. `contains` tests whole
+lat/lon arrays at once: a bounding-box prefilter drops the vast majority of
+points, then NumPy ray casting (one pass per polygon edge, vectorized over
+the remaining points) decides the rest. `GeofenceSet` holds several named
+yards and labels each point with the first yard that contains it.
+
+Extra yards can be given in a JSON file (`YARDS_FILE`, default `yards.json`):
+
+    {"main_yard": [[33.9057, -118.3118], [33.9057, -118.3106], ...]}
+"""
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+YARDS_FILE = os.getenv("YARDS_FILE", "yards.json")
+
+# Main bus yard, traced from GPS points
+MAIN_YARD = [
+    (33.90569271628536, -118.31175238807698),
+    (33.90567242912735, -118.31055159492222),
+    (33.90498900267104, -118.30926830452778),
+    (33.90410954017733, -118.30927448909796),
+    (33.90370429579649, -118.30925946566806),
+    (33.90372299942574, -118.31049389062383),
+    (33.903750015771855, -118.3114203353168),
+    (33.90465609749877, -118.31141532750766),
+    (33.90560581044806, -118.31155554617293),
+]
+
+
+class Geofence:
+    """A named polygon; `contains(lat, lon)` works on scalars or arrays."""
+
+    def __init__(self, name: str, coords):
+        pts = np.asarray(coords, dtype=float)
+        if pts.ndim != 2 or pts.shape[1] != 2 or len(pts) < 3:
+            raise ValueError(f"geofence {name!r} needs at least 3 (lat, lon) vertices")
+        self.name = name
+        self.lat, self.lon = pts[:, 0], pts[:, 1]
+        self.bbox = (self.lat.min(), self.lat.max(), self.lon.min(), self.lon.max())
+
+    def contains(self, lat, lon) -> np.ndarray:
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        lat_min, lat_max, lon_min, lon_max = self.bbox
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        idx = np.flatnonzero(inside)
+        if idx.size == 0:
+            return inside
+        y, x = lat.ravel()[idx], lon.ravel()[idx]
+        hit = np.zeros(idx.size, dtype=bool)
+        # Ray casting along +lon: toggle on every edge the horizontal ray crosses
+        y1, x1 = self.lat, self.lon
+        y2, x2 = np.roll(self.lat, -1), np.roll(self.lon, -1)
+        for ya, xa, yb, xb in zip(y1, x1, y2, x2):
+            if ya == yb:
+                continue
+            crosses = (ya > y) != (yb > y)
+            x_cross = xa + (y - ya) * (xb - xa) / (yb - ya)
+            hit ^= crosses & (x < x_cross)
+        inside.ravel()[idx] = hit
+        return inside
+
+
+class GeofenceSet:
+    """Several named geofences; `locate` returns the yard name per point."""
+
+    def __init__(self, fences):
+        self.fences = list(fences)
+
+    @classmethod
+    def from_dict(cls, yards: dict) -> "GeofenceSet":
+        return cls(Geofence(name, coords) for name, coords in yards.items())
+
+    @property
+    def names(self) -> list:
+        return [f.name for f in self.fences]
+
+    def codes(self, lat, lon) -> np.ndarray:
+        """Index of the first containing yard per point, -1 outside all of them."""
+        lat = np.asarray(lat, dtype=float)
+        out = np.full(lat.shape, -1, dtype=np.int16)
+        for i, fence in enumerate(self.fences):
+            out[fence.contains(lat, lon) & (out < 0)] = i
+        return out
+
+    def locate(self, lat, lon) -> np.ndarray:
+        """Name of the first containing yard per point, or None outside all of them."""
+        codes = self.codes(lat, lon)
+        return np.array(self.names + [None], dtype=object)[codes]
+
+    def annotate(self, df: pd.DataFrame, lat_col: str = "latitude", lon_col: str = "longitude") -> pd.DataFrame:
+        """Copy of `df` with `yard` (name or NaN) and `location_status` columns."""
+        codes = self.codes(df[lat_col].to_numpy(dtype=float), df[lon_col].to_numpy(dtype=float))
+        out = df.copy()
+        out["yard"] = pd.Categorical.from_codes(codes, categories=self.names)
+        out["location_status"] = pd.Categorical.from_codes((codes >= 0).astype(np.int8), categories=["in-transit", "inside_yard"])
+        return out
+
+
+def load_yards(path: Optional[str] = YARDS_FILE) -> GeofenceSet:
+    """The main yard plus any yards defined in `path` (same name overrides)."""
+    yards = {"main_yard": MAIN_YARD}
+    if path and Path(path).is_file():
+        yards.update(json.loads(Path(path).read_text()))
+    return GeofenceSet.from_dict(yards)
@@ -0,0 +1,118 @@
+"""
+Wiring of the SQL pipeline graph.
+
+`build_graph` takes the node functions and returns the compiled LangGraph.
+With `parallel=True` independent work fans out. Scope detection and table
+selection (an embedding call) run side by side after the schema is loaded;
+the selector first applies the scope detector to its own copy of the state
+(a local keyword check), so it ranks the same scope-filtered schema it would
+see sequentially.
+Logging runs alongside the final `evaluate_result` LLM call instead of in
+front of it. LangGraph runs nodes of the same step on its thread pool, so a
+slow LLM/API call overlaps with local work. `parallel=False` builds the
+original strictly sequential graph, for comparison (see `bench_graph.py`).
+
+The gain is negligible: about 35 ms of 2.5 s per query (1.4%), the local
+scope check and the CSV append. The expensive nodes – the embedding call,
+SQL generation, evaluation – each need the previous one's output, and the
+remaining independent work (template lookup, prompt assembly) is local and
+takes milliseconds, so there is nothing slow left to overlap.
+
+`route_after_checks(state)` returns one of ROUTES:
+"repair" → fix the failed SQL from its error, "retry" → regenerate SQL,
+"format" → render a table, "answer" → answer as is, "skip_eval" → the error
+handler already wrote the final message.
+
+The state type needs `steps: Annotated[list, operator.add]`. Every node
+appends its name there, and a reducer key is what lets LangGraph run two
+branches in the same step.
+"""
+import functools
+
+from langgraph.graph import END, StateGraph
+
+NODES = (
+    "schema_loader", "scope_detector", "table_selector", "metadata_handler", "sql_generator",
+    "validate_sql", "execute_sql", "yard_location_checker", "result_sampler", "error_handler",
+    "repair_sql", "format_result_table", "log_step", "evaluate_result",
+)
+ROUTES = ("repair", "retry", "format", "answer", "skip_eval")
+
+_SEQUENTIAL_ROUTES = {
+    "repair": "repair_sql",
+    "retry": "sql_generator",
+    "format": "format_result_table",
+    "answer": "log_step",
+    "skip_eval": "log_step",
+}
+_PARALLEL_ROUTES = {
+    "repair": ["repair_sql"],
+    "retry": ["sql_generator"],
+    "format": ["format_result_table"],
+    "answer": ["log_step", "evaluate_result"],
+    "skip_eval": ["log_step"],
+}
+
+
+def _record_step(name: str, fn):
+    @functools.wraps(fn)
+    def node(state):
+        return {**(fn(state) or {}), "steps": [name]}
+    return node
+
+
+def _scoped(scope_fn, select_fn):
+    """`select_fn` run on the state as `scope_fn` would leave it."""
+    @functools.wraps(select_fn)
+    def node(state):
+        return select_fn({**state, **(scope_fn(dict(state)) or {})})
+    return node
+
+
+def build_graph(state_type, nodes: dict, route_after_checks, parallel: bool = True, wrap=None):
+    """Compile the pipeline; `wrap(name, fn)` decorates every node (e.g. tracing)."""
+    builder = StateGraph(state_type)
+    for name in NODES:
+        fn = nodes[name]
+        if parallel and name == "table_selector":
+            fn = _scoped(nodes["scope_detector"], fn)
+        builder.add_node(name, _record_step(name, wrap(name, fn) if wrap else fn))
+    builder.set_entry_point("schema_loader")
+
+    if parallel:
+        builder.add_edge("schema_loader", "scope_detector")
+        builder.add_edge("schema_loader", "table_selector")
+        builder.add_edge(["scope_detector", "table_selector"], "metadata_handler")
+    else:
+        builder.add_edge("schema_loader", "scope_detector")
+        builder.add_edge("scope_detector", "table_selector")
+        builder.add_edge("table_selector", "metadata_handler")
+
+    builder.add_conditional_edges(
+        "metadata_handler",
+        lambda state: "format_result_table" if state.get("skip_sql_generation") else "sql_generator",
+        {"format_result_table": "format_result_table", "sql_generator": "sql_generator"}
+    )
+    builder.add_edge("sql_generator", "validate_sql")
+    builder.add_edge("repair_sql", "validate_sql")
+    builder.add_edge("validate_sql", "execute_sql")
+    builder.add_edge("execute_sql", "yard_location_checker")
+    builder.add_edge("yard_location_checker", "result_sampler")
+    builder.add_edge("result_sampler", "error_handler")
+
+    routes = _PARALLEL_ROUTES if parallel else _SEQUENTIAL_ROUTES
+    builder.add_conditional_edges(
+        "error_handler",
+        lambda state: routes[route_after_checks(state)],
+        ["repair_sql", "sql_generator", "format_result_table", "log_step", "evaluate_result"],
+    )
+
+    if parallel:
+        builder.add_edge("format_result_table", "log_step")
+        builder.add_edge("format_result_table", "evaluate_result")
+        builder.add_edge("log_step", END)
+    else:
+        builder.add_edge("format_result_table", "log_step")
+        builder.add_edge("log_step", "evaluate_result")
+    builder.add_edge("evaluate_result", END)
+    return builder.compile()
@@ -0,0 +1,173 @@
+"""
+Token-budgeted assembly of the modular system prompt.
+
+Every file in the prompt folder is split into fragments (markdown sections,
+or one fragment per top-level key for JSON), and each fragment is measured in
+tokens. Per question, pinned files are always included, and the remaining
+fragments are ranked by lexical relevance (IDF-weighted term overlap) and
+added greedily until the token budget is spent. Fragments keep their original
+order in the output, and parsed fragments and assembled prompts are cached.
+
+Run `python prompt_builder.py [folder] [budget]` to compare full vs. budgeted
+prompt sizes on a small benchmark question set.
+"""
+import functools
+import json
+import math
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_BUDGET = 2500  # tokens
+
+_HEADING = re.compile(r"^(?=#{1,3} )", re.MULTILINE)
+_WORD = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it me of on or show the this to what when where which "
+    "who with give get list tell all my".split()
+)
+
+BENCHMARK_QUESTIONS = [
+    "What is the current SOC of bus 2402?",
+    "Where is bus 2401 right now?",
+    "Show the predicted end SOC for every block today",
+    "Which buses have critical SOC alerts?",
+    "Average kWh per mile by vehicle last week",
+    "List the trips for block 13 on Friday",
+    "Compare predicted vs actual end SOC for bus 2403",
+    "Show the route shape for route 3",
+]
+
+
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+_ENC = _encoder()
+
+
+def count_tokens(text: str) -> int:
+    """Exact count with tiktoken when installed, else a ~4 chars/token estimate."""
+    if _ENC is not None:
+        return len(_ENC.encode(text))
+    return max(1, len(text) // 4)
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1}
+
+
+@dataclass(frozen=True)
+class Fragment:
+    source: str   # file name (plus JSON key)
+    order: int
+    text: str
+    tokens: int
+    terms: frozenset
+
+
+def _split(path: Path) -> list:
+    text = path.read_text().strip()
+    if path.suffix == ".json":
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return [(path.name, text)]
+        return [(f"{path.name}:{key}", json.dumps({key: value}, ensure_ascii=False)) for key, value in data.items()]
+    return [(path.name, part.strip()) for part in _HEADING.split(text) if part.strip()]
+
+
+def _folder_signature(folder: Path) -> tuple:
+    return tuple((p.name, p.stat().st_mtime_ns) for p in sorted(folder.glob("*.*")))
+
+
+@functools.lru_cache(maxsize=8)
+def _load_fragments(folder: str, signature: tuple) -> tuple:
+    fragments = []
+    for path in sorted(Path(folder).glob("*.*")):
+        for source, text in _split(path):
+            fragments.append(Fragment(source, len(fragments), text, count_tokens(text), frozenset(_terms(text))))
+    return tuple(fragments)
+
+
+@functools.lru_cache(maxsize=256)
+def _assemble(fragments: tuple) -> str:
+    return "\n\n".join(f.text for f in sorted(fragments, key=lambda f: f.order))
+
+
+class PromptBuilder:
+    """Selects prompt fragments relevant to a question within a token budget."""
+
+    def __init__(self, folder, budget: int = DEFAULT_BUDGET, pinned=(), include: Optional[list] = None):
+        self.folder = Path(folder)
+        if not self.folder.exists():
+            raise FileNotFoundError(f"Missing prompt folder: {self.folder}")
+        self.budget = budget
+        self.pinned = set(pinned)
+        self.include = set(include) if include is not None else None
+
+    def fragments(self) -> tuple:
+        frags = _load_fragments(str(self.folder), _folder_signature(self.folder))
+        if self.include is None:
+            return frags
+        return tuple(f for f in frags if f.source.split(":")[0] in self.include)
+
+    def full(self) -> str:
+        """Every fragment, unbudgeted (the old concatenate-everything prompt)."""
+        return _assemble(self.fragments())
+
+    def _scores(self, query: str, frags: tuple) -> dict:
+        q = _terms(query)
+        n = len(frags)
+        df = {t: sum(t in f.terms for f in frags) for t in q}
+        idf = {t: math.log((n + 1) / (df[t] + 1)) + 1 for t in q}
+        return {f: sum(idf[t] for t in q & f.terms) / math.sqrt(f.tokens) for f in frags}
+
+    def _pinned(self, frags: tuple) -> list:
+        return [f for f in frags if f.source.split(":")[0] in self.pinned]
+
+    def pinned_text(self) -> str:
+        """Only the pinned files – identical for every question."""
+        return _assemble(tuple(self._pinned(self.fragments())))
+
+    def build(self, query: str, budget: Optional[int] = None, with_pinned: bool = True) -> str:
+        """Relevant fragments for `query`; pass `with_pinned=False` when the
+        pinned part is already sent separately (e.g. in a static prefix)."""
+        budget = self.budget if budget is None else budget
+        frags = self.fragments()
+        pinned = self._pinned(frags)
+        used = sum(f.tokens for f in pinned)
+        chosen = list(pinned) if with_pinned else []
+        scores = self._scores(query, [f for f in frags if f not in pinned])
+        for frag, score in sorted(scores.items(), key=lambda kv: kv[1], reverse=True):
+            if score <= 0:
+                break
+            if used + frag.tokens <= budget:
+                chosen.append(frag)
+                used += frag.tokens
+        return _assemble(tuple(chosen))
+
+
+def benchmark(builder: PromptBuilder, questions=BENCHMARK_QUESTIONS) -> None:
+    full_tokens = count_tokens(builder.full())
+    total, t0 = 0, time.perf_counter()
+    for q in questions:
+        tokens = count_tokens(builder.build(q))
+        total += tokens
+        print(f"{tokens:6d} / {full_tokens} tokens  {q}")
+    elapsed = (time.perf_counter() - t0) / len(questions) * 1000
+    print(f"mean {total / len(questions):.0f} vs {full_tokens} tokens "
+          f"({1 - total / len(questions) / full_tokens:.0%} fewer), {elapsed:.2f} ms/build")
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "modular_prompt"
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_BUDGET
+    benchmark(PromptBuilder(folder, budget, pinned=("global_rules.txt", "query_execution.md")))
@@ -0,0 +1,147 @@
+"""
+Query cost guard for LLM-written SQL.
+
+`check_query` runs EXPLAIN QUERY PLAN against the real (read-only) database,
+flags full scans of large tables and cartesian/unindexed joins, and rejects
+the worst offenders. The plan names tables by their alias (`SCAN a`), so
+aliases are resolved through the query's FROM/JOIN clauses first. The SQL
+itself is never rewritten with a LIMIT: result_engine bounds the rows held
+in memory and still needs the full query for the exact count and the
+Parquet spill. Only scans that are siblings in the plan tree (the loops of
+one join) multiply into a cartesian estimate; UNION branches, subqueries
+and the partitions behind one view are separate loops. `time_budget` aborts any statement that runs past its
+deadline via a sqlite3 progress handler, so a runaway query never ties up a
+worker.
+"""
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+from schema_catalog import is_partition
+
+LARGE_TABLE_ROWS = 20_000
+CARTESIAN_FACTOR = 10  # unindexed joins producing more than LARGE_TABLE_ROWS * this are rejected
+PROGRESS_STEPS = 10_000  # VM instructions between deadline checks
+
+_READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_AGGREGATE = re.compile(r"\b(count|sum|avg|min|max|total|group_concat)\s*\(|\bgroup\s+by\b", re.IGNORECASE)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$")
+_TABLE_REF = re.compile(r'(?:\bfrom|\bjoin|,)\s*["`\[]?(\w+)["`\]]?(?:\s+(?:as\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIAS = {"where", "on", "using", "join", "left", "right", "inner", "outer", "cross", "natural", "full",
+              "group", "order", "limit", "having", "window", "union", "except", "intersect"}
+_SQL_TOKENS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?(?:\*/|$)", re.DOTALL)
+
+
+class QueryRejected(Exception):
+    """Raised when a query is too expensive to run as written."""
+
+
+@dataclass
+class PlanReport:
+    sql: str
+    plan: list = field(default_factory=list)         # (id, parent, detail) rows of EXPLAIN QUERY PLAN
+    full_scans: list = field(default_factory=list)   # large tables read without an index
+    cartesian: bool = False
+    warnings: list = field(default_factory=list)
+
+
+def explain_plan(conn: sqlite3.Connection, sql: str) -> list:
+    """Return EXPLAIN QUERY PLAN for `sql` as (id, parent, detail) rows."""
+    return [(row[0], row[1], row[-1]) for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def table_size(conn: sqlite3.Connection, table: str) -> int:
+    """Cheap row-count estimate (MAX(rowid) is an index seek, not a scan)."""
+    try:
+        return conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+    except sqlite3.Error:
+        return 0  # views, WITHOUT ROWID tables, CTE names
+
+
+def strip_sql(sql: str) -> str:
+    """`sql` without comments or a trailing semicolon (string literals are kept as is)."""
+    text = _SQL_TOKENS.sub(lambda m: m.group(0) if m.group(0)[0] in "'\"" else " ", sql or "")
+    return text.strip().rstrip(";").strip()
+
+
+def resolve_aliases(conn: sqlite3.Connection, sql: str) -> dict:
+    """{lower-case name used in the plan: real table} for every table and alias in FROM/JOIN."""
+    tables = {name.lower(): name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    names = dict(tables)
+    for table, alias in _TABLE_REF.findall(sql):
+        real = tables.get(table.lower())
+        if real and alias and alias.lower() not in _NOT_ALIAS and alias.lower() not in tables:
+            names[alias.lower()] = real
+    return names
+
+
+def check_query(conn: sqlite3.Connection, sql: str, max_rows: int, large_table_rows: int = LARGE_TABLE_ROWS) -> PlanReport:
+    """Analyse `sql` against the real schema; raise QueryRejected or return a (possibly rewritten) report."""
+    if not _READ_ONLY.match(sql or ""):
+        raise QueryRejected("only SELECT queries are allowed")
+    report = PlanReport(sql=strip_sql(sql))
+    try:
+        report.plan = explain_plan(conn, report.sql)
+    except sqlite3.Error as e:
+        raise QueryRejected(str(e)) from e
+
+    names = resolve_aliases(conn, report.sql)
+    sizes: dict = {}
+    loops: dict = {}  # plan parent id → {table: rows} for its unindexed SCANs
+    for _, parent, detail in report.plan:
+        m = _SCAN.match(detail)
+        if not m or "INDEX" in m.group(2):
+            continue
+        tbl = names.get(m.group(1).lower(), m.group(1))
+        if tbl not in sizes:
+            sizes[tbl] = table_size(conn, tbl)
+        if sizes[tbl] >= large_table_rows and tbl not in report.full_scans:
+            report.full_scans.append(tbl)
+        # Partitions of one view are read one after another, never joined to each other
+        key = tbl.rsplit("__p", 1)[0] if is_partition(tbl) else tbl
+        loop = loops.setdefault(parent, {})
+        loop[key] = max(loop.get(key, 0), sizes[tbl])
+
+    # Two or more unindexed scans under one plan node are the loops of a
+    # nested-loop join with no usable key – effectively a cartesian product.
+    # Scans under different nodes (UNION branches, subqueries, co-routines)
+    # run one after another, so their sizes add rather than multiply.
+    for loop in loops.values():
+        if len(loop) < 2 or not any(loop[t] >= large_table_rows for t in loop):
+            continue
+        rows = 1
+        for n in loop.values():
+            rows *= max(n, 1)
+        if rows >= large_table_rows * CARTESIAN_FACTOR:
+            report.cartesian = True
+            raise QueryRejected(
+                f"cartesian/unindexed join over {', '.join(sorted(loop))} "
+                "– add a join condition on a key column"
+            )
+        report.warnings.append("unindexed join")
+
+    if report.full_scans and not _AGGREGATE.search(report.sql):
+        report.warnings.append(f"full scan of {', '.join(report.full_scans)}; only {max_rows} rows are kept in memory")
+    return report
+
+
+@contextmanager
+def time_budget(conn: sqlite3.Connection, seconds: Optional[float]):
+    """Interrupt any statement on `conn` that runs longer than `seconds`."""
+    if not seconds:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            raise QueryRejected(f"query exceeded the {seconds:g}s time budget") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
@@ -0,0 +1,183 @@
+"""
+Two-level LRU cache for the SQL chatbots.
+
+Level 1 maps normalized SQL text to the query result, level 2 maps the
+normalized user question to the final answer. Both levels are keyed by the
+DB file version and are dropped as soon as the database file changes.
+
+Answers also depend on the conversation ("and yesterday?" means something
+different in every chat), so level 2 is keyed by `conversation_key` too: the
+session plus a hash of its recent messages. An answer is only reused for the
+same question asked in the same context.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_WS = re.compile(r"\s+")
+_PUNCT = re.compile(r"[^\w\s.\-:/]")
+ANSWER_CONTEXT_MESSAGES = 6  # prior chat messages an answer's cache key depends on
+
+
+def db_version(db_path) -> tuple:
+    """Return a cheap (mtime_ns, size) signature of the DB file."""
+    try:
+        st = Path(db_path).stat()
+    except OSError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def normalize_sql(sql: str) -> str:
+    """Lower-case and collapse whitespace outside string literals, drop comments."""
+    parts = _QUOTED.split(sql or "")
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:  # quoted literal – keep verbatim
+            out.append(part)
+            continue
+        part = _BLOCK_COMMENT.sub(" ", _LINE_COMMENT.sub(" ", part))
+        out.append(_WS.sub(" ", part).lower())
+    return "".join(out).strip().rstrip(";").strip()
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace."""
+    q = _PUNCT.sub(" ", (question or "").lower())
+    return _WS.sub(" ", q).strip(" .")
+
+
+def conversation_key(session: str = "", history=()) -> str:
+    """Short hash of the session id and its last ANSWER_CONTEXT_MESSAGES messages."""
+    recent = [(m.get("role"), m.get("content")) for m in list(history)[-ANSWER_CONTEXT_MESSAGES:]]
+    return hashlib.sha1(json.dumps([session, recent], default=str).encode()).hexdigest()[:16]
+
+
+class LRUCache:
+    """Thread-safe LRU map that also tracks hits and the latency they saved."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, cost_seconds: float = 0.0) -> None:
+        with self._lock:
+            self._data[key] = (value, cost_seconds)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+class ResultCache:
+    """SQL-result and final-answer caches bound to one database file."""
+
+    def __init__(self, db_path, sql_maxsize: int = 128, answer_maxsize: int = 64):
+        self.db_path = str(db_path)
+        self.results = LRUCache(sql_maxsize)
+        self.answers = LRUCache(answer_maxsize)
+        self._version = db_version(self.db_path)
+        self._lock = threading.Lock()
+
+    def _check_version(self) -> tuple:
+        version = db_version(self.db_path)
+        with self._lock:
+            if version != self._version:
+                self.results.clear()
+                self.answers.clear()
+                self._version = version
+        return version
+
+    def get_result(self, sql: str) -> Optional[Any]:
+        return self.results.get((normalize_sql(sql), self._check_version()))
+
+    def put_result(self, sql: str, value: Any, cost_seconds: float = 0.0) -> None:
+        self.results.put((normalize_sql(sql), self._check_version()), value, cost_seconds)
+
+    def get_answer(self, question: str, context: str = "") -> Optional[Any]:
+        """Cached answer to `question` asked in `context` (see conversation_key)."""
+        return self.answers.get((normalize_question(question), context, self._check_version()))
+
+    def put_answer(self, question: str, value: Any, cost_seconds: float = 0.0, context: str = "") -> None:
+        self.answers.put((normalize_question(question), context, self._check_version()), value, cost_seconds)
+
+    def stats(self) -> dict:
+        return {"sql": self.results.stats(), "answer": self.answers.stats()}
+
+
+class Timer:
+    """Context manager that records elapsed wall time in `.elapsed`."""
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self.elapsed = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._t0
+        return False
+
+
+_CACHES: dict = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_result_cache(db_path) -> ResultCache:
+    """Return the process-wide cache for `db_path` (shared across sessions)."""
+    key = str(Path(db_path).resolve())
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = _CACHES[key] = ResultCache(key)
+        return cache
+
+
+def render_cache_stats(st, cache: ResultCache) -> None:
+    """Show hit-rate and saved-latency counters in the Streamlit sidebar."""
+    stats = cache.stats()
+    st.sidebar.markdown("### ⚡ Cache")
+    for label, s in (("SQL results", stats["sql"]), ("Answers", stats["answer"])):
+        st.sidebar.caption(
+            f"{label}: {s['hit_rate']:.0%} hit rate "
+            f"({s['hits']}/{s['hits'] + s['misses']}), "
+            f"{s['saved_seconds']:.1f}s saved, {s['entries']} cached"
+        )
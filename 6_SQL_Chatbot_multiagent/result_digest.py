@@ -0,0 +1,204 @@
+"""
+Compact digest of a query result for the evaluation prompt.
+
+`evaluate_result` used to paste the result (a DataFrame repr or markdown
+table) straight into the LLM prompt. `digest` computes what the analyst
+needs locally, with vectorized pandas:
+
+- shape: total rows, rows fetched, columns
+- column stats: numeric → min / mean / median / max / nulls, time → range,
+  ids and text → distinct count and most common values
+- trends: each measure ordered by the time column (first → last, % change,
+  direction from the rank correlation with time)
+- rows: the first `top_k`, plus the highest and lowest rows of the main
+  measure when there are more
+
+Small results are sent as CSV, since the digest would not be shorter.
+Sections are added in that order until `max_chars` is reached, so the
+prompt size is bounded whatever the query returns.
+
+    python result_digest.py vehicles.db "SELECT * FROM trip_event_bustime"
+"""
+import argparse
+import re
+import sqlite3
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from timeseries import FLEET_TZ, register_timeseries_functions
+
+TOP_K = 8
+MAX_COLUMNS = 14     # columns described in the stats section, the first half kept for measures
+MAX_MEASURES = 4     # numeric columns given a trend line
+ID_COLUMNS = {"vid", "bus_id", "rt", "route", "route_id", "block", "block_id", "blk", "tablockid", "trip_id",
+              "tripid", "shape_id", "service_id", "des", "pid", "rid", "oid", "tatripid", "origtatripno"}
+POSITION_COLUMNS = {"lat", "lon", "latitude", "longitude", "hdg"}  # described, but no trend or ranking
+TIME_HINTS = ("timestamp", "time", "date", "stsd", "_epoch", "bucket", "day", "month", "hour")
+_DATE_TEXT = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_EPOCH_RANGE = (946684800, 4102444800)  # 2000-01-01 .. 2100-01-01, seconds
+
+
+def _fmt(value) -> str:
+    if isinstance(value, (float, np.floating)):
+        return "null" if np.isnan(value) else f"{value:.4g}"
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d %H:%M") if (value.hour or value.minute) else value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+def _is_id(name: str) -> bool:
+    name = name.lower()
+    return name in ID_COLUMNS or name.endswith("_id")
+
+
+def _as_time(col: pd.Series) -> Optional[pd.Series]:
+    """`col` as datetimes if it holds epochs or date/time text, else None."""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    values = col.dropna()
+    if values.empty:
+        return None
+    hinted = any(hint in str(col.name).lower() for hint in TIME_HINTS)
+    if not hinted and (pd.api.types.is_numeric_dtype(col) or not _DATE_TEXT.match(str(values.iloc[0]))):
+        return None
+    if pd.api.types.is_numeric_dtype(col):
+        if values.between(*_EPOCH_RANGE).mean() < 0.9:
+            return None
+        local = pd.to_datetime(col, unit="s", errors="coerce", utc=True).dt.tz_convert(FLEET_TZ)
+        return local.dt.tz_localize(None)
+    parsed = pd.to_datetime(col.astype("string"), errors="coerce", format="mixed")
+    return parsed if parsed.notna().sum() >= 0.9 * len(values) else None
+
+
+def _classify(df: pd.DataFrame) -> tuple:
+    """(times {col: datetimes}, measures [numeric cols], labels [id/text cols])."""
+    times, measures, labels = {}, [], []
+    for name in df.columns:
+        col = df[name]
+        as_time = _as_time(col)
+        if as_time is not None:
+            times[name] = as_time
+        elif pd.api.types.is_bool_dtype(col) or _is_id(str(name)) or not pd.api.types.is_numeric_dtype(col):
+            labels.append(name)
+        else:
+            measures.append(name)
+    measures.sort(key=lambda name: str(name).lower() in POSITION_COLUMNS)
+    return times, measures, labels
+
+
+def column_stats(df: pd.DataFrame, times: dict, measures: list, labels: list) -> list:
+    lines, others = [], []
+    if measures:
+        num = df[measures].apply(pd.to_numeric, errors="coerce")
+        stats = pd.DataFrame({"min": num.min(), "mean": num.mean(), "median": num.median(),
+                              "max": num.max(), "nulls": num.isna().sum()})
+        for name, s in stats.iterrows():
+            nulls = f", {int(s['nulls'])} null" if s["nulls"] else ""
+            lines.append(f"- {name}: min {_fmt(s['min'])}, mean {_fmt(s['mean'])}, "
+                         f"median {_fmt(s['median'])}, max {_fmt(s['max'])}{nulls}")
+    for name, t in times.items():
+        others.append(f"- {name}: {_fmt(t.min())} → {_fmt(t.max())}")
+    for name in labels:
+        counts = df[name].value_counts(dropna=True)
+        common = ", ".join(f"{v} ({n})" for v, n in counts.head(3).items())
+        others.append(f"- {name}: {len(counts)} distinct; most common {common}" if len(counts) else f"- {name}: all null")
+    half = MAX_COLUMNS // 2
+    return (lines[:half] + others + lines[half:])[:MAX_COLUMNS]
+
+
+def trends(df: pd.DataFrame, times: dict, measures: list) -> list:
+    if not times or not measures or len(df) < 3:
+        return []
+    time_col, stamps = next(iter(times.items()))
+    order = stamps.sort_values(kind="stable").index
+    rank = stamps.loc[order].rank(method="average").to_numpy()
+    lines = []
+    for name in [m for m in measures if str(m).lower() not in POSITION_COLUMNS][:MAX_MEASURES]:
+        values = pd.to_numeric(df.loc[order, name], errors="coerce")
+        valid = values.notna().to_numpy()
+        if valid.sum() < 3:
+            continue
+        series = values[valid]
+        if series.nunique() < 2:
+            continue  # constant: nothing to report
+        first, last = series.iloc[0], series.iloc[-1]
+        corr = pd.Series(series.rank().to_numpy()).corr(pd.Series(rank[valid]))
+        direction = ("no clear trend" if np.isnan(corr) or abs(corr) < 0.3
+                     else "rising" if corr > 0 else "falling")
+        if series.is_monotonic_increasing or series.is_monotonic_decreasing:
+            direction += ", monotonic"
+        change = f" ({(last - first) / abs(first):+.1%})" if first else ""
+        lines.append(f"- {name} over {time_col}: {_fmt(first)} → {_fmt(last)}{change}, {direction}")
+    return lines
+
+
+def _rows(df: pd.DataFrame) -> str:
+    """CSV with whole-number float columns (ids with nulls) as integers and the rest rounded."""
+    floats = df.select_dtypes("float").columns
+    whole = [c for c in floats if (df[c].dropna() % 1 == 0).all()]
+    df = df.astype({c: "Int64" for c in whole}).round({c: 4 for c in floats.difference(whole)})
+    return df.to_csv(index=False).strip()
+
+
+def digest(df: pd.DataFrame, row_count: Optional[int] = None, top_k: int = TOP_K, max_chars: int = 4000) -> str:
+    """Bounded text summary of `df`; `row_count` is the full result size when `df` is its head."""
+    total = row_count if row_count is not None else len(df)
+    fetched = f" ({len(df):,} fetched, stats cover those)" if total > len(df) else ""
+    header = f"{total:,} rows{fetched} × {len(df.columns)} columns: {', '.join(map(str, df.columns))}"
+    if len(df) <= top_k:
+        return cap(f"{header}\n\nRows:\n{_rows(df)}" if len(df) else f"{header}\n\nNo rows.", max_chars)
+
+    times, measures, labels = _classify(df)
+    # epoch columns are shown as local time in the row sections
+    df = df.assign(**{str(c): t.dt.strftime("%Y-%m-%d %H:%M:%S") for c, t in times.items()
+                      if pd.api.types.is_numeric_dtype(df[c])})
+    sections = [header, "Column stats:\n" + "\n".join(column_stats(df, times, measures, labels))]
+    trend_lines = trends(df, times, measures)
+    if trend_lines:
+        sections.append("Trends:\n" + "\n".join(trend_lines))
+    sections.append(f"First {top_k} rows:\n{_rows(df.head(top_k))}")
+    if measures and str(measures[0]).lower() not in POSITION_COLUMNS:
+        main = measures[0]
+        ranked = df.assign(_key=pd.to_numeric(df[main], errors="coerce")).dropna(subset=["_key"])
+        k = max(1, top_k // 2)
+        sections.append(f"Highest {main}:\n{_rows(ranked.nlargest(k, '_key').drop(columns='_key'))}")
+        sections.append(f"Lowest {main}:\n{_rows(ranked.nsmallest(k, '_key').drop(columns='_key'))}")
+
+    out = ""
+    for section in sections:
+        if len(out) + len(section) + 2 > max_chars:
+            return out or cap(section, max_chars)
+        out = f"{out}\n\n{section}" if out else section
+    return out
+
+
+def cap(text: str, max_chars: int) -> str:
+    """`text` cut at a line boundary to at most `max_chars`, with a note when cut."""
+    text = str(text)
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars - 40)
+    cut = cut if cut > 0 else max_chars - 40
+    return text[:cut] + f"\n… {len(text) - cut:,} more characters omitted …"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("db")
+    parser.add_argument("sql")
+    parser.add_argument("--max-rows", type=int, default=5000)
+    parser.add_argument("--max-chars", type=int, default=4000)
+    args = parser.parse_args()
+    with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as conn:
+        register_timeseries_functions(conn)
+        df = pd.read_sql_query(args.sql, conn)
+    full = df.head(args.max_rows)
+    text = digest(full, len(df), max_chars=args.max_chars)
+    print(text)
+    print(f"\n[{len(text):,} chars vs {len(full.to_markdown(index=False)):,} for the markdown table]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Bounded SQL result engine.
+
+Rows are streamed from the cursor in batches and only the first `max_rows`
+are materialized in pandas. The query runs once: past the budget, the rest
+of the cursor is counted for the exact row count and, in the same pass,
+written to Parquet batch-by-batch so the result can still be downloaded in
+full. Each spill is written under a unique temp name and moved into place
+with `os.replace`, so sessions running the same query never share a
+half-written file.
+
+If the query is interrupted (the caller's time budget) after the preview
+has been fetched, the preview is kept: the count so far is returned as a
+lower bound and the partial spill is dropped. Old spills are pruned by age
+and number each time a query starts.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+BATCH_SIZE = 1000
+SPILL_DIR = Path(os.getenv("RESULT_SPILL_DIR", Path(tempfile.gettempdir()) / "sql_chatbot_results"))
+SPILL_MAX_AGE = float(os.getenv("RESULT_SPILL_MAX_AGE", 24 * 3600))  # seconds
+SPILL_MAX_FILES = int(os.getenv("RESULT_SPILL_MAX_FILES", 50))
+
+lg = logging.getLogger("sql_graph")
+
+
+@dataclass
+class QueryResult:
+    df: pd.DataFrame            # first `max_rows` rows only
+    row_count: int              # number of rows the query returns
+    spill_path: Optional[str] = None
+    count_exact: bool = True    # False: interrupted while counting, `row_count` is a lower bound
+
+    @property
+    def truncated(self) -> bool:
+        return self.row_count > len(self.df)
+
+
+class _ParquetSpill:
+    """Parquet file written batch by batch under a unique temp name, moved into place on `close`."""
+
+    def __init__(self, path: Path, columns: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa, self._pq = pa, pq
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix=".part")
+        os.close(fd)
+        self.path, self.tmp, self.columns, self.writer = path, Path(tmp), columns, None
+
+    def write(self, rows: list) -> None:
+        table = self._pa.Table.from_pandas(pd.DataFrame.from_records(rows, columns=self.columns), preserve_index=False)
+        if self.writer is None:
+            self.writer = self._pq.ParquetWriter(self.tmp, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self) -> str:
+        if self.writer is not None:
+            self.writer.close()
+        os.replace(self.tmp, self.path)  # atomic: readers see the old file or the complete new one
+        return str(self.path)
+
+    def abort(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+def _open_spill(sql: str, columns: list) -> Optional[_ParquetSpill]:
+    name = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:16] + ".parquet"
+    try:
+        return _ParquetSpill(SPILL_DIR / name, columns)
+    except ImportError:
+        lg.warning("pyarrow not installed – skipping Parquet spill")
+    except OSError as e:
+        lg.warning(f"Parquet spill unavailable: {e}")
+    return None
+
+
+def _write_spill(sink: Optional[_ParquetSpill], rows: list) -> Optional[_ParquetSpill]:
+    """Append `rows` to `sink`; on failure drop the spill (counting goes on) and return None."""
+    if sink is None:
+        return None
+    try:
+        sink.write(rows)
+        return sink
+    except Exception as e:
+        lg.warning(f"Parquet spill failed: {e}")
+        sink.abort()
+        return None
+
+
+def prune_spills() -> None:
+    """Delete spills older than SPILL_MAX_AGE seconds and all but the newest SPILL_MAX_FILES."""
+    try:
+        entries = [(p.stat().st_mtime, p) for p in SPILL_DIR.iterdir() if p.suffix in (".parquet", ".part")]
+    except OSError:
+        return  # no spill folder yet
+    cutoff = time.time() - SPILL_MAX_AGE
+    spills = sorted((e for e in entries if e[1].suffix == ".parquet"), reverse=True)  # newest first
+    for path in {p for mtime, p in entries if mtime < cutoff} | {p for _, p in spills[SPILL_MAX_FILES:]}:
+        try:
+            path.unlink()
+        except OSError:
+            pass  # another session got there first
+
+
+def _interrupted(e: BaseException) -> bool:
+    """True for sqlite3's and DuckDB's "query was interrupted" errors."""
+    if isinstance(e, sqlite3.OperationalError):
+        return "interrupted" in str(e)
+    return type(e).__name__ == "InterruptException"
+
+
+def run_query(conn: sqlite3.Connection, sql: str, max_rows: int, batch_size: int = BATCH_SIZE, spill: bool = True) -> QueryResult:
+    """Run `sql` once: keep the first `max_rows` rows, count the rest and spill them all to Parquet."""
+    if spill:
+        prune_spills()
+    cur = conn.execute(sql)
+    try:
+        columns = [d[0] for d in cur.description or []]
+        rows: list = []
+        while len(rows) < max_rows:
+            batch = cur.fetchmany(min(batch_size, max_rows - len(rows)))
+            if not batch:
+                break
+            rows.extend(batch)
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        batch = cur.fetchmany(batch_size) if len(rows) == max_rows else []
+        if not batch:
+            return QueryResult(df=df, row_count=len(df))
+
+        row_count = len(rows)
+        sink = _write_spill(_open_spill(sql, columns) if spill else None, rows)
+        try:
+            while batch:
+                row_count += len(batch)
+                sink = _write_spill(sink, batch)
+                batch = cur.fetchmany(batch_size)
+        except BaseException as e:
+            if sink is not None:
+                sink.abort()
+            if not _interrupted(e):
+                raise
+            lg.warning(f"query interrupted after {row_count} rows; keeping the preview – {sql}")
+            return QueryResult(df=df, row_count=row_count, count_exact=False)
+        return QueryResult(df=df, row_count=row_count, spill_path=sink.close() if sink is not None else None)
+    finally:
+        cur.close()
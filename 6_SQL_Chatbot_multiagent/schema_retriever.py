@@ -0,0 +1,117 @@
+"""
+Embedding-based table retriever for schema-scoped SQL prompts.
+
+Each table gets one document built from its `table_definitions.md` section,
+its `structured_memory.json` entry and its catalog columns. Documents are
+embedded once; per question we embed the query, rank tables by cosine
+similarity and hand only the top-k tables' DDL to the SQL generator, so the
+prompt stays the same size however large the schema grows.
+"""
+import hashlib
+import logging
+import re
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+EMBED_MODEL = "text-embedding-3-small"
+HASH_DIM = 1024
+
+_SECTION = re.compile(r"^###\s+\d+\.\s+(\w+)", re.MULTILINE)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+lg = logging.getLogger("sql_graph")
+
+Embedder = Callable[[list], np.ndarray]
+
+
+def table_documents(table_defs_md: str, memory: dict, columns: dict) -> dict:
+    """Return {table: descriptive text} for every table in `columns`."""
+    sections: dict = {}
+    matches = list(_SECTION.finditer(table_defs_md))
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(table_defs_md)
+        sections[m.group(1)] = table_defs_md[m.start():end]
+    docs = {}
+    for tbl, cols in columns.items():
+        mem = memory.get(tbl, {})
+        parts = [
+            tbl.replace("_", " "),
+            mem.get("description", ""),
+            "keys: " + ", ".join(mem.get("keys", [])),
+            "related: " + ", ".join(mem.get("relationships", {})),
+            "columns: " + ", ".join(c.replace("_", " ") for c in cols),
+            sections.get(tbl, ""),
+        ]
+        docs[tbl] = "\n".join(p for p in parts if p.strip())
+    return docs
+
+
+def hashing_embedder(texts: list) -> np.ndarray:
+    """Local fallback: L2-normalized hashed bag of words and word bigrams."""
+    out = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _TOKEN.findall(text.lower())
+        for tok in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(tok.encode(), digest_size=4).digest(), "little")
+            out[row, h % HASH_DIM] += 1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.where(norms == 0, 1, norms)
+
+
+def openai_embedder(client, model: str = EMBED_MODEL) -> Embedder:
+    def embed(texts: list) -> np.ndarray:
+        resp = client.embeddings.create(model=model, input=texts)
+        vecs = np.array([d.embedding for d in resp.data], dtype=np.float32)
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    return embed
+
+
+class SchemaRetriever:
+    """Ranks tables by similarity between the question and pre-embedded table docs."""
+
+    def __init__(self, docs: dict, embed: Embedder):
+        self.tables = list(docs)
+        self.texts = [docs[t] for t in self.tables]
+        self.embed = embed
+        try:
+            self.matrix = embed(self.texts)
+        except Exception as e:
+            self._fall_back(e)
+
+    def _fall_back(self, error: Exception) -> None:
+        lg.warning(f"schema_retriever: embedding failed ({error}); using local hashing embedder")
+        self.embed = hashing_embedder
+        self.matrix = hashing_embedder(self.texts)
+
+    def scores(self, query: str) -> dict:
+        try:
+            q = self.embed([query])[0]
+        except Exception as e:
+            if self.embed is hashing_embedder:
+                raise
+            self._fall_back(e)
+            q = self.embed([query])[0]
+        return dict(zip(self.tables, (self.matrix @ q).tolist()))
+
+    def top_k(self, query: str, k: int, within: Optional[set] = None) -> list:
+        ranked = sorted(self.scores(query).items(), key=lambda kv: kv[1], reverse=True)
+        return [t for t, _ in ranked if within is None or t in within][:k]
+
+
+_RETRIEVERS: dict = {}
+_RETRIEVERS_LOCK = threading.Lock()
+
+
+def get_retriever(docs: dict, embed: Optional[Embedder] = None) -> SchemaRetriever:
+    """Return a retriever for `docs`, embedding them only the first time they are seen.
+
+    Falls back to the local hashing embedder if `embed` fails (no key/offline).
+    """
+    key = hashlib.sha1(repr(sorted(docs.items())).encode()).hexdigest()
+    with _RETRIEVERS_LOCK:
+        retriever = _RETRIEVERS.get(key)
+        if retriever is None:
+            retriever = _RETRIEVERS[key] = SchemaRetriever(docs, embed or hashing_embedder)
+        return retriever
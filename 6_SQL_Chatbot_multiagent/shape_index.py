@@ -0,0 +1,316 @@
+"""
+In-memory spatial index over `gtfs_shape` for nearest-route questions.
+
+The shape points are projected to local metres and consecutive points of a
+shape become segments. Each segment goes into every cell of a uniform grid
+(`CELL_M` metres) that its bounding box touches. A lookup only scans the
+segments in the cells around the point, widening ring by ring until the best
+match cannot be beaten, so a query costs a few dozen segment projections
+instead of a scan over the whole table.
+
+`register_sql_functions` exposes the index to SQL on any connection:
+
+    SELECT vid, nearest_route(lat, lon), distance_to_route_m(lat, lon, rt) FROM getvehicles
+
+The index is built once per DB file version and shared by the whole process.
+"""
+import math
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from result_cache import db_version
+
+CELL_M = 250.0          # grid cell size in metres
+MAX_SEARCH_M = 5000.0   # give up beyond this distance from any shape
+EARTH_R = 6371008.8     # metres
+
+
+def _cell_key(gx, gy):
+    """One sortable int64 per grid cell (works on scalars and arrays)."""
+    return (gx + (1 << 30)) * (1 << 31) + (gy + (1 << 30))
+
+
+@dataclass(frozen=True)
+class Match:
+    shape_id: str
+    route_id: str
+    distance_m: float   # from the point to the shape
+    along_m: float      # distance along the shape to the snapped point
+    shape_length_m: float
+
+
+class ShapeIndex:
+    """Grid index over gtfs_shape segments (one row per consecutive point pair)."""
+
+    def __init__(self, shape_ids, route_ids, lat, lon, along):
+        shape_ids = np.asarray(shape_ids, dtype=object)
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        along = np.asarray(along, dtype=float)
+        self.lat0 = float(np.nanmean(lat)) if len(lat) else 0.0
+        self.lon0 = float(np.nanmean(lon)) if len(lon) else 0.0
+        self._kx = math.radians(1) * EARTH_R * math.cos(math.radians(self.lat0))
+        self._ky = math.radians(1) * EARTH_R
+        x, y = self.project(lat, lon)
+
+        same = shape_ids[1:] == shape_ids[:-1]            # segments never join two shapes
+        start = np.flatnonzero(same)
+        self.shape_names, shape_codes = np.unique(shape_ids, return_inverse=True)
+        self.seg_shape = shape_codes[start]
+        self.x1, self.y1, self.x2, self.y2 = x[start], y[start], x[start + 1], y[start + 1]
+        self.a1, self.a2 = along[start], along[start + 1]
+        self.route_of_shape = {}
+        self.shape_length = {}
+        for code, name in enumerate(self.shape_names):
+            rows = np.flatnonzero(shape_codes == code)
+            self.route_of_shape[name] = str(np.asarray(route_ids, dtype=object)[rows[0]])
+            self.shape_length[name] = float(np.nanmax(along[rows]))
+        routes = np.array([self.route_of_shape[s] for s in self.shape_names], dtype=object)
+        self.seg_route = routes[self.seg_shape]
+        self._by_route = {r: np.flatnonzero(self.seg_route == r) for r in np.unique(routes)}
+        self._by_shape = {s: np.flatnonzero(self.seg_shape == i) for i, s in enumerate(self.shape_names)}
+        self._build_grid()
+
+    # -- construction ---------------------------------------------------------
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection) -> "ShapeIndex":
+        rows = conn.execute(
+            "SELECT shape_id, route_id, latitude, longitude, distance FROM gtfs_shape "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL ORDER BY shape_id, sequence"
+        ).fetchall()
+        if not rows:
+            return cls([], [], [], [], [])
+        shape_ids, route_ids, lat, lon, along = zip(*rows)
+        return cls(shape_ids, route_ids, lat, lon, [a if a is not None else np.nan for a in along])
+
+    def project(self, lat, lon):
+        """Equirectangular projection to metres around the network centre."""
+        return ((np.asarray(lon, dtype=float) - self.lon0) * self._kx,
+                (np.asarray(lat, dtype=float) - self.lat0) * self._ky)
+
+    def _build_grid(self) -> None:
+        cx1 = self._cx1 = np.floor(np.minimum(self.x1, self.x2) / CELL_M).astype(np.int64)
+        cx2 = self._cx2 = np.floor(np.maximum(self.x1, self.x2) / CELL_M).astype(np.int64)
+        cy1 = self._cy1 = np.floor(np.minimum(self.y1, self.y2) / CELL_M).astype(np.int64)
+        cy2 = self._cy2 = np.floor(np.maximum(self.y1, self.y2) / CELL_M).astype(np.int64)
+        self._hoods: dict = {}   # per segment set, see _neighbourhoods
+        cells: dict = {}
+        for seg, (ax, bx, ay, by) in enumerate(zip(cx1, cx2, cy1, cy2)):
+            for gx in range(ax, bx + 1):
+                for gy in range(ay, by + 1):
+                    cells.setdefault((gx, gy), []).append(seg)
+        self.grid = {cell: np.array(segs, dtype=np.int64) for cell, segs in cells.items()}
+
+    # -- queries --------------------------------------------------------------
+
+    def _project_onto(self, segs: np.ndarray, x: float, y: float):
+        """(distance, fraction along segment) from (x, y) to each segment in `segs`."""
+        dx, dy = self.x2[segs] - self.x1[segs], self.y2[segs] - self.y1[segs]
+        length2 = dx * dx + dy * dy
+        t = np.where(length2 > 0, ((x - self.x1[segs]) * dx + (y - self.y1[segs]) * dy) / np.where(length2 > 0, length2, 1), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        px, py = self.x1[segs] + t * dx, self.y1[segs] + t * dy
+        return np.hypot(px - x, py - y), t
+
+    def _match(self, segs: np.ndarray, x: float, y: float) -> Optional[Match]:
+        if segs.size == 0:
+            return None
+        dist, t = self._project_onto(segs, x, y)
+        best = int(np.argmin(dist))
+        seg = segs[best]
+        shape = self.shape_names[self.seg_shape[seg]]
+        along = self.a1[seg] + t[best] * (self.a2[seg] - self.a1[seg])
+        return Match(shape, self.route_of_shape[shape], float(dist[best]), float(along), self.shape_length[shape])
+
+    def segments_of(self, shape_id: Optional[str] = None, route_id=None) -> Optional[np.ndarray]:
+        """Segment ids of one shape or of every shape of one route."""
+        if shape_id is not None:
+            return self._by_shape.get(shape_id)
+        if isinstance(route_id, float) and route_id.is_integer():
+            route_id = int(route_id)
+        return self._by_route.get(str(route_id))
+
+    def _neighbourhoods(self, segs: np.ndarray):
+        """Sorted cell keys and a padded (cells x K) table of the `segs` within one cell of each."""
+        cache_key = (int(segs[0]), int(segs[-1]), len(segs))
+        cached = self._hoods.get(cache_key)
+        if cached is not None:
+            return cached
+        near: dict = {}
+        for seg in segs:
+            for gx in range(self._cx1[seg] - 1, self._cx2[seg] + 2):
+                for gy in range(self._cy1[seg] - 1, self._cy2[seg] + 2):
+                    near.setdefault((gx, gy), set()).add(int(seg))
+        cells = sorted(near, key=lambda c: _cell_key(*c))
+        width = max((len(near[c]) for c in cells), default=0)
+        table = np.full((len(cells), width), -1, dtype=np.int64)
+        for row, cell in enumerate(cells):
+            table[row, :len(near[cell])] = sorted(near[cell])
+        keys = np.array([_cell_key(*c) for c in cells], dtype=np.int64)
+        self._hoods[cache_key] = (keys, table)
+        return keys, table
+
+    def _nearest_of(self, cand: np.ndarray, x: np.ndarray, y: np.ndarray):
+        """Best (segment, fraction, squared distance) per row of `cand` (-1 = padding)."""
+        valid = cand >= 0
+        c = np.where(valid, cand, 0)
+        x1, y1 = self.x1[c], self.y1[c]
+        dx, dy = self.x2[c] - x1, self.y2[c] - y1
+        px, py = x[:, None] - x1, y[:, None] - y1
+        length2 = dx * dx + dy * dy
+        t = np.clip(np.divide(px * dx + py * dy, length2, out=np.zeros_like(length2), where=length2 > 0), 0.0, 1.0)
+        d2 = np.where(valid, (px - t * dx) ** 2 + (py - t * dy) ** 2, np.inf)
+        best = np.argmin(d2, axis=1)
+        rows = np.arange(len(best))
+        return c[rows, best], t[rows, best], d2[rows, best]
+
+    def snap(self, segs: np.ndarray, lat, lon, chunk_cells: int = 4_000_000):
+        """Vectorized snapping of many points to the segments `segs`.
+
+        Returns (distance_m, along_m, shape index into `shape_names`) arrays.
+        Each point only tests the segments in the 3 x 3 grid cells around it,
+        which is exact for anything within one cell; points farther than that
+        from every segment fall back to a scan over all of `segs`. Work is
+        chunked so no points x segments matrix exceeds `chunk_cells` elements.
+        """
+        x, y = self.project(lat, lon)
+        x, y = np.atleast_1d(x), np.atleast_1d(y)
+        n = len(x)
+        seg, t, d2 = np.zeros(n, dtype=np.int64), np.zeros(n), np.full(n, np.inf)
+        keys, table = self._neighbourhoods(segs)
+        if keys.size:
+            cell = _cell_key(np.floor(x / CELL_M).astype(np.int64), np.floor(y / CELL_M).astype(np.int64))
+            pos = np.minimum(np.searchsorted(keys, cell), len(keys) - 1)
+            rows = np.flatnonzero(keys[pos] == cell)
+            step = max(1, chunk_cells // table.shape[1])
+            for lo in range(0, rows.size, step):
+                r = rows[lo:lo + step]
+                seg[r], t[r], d2[r] = self._nearest_of(table[pos[r]], x[r], y[r])
+        far = np.flatnonzero(d2 > CELL_M * CELL_M)
+        step = max(1, chunk_cells // len(segs))
+        for lo in range(0, far.size, step):
+            r = far[lo:lo + step]
+            seg[r], t[r], d2[r] = self._nearest_of(np.broadcast_to(segs, (r.size, len(segs))), x[r], y[r])
+        along = self.a1[seg] + t * (self.a2[seg] - self.a1[seg])
+        return np.sqrt(d2), along, self.seg_shape[seg]
+
+    def nearest(self, lat: float, lon: float, max_m: float = MAX_SEARCH_M) -> Optional[Match]:
+        """Closest shape to the point, or None if none is within `max_m`."""
+        if lat is None or lon is None or not self.grid:
+            return None
+        x, y = self.project(lat, lon)
+        x, y = float(x), float(y)
+        gx, gy = int(math.floor(x / CELL_M)), int(math.floor(y / CELL_M))
+        best = None
+        for ring in range(int(max_m // CELL_M) + 2):
+            cells = [(gx + i, gy + j) for i in range(-ring, ring + 1) for j in range(-ring, ring + 1)
+                     if max(abs(i), abs(j)) == ring]
+            segs = [self.grid[c] for c in cells if c in self.grid]
+            if segs:
+                found = self._match(np.unique(np.concatenate(segs)), x, y)
+                if found and (best is None or found.distance_m < best.distance_m):
+                    best = found
+            # Anything in a further ring is at least ring * CELL_M away
+            if best is not None and best.distance_m <= ring * CELL_M:
+                break
+        return best if best is not None and best.distance_m <= max_m else None
+
+    def on_route(self, lat: float, lon: float, route_id) -> Optional[Match]:
+        """Closest point on any shape of `route_id`."""
+        segs = self.segments_of(route_id=route_id)
+        if segs is None or lat is None or lon is None:
+            return None
+        x, y = self.project(lat, lon)
+        return self._match(segs, float(x), float(y))
+
+    def on_shape(self, lat: float, lon: float, shape_id: str) -> Optional[Match]:
+        """Closest point on `shape_id` (for snapping a ping to its trip's shape)."""
+        segs = self.segments_of(shape_id=shape_id)
+        if segs is None or lat is None or lon is None:
+            return None
+        x, y = self.project(lat, lon)
+        return self._match(segs, float(x), float(y))
+
+
+def register_sql_functions(conn: sqlite3.Connection, db_path) -> None:
+    """Add nearest_shape/nearest_route/distance_to_route_m/... to `conn`.
+
+    The index is built lazily on first use, so connections that never call
+    these functions pay nothing.
+    They are not declared deterministic: the answer depends on the shapes in
+    the file, so SQLite must not use them in indexes or generated columns.
+    """
+    def index() -> ShapeIndex:
+        return get_shape_index(db_path)
+
+    def field(match: Optional[Match], name: str):
+        return None if match is None else getattr(match, name)
+
+    conn.create_function("nearest_shape", 2, lambda lat, lon: field(index().nearest(lat, lon), "shape_id"))
+    conn.create_function("nearest_route", 2, lambda lat, lon: field(index().nearest(lat, lon), "route_id"))
+    conn.create_function("distance_to_nearest_shape_m", 2,
+                         lambda lat, lon: field(index().nearest(lat, lon), "distance_m"))
+    conn.create_function("distance_to_route_m", 3,
+                         lambda lat, lon, route: field(index().on_route(lat, lon, route), "distance_m"))
+    conn.create_function("distance_to_shape_m", 3,
+                         lambda lat, lon, shape: field(index().on_shape(lat, lon, shape), "distance_m"))
+    conn.create_function("shape_progress_m", 3,
+                         lambda lat, lon, shape: field(index().on_shape(lat, lon, shape), "along_m"))
+
+
+SQL_FUNCTIONS_DOC = """\
+Spatial SQL functions (metres; NULL when nothing matches):
+- nearest_route(lat, lon), nearest_shape(lat, lon), distance_to_nearest_shape_m(lat, lon)
+- distance_to_route_m(lat, lon, route_id) – e.g. off-route if > 100
+- distance_to_shape_m(lat, lon, shape_id), shape_progress_m(lat, lon, shape_id) – distance along the shape"""
+
+
+_INDEXES: dict = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_shape_index(db_path) -> ShapeIndex:
+    """Return the shared index for `db_path`, rebuilt if the file has changed."""
+    key = str(Path(db_path).resolve())
+    version = db_version(key)
+    with _INDEXES_LOCK:
+        entry = _INDEXES.get(key)
+        if entry is None or entry[0] != version:
+            conn = sqlite3.connect(f"file:{key}?mode=ro", uri=True)
+            try:
+                entry = _INDEXES[key] = (version, ShapeIndex.from_connection(conn))
+            finally:
+                conn.close()
+        return entry[1]
+
+
+if __name__ == "__main__":
+    # Benchmark: python shape_index.py [vehicles.db]
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "vehicles.db"
+    start = time.perf_counter()
+    idx = get_shape_index(path)
+    print(f"built index over {len(idx.x1):,} segments / {len(idx.grid):,} cells in {time.perf_counter() - start:.2f}s")
+    conn = sqlite3.connect(f"file:{Path(path).resolve()}?mode=ro", uri=True)
+    pings = conn.execute("SELECT lat, lon FROM getvehicles WHERE lat IS NOT NULL").fetchall()
+    rng = np.random.default_rng(0)
+    points = [pings[i] for i in rng.integers(0, len(pings), 10_000)] if pings else []
+    start = time.perf_counter()
+    for lat, lon in points:
+        idx.nearest(lat, lon)
+    elapsed = time.perf_counter() - start
+    if points:
+        print(f"nearest(): {elapsed / len(points) * 1e6:.0f} µs per lookup over {len(points):,} pings")
+    lat, lon = pings[0] if pings else (idx.lat0, idx.lon0)
+    x, y = idx.project(lat, lon)
+    start = time.perf_counter()
+    idx._project_onto(np.arange(len(idx.x1)), float(x), float(y))
+    print(f"full scan : {(time.perf_counter() - start) * 1e6:.0f} µs per lookup")
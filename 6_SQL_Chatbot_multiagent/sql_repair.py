@@ -0,0 +1,214 @@
+"""
+Error-guided repair of failed SQL.
+
+`local_fix` handles the usual LLM mistakes without another LLM call. It
+fuzzy-matches unknown columns and tables against the schema catalog,
+rewrites PostgreSQL/SQL Server functions and syntax into SQLite, and fixes
+quoting: smart quotes, double-quoted values, markdown fences. It re-prepares
+the query after each change, so a query with several mistakes is fixed
+step by step. A fix is returned only if the final SQL compiles.
+
+When that fails, `repair_messages` builds a compact LLM prompt. It has the
+failing SQL, the error and, for unknown names, the columns of the tables the
+query uses, instead of the full generation prompt.
+
+    python sql_repair.py vehicles.db        # how many sample failures are fixed locally
+"""
+import argparse
+import difflib
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+MAX_LOCAL_STEPS = 4
+
+_NO_COLUMN = re.compile(r"no such column: (?:(\w+)\.)?(\S+)", re.I)
+_NO_TABLE = re.compile(r"no such table: (?:\w+\.)?(\S+)", re.I)
+_NO_FUNCTION = re.compile(r"no such function: (\w+)", re.I)
+_TABLE_REF = re.compile(r'\b(?:from|join)\s+["`\[]?(\w+)', re.I)
+_FENCE = re.compile(r"^```(?:sql)?\s*|\s*```$", re.I)
+_SMART_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+_CAST_TYPES = {"int": "INTEGER", "integer": "INTEGER", "bigint": "INTEGER", "smallint": "INTEGER",
+               "numeric": "REAL", "float": "REAL", "real": "REAL", "double": "REAL", "decimal": "REAL",
+               "text": "TEXT", "varchar": "TEXT", "char": "TEXT"}
+_BUCKETS = {"minute": "1 minute", "hour": "1 hour", "day": "1 day", "week": "1 week"}
+
+# PostgreSQL / SQL Server → SQLite (time_bucket is registered by timeseries.py)
+DIALECT_REWRITES = (
+    ("NOW() → CURRENT_TIMESTAMP", re.compile(r"\b(?:now|getdate|sysdate)\s*\(\s*\)", re.I), "CURRENT_TIMESTAMP"),
+    ("ILIKE → LIKE", re.compile(r"\bilike\b", re.I), "LIKE"),
+    ("string_agg → group_concat", re.compile(r"\bstring_agg\s*\(", re.I), "group_concat("),
+    ("isnull/nvl → ifnull", re.compile(r"\b(?:isnull|nvl)\s*\(", re.I), "ifnull("),
+    ("len → length", re.compile(r"\blen\s*\(", re.I), "length("),
+    ("date_trunc → time_bucket", re.compile(r"\bdate_trunc\s*\(\s*'(minute|hour|day|week)'\s*,\s*([^()]+?)\)", re.I),
+     lambda m: f"time_bucket({m.group(2).strip()}, '{_BUCKETS[m.group(1).lower()]}')"),
+    ("x::type → CAST", re.compile(r"((?:\b[\w.]+)|(?:'[^']*'))::(\w+)", re.I),
+     lambda m: f"CAST({m.group(1)} AS {_CAST_TYPES.get(m.group(2).lower(), m.group(2).upper())})"),
+    ("dropped NULLS FIRST/LAST", re.compile(r"\bnulls\s+(first|last)\b", re.I), ""),
+)
+_TOP = re.compile(r"^\s*select\s+(distinct\s+)?top\s+(\d+)\s+", re.I)
+
+
+@dataclass
+class Repair:
+    sql: str
+    notes: list = field(default_factory=list)
+
+
+def clean_sql(text: str) -> str:
+    """Strip markdown fences, smart quotes and a trailing semicolon from LLM output."""
+    text = _FENCE.sub("", (text or "").strip()).strip()
+    return text.translate(_SMART_QUOTES).rstrip(";").strip()
+
+
+def referenced_tables(sql: str) -> list:
+    return list(dict.fromkeys(_TABLE_REF.findall(sql)))
+
+
+def _closest(name: str, candidates) -> Optional[str]:
+    """Best fuzzy match, ignoring case and underscores ('vehicle_id' ~ 'vid' won't, 'startsoc' ~ 'start_soc' will)."""
+    by_key = {c.lower().replace("_", ""): c for c in candidates}
+    key = name.lower().replace("_", "")
+    if key in by_key:
+        return by_key[key]
+    match = difflib.get_close_matches(key, list(by_key), n=1, cutoff=0.75)
+    return by_key[match[0]] if match else None
+
+
+def _replace_identifier(sql: str, old: str, new: str) -> str:
+    return re.sub(rf'(?<![\w\'])(["`]?){re.escape(old)}\1(?![\w\'])', new, sql)
+
+
+def _rewrite_dialect(sql: str, notes: list) -> str:
+    for label, pattern, replacement in DIALECT_REWRITES:
+        sql, n = pattern.subn(replacement, sql)
+        if n:
+            notes.append(label)
+    top = _TOP.match(sql)
+    if top:
+        sql = f"SELECT {top.group(1) or ''}{sql[top.end():]} LIMIT {top.group(2)}"
+        notes.append("TOP n → LIMIT n")
+    return sql
+
+
+def _fix_once(sql: str, error: str, columns_of: Callable[[str], list], tables: list) -> Optional[tuple]:
+    """One repair step for `error`; returns (new sql, note) or None."""
+    m = _NO_COLUMN.search(error)
+    if m:
+        qualifier, name = m.group(1), m.group(2)
+        scope = [qualifier] if qualifier and qualifier in tables else (referenced_tables(sql) or tables)
+        candidates = [c for t in scope for c in columns_of(t)]
+        target = _closest(name, candidates)
+        if target:
+            return _replace_identifier(sql, name, target), f"column {name} → {target}"
+        if f'"{name}"' in sql:  # "value" used as a string literal
+            return sql.replace(f'"{name}"', f"'{name}'"), f'"{name}" → \'{name}\''
+        return None
+    m = _NO_TABLE.search(error)
+    if m:
+        target = _closest(m.group(1), tables)
+        return (_replace_identifier(sql, m.group(1), target), f"table {m.group(1)} → {target}") if target else None
+    if _NO_FUNCTION.search(error) or "syntax error" in error.lower() or "unrecognized token" in error.lower():
+        notes: list = []
+        fixed = _rewrite_dialect(sql, notes)
+        return (fixed, "; ".join(notes)) if fixed != sql else None
+    return None
+
+
+def local_fix(sql: str, error: str, catalog, prepare: Callable[[str], None]) -> Optional[Repair]:
+    """Repair `sql` for `error` without an LLM; None unless the result compiles.
+
+    `prepare(sql)` must raise sqlite3.Error for SQL that does not compile
+    (e.g. run EXPLAIN on a pooled connection).
+    """
+    tables = sorted(catalog.table_names())
+
+    def columns_of(table: str) -> list:
+        t = catalog.get(table)
+        return t.column_names if t else []
+
+    current = clean_sql(sql)
+    notes = []
+    if current != sql.strip().rstrip(";"):
+        notes.append("cleaned quotes/fences")
+        try:
+            prepare(current)
+            return Repair(current, notes)
+        except sqlite3.Error as e:
+            error = str(e)
+    for _ in range(MAX_LOCAL_STEPS):
+        step = _fix_once(current, error, columns_of, tables)
+        if step is None:
+            return None
+        current = step[0]
+        notes.append(step[1])
+        try:
+            prepare(current)
+            return Repair(current, notes)
+        except sqlite3.Error as e:
+            error = str(e)
+    return None
+
+
+def repair_messages(sql: str, error: str, catalog) -> list:
+    """Compact chat messages asking an LLM to fix `sql` for `error`."""
+    context = ""
+    if _NO_COLUMN.search(error) or _NO_TABLE.search(error):
+        names = referenced_tables(sql)
+        cols = [f"{t}({', '.join(catalog.get(t).column_names)})" for t in names if catalog.get(t)]
+        context = "\n\nAvailable: " + ("; ".join(cols) if cols else ", ".join(sorted(catalog.table_names())))
+    return [
+        {"role": "system", "content": "Fix this SQLite query. Change only what the error requires. "
+                                      "Return only the corrected SQL, no markdown, no commentary."},
+        {"role": "user", "content": f"SQL:\n{sql}\n\nError:\n{error}{context}"},
+    ]
+
+
+SAMPLE_FAILURES = (
+    "SELECT vid, startsoc, end_soc FROM trip_event_bustime WHERE vid = 2402",
+    "SELECT vid, kwh_mile FROM trip_event_bustime WHERE rt = ’2’ ORDER BY start_timestamp DESC LIMIT 5",
+    "SELECT vid, lat, lon FROM getvehicle ORDER BY timestamp DESC LIMIT 5",
+    "SELECT TOP 5 vid, kwh_mile FROM trip_event_bustime ORDER BY kwh_mile DESC",
+    "SELECT rt, string_agg(vid::text, ',') FROM trip_event_bustime WHERE start_soc::int > 90 GROUP BY rt",
+    "SELECT vid, AVG(kwh_mile) FROM trip_event_bustime WHERE rt ILIKE '2' GROUP BY vid",
+    "SELECT date_trunc('day', start_timestamp) AS d, SUM(energy_used) FROM trip_event_bustime GROUP BY d",
+    "```sql\nSELECT vid, miles_drivn, energy_usd FROM trip_event_bustime LIMIT 3;\n```",
+    "SELECT vid, MAX(start_soc - end_soc) FROM trip_event_bustime GROUP BY vid HAVING MAX(start_soc - end_soc) > 10 AND isnull(rt, '') <> ''",
+    "SELECT vid, soc FROM trip_event_bustime",
+)
+
+
+def bench(db_path) -> None:
+    """How many of SAMPLE_FAILURES the local fixer repairs, and how fast."""
+    from schema_catalog import SchemaCatalog
+    from timeseries import register_timeseries_functions
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    register_timeseries_functions(conn)
+    catalog = SchemaCatalog(db_path)
+
+    def prepare(sql):
+        conn.execute(f"EXPLAIN {sql}")
+
+    fixed = 0
+    for sql in SAMPLE_FAILURES:
+        try:
+            prepare(sql)
+            error = ""
+        except sqlite3.Error as e:
+            error = str(e)
+        start = time.perf_counter()
+        repair = local_fix(sql, error, catalog, prepare)
+        elapsed = (time.perf_counter() - start) * 1000
+        fixed += repair is not None
+        status = "; ".join(repair.notes) if repair else "→ LLM repair"
+        print(f"{elapsed:6.1f} ms  {' '.join(error.split())[:40]:40}  {status}")
+    print(f"fixed locally: {fixed}/{len(SAMPLE_FAILURES)} (each saves a generation call and a retry)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("db", nargs="?", default="vehicles.db")
+    bench(parser.parse_args().db)
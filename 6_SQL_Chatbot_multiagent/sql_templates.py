@@ -0,0 +1,190 @@
+"""
+Parameterized SQL templates learned from successful runs.
+
+Questions that differ only in a bus, block, route or date ("SOC of bus 2402
+on 2025-06-18" / "SOC of bus 2403 on 2025-06-19") share a *shape*: the
+normalized question with those literals replaced by placeholders. When a
+run succeeds (no error, at least one row), `learn` finds each extracted
+literal where the executed SQL compares against it (`col = '2'`, `col IN
+(...)`, `BETWEEN`, `LIKE`) and stores the SQL with those literals replaced
+by slots, keyed by (shape, schema key); the same token elsewhere
+(`ROUND(x, 2)`, `LIMIT 2`) is left alone. A question about a relative time
+("today", "last week") or with a date is not learned when its SQL still holds
+a fixed date or epoch after that: the date was derived from the question and
+would be wrong for the next one. `lookup` binds the new literals into a
+stored template, so a repeated question shape skips the LLM. Literals are only ever digits, letters and
+dashes, so binding them into SQL text is safe. A template that later fails is
+dropped with `forget`.
+
+Templates live in a small SQLite file (`SQL_TEMPLATES`), shared by all
+sessions and kept across restarts.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+TEMPLATES_PATH = os.getenv("SQL_TEMPLATES", "sql_templates.db")
+
+# (kind, pattern with the literal in group 1), tried in order
+LITERALS = (
+    ("date", re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")),
+    ("vid", re.compile(r"\b(?:bus|vehicle|vid|unit|coach)(?:es|s)?\s*(?:#|no\.?|number|id)?\s*(\d{3,5})\b")),
+    ("block", re.compile(r"\bblock\s*(?:#|id)?\s*(\d+[a-z]?)\b")),
+    ("route", re.compile(r"\broute\s*(?:#|id)?\s*(\d+[a-z]?)\b")),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    shape      TEXT NOT NULL,
+    schema_key TEXT NOT NULL,
+    kinds      TEXT NOT NULL,
+    sql        TEXT NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0,
+    learned_at REAL NOT NULL,
+    used_at    REAL,
+    PRIMARY KEY (shape, schema_key)
+);
+"""
+
+
+@dataclass(frozen=True)
+class Template:
+    shape: str
+    sql: str          # bound SQL, ready to run
+    hits: int
+
+
+def extract(question: str) -> tuple:
+    """'Where is bus 2402?' → ('where is bus <vid>', [('vid', '2402')])."""
+    text = " ".join(question.lower().split()).rstrip("?.! ")
+    found = []
+    for kind, pattern in LITERALS:
+        for m in pattern.finditer(text):
+            start, end = m.span(1)
+            if all(end <= s or start >= e for s, e, _, _ in found):
+                found.append((start, end, kind, m.group(1)))
+    found.sort()  # slots are numbered in question order
+    shape, pos = [], 0
+    for start, end, kind, _ in found:
+        shape.append(text[pos:start] + f"<{kind}>")
+        pos = end
+    shape.append(text[pos:])
+    return "".join(shape), [(kind, value) for _, _, kind, value in found]
+
+
+# The SQL just before a literal that a column is compared against (quote included)
+_COMPARED = re.compile(
+    r"(?:[=<>]|\blike|\bbetween|\bbetween\s+(?:'[^']*'|[\w.:-]+)\s+and)\s*'?$"
+    r"|\bin\s*\([^()]*$",
+    re.I,
+)
+_RELATIVE_TIME = re.compile(
+    r"\b(?:now|today|tonight|yesterday|tomorrow|ago|recent|recently|latest|current|currently|"
+    r"this|last|past|next|previous)\b"
+)
+_FIXED_TIME = re.compile(r"\d{4}-\d{2}-\d{2}|(?<!\d)1\d{9}(?!\d)")  # a date or an epoch in seconds
+
+
+def _occurrences(value: str) -> re.Pattern:
+    """`value` as a whole SQL token, bare or inside a string literal."""
+    return re.compile(rf"(?<![\w.]){re.escape(value)}(?![\w.])", re.I)
+
+
+def parameterize(sql: str, params: list) -> Optional[str]:
+    """SQL with each compared literal replaced by {p0}, {p1}, ...; None if that is not safe."""
+    values = [value for _, value in params]
+    if len(set(values)) != len(values) or "{p" in sql:
+        return None  # the same value twice would be ambiguous
+    template = sql
+    for i, value in enumerate(values):
+        spans = [m.span() for m in _occurrences(value).finditer(template)
+                 if _COMPARED.search(template, 0, m.start())]
+        if not spans:
+            return None  # the literal was transformed (e.g. a date turned into an epoch)
+        for start, end in reversed(spans):
+            template = f"{template[:start]}{{p{i}}}{template[end:]}"
+    return template
+
+
+def bind(template: str, params: list) -> str:
+    for i, (_, value) in enumerate(params):
+        template = template.replace(f"{{p{i}}}", value)
+    return template
+
+
+def schema_key(columns: dict) -> str:
+    """Short fingerprint of {table: [column, ...]}; templates never outlive a schema change."""
+    text = ";".join(f"{t}:{','.join(cols)}" for t, cols in sorted(columns.items()))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class TemplateStore:
+    """Thread-safe, SQLite-backed (shape, schema) → SQL template map."""
+
+    def __init__(self, path=TEMPLATES_PATH):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, key: str) -> Optional[Template]:
+        shape, params = extract(question)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT kinds, sql, hits FROM templates WHERE shape = ? AND schema_key = ?", (shape, key)
+            ).fetchone()
+            if row is None or row[0] != ",".join(kind for kind, _ in params):
+                return None
+            self._conn.execute(
+                "UPDATE templates SET hits = hits + 1, used_at = ? WHERE shape = ? AND schema_key = ?",
+                (time.time(), shape, key),
+            )
+        return Template(shape, bind(row[1], params), row[2] + 1)
+
+    def learn(self, question: str, sql: str, key: str) -> bool:
+        """Store the template behind a successful (question, sql); False if it can't be parameterized."""
+        shape, params = extract(question)
+        template = parameterize(sql.strip(), params)
+        if template is None:
+            return False
+        dated = _RELATIVE_TIME.search(shape) or any(kind == "date" for kind, _ in params)
+        if dated and _FIXED_TIME.search(template):
+            return False  # "today" or "the day after <date>" frozen into a fixed date
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO templates (shape, schema_key, kinds, sql, learned_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (shape, schema_key) DO UPDATE SET kinds = excluded.kinds, sql = excluded.sql, "
+                "learned_at = excluded.learned_at",
+                (shape, key, ",".join(kind for kind, _ in params), template, time.time()),
+            )
+        return True
+
+    def forget(self, shape: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM templates WHERE shape = ?", (shape,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, hits = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM templates").fetchone()
+        return {"templates": count, "hits": hits}
+
+
+_STORES: dict = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_template_store(path=TEMPLATES_PATH) -> TemplateStore:
+    """Return the process-wide store for `path`."""
+    key = str(Path(path).resolve())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = TemplateStore(key)
+        return store
@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from geofence import MAIN_YARD, Geofence, GeofenceSet, load_yards
+
+# Concave L: the notch at (1.5, 1.5) is outside
+L_SHAPE = [(0, 0), (0, 2), (1, 2), (1, 1), (2, 1), (2, 0)]
+
+
+def test_contains_handles_concave_polygons_on_arrays():
+    fence = Geofence("l", L_SHAPE)
+    lat = np.array([0.5, 1.5, 1.5, 0.5, 3.0])
+    lon = np.array([0.5, 0.5, 1.5, 1.5, 0.5])
+    assert fence.contains(lat, lon).tolist() == [True, True, False, True, False]
+    assert bool(fence.contains(0.5, 0.5))
+
+
+def test_a_fence_needs_three_vertices():
+    with pytest.raises(ValueError):
+        Geofence("line", [(0, 0), (1, 1)])
+
+
+def test_points_are_labelled_with_the_first_containing_yard():
+    yards = GeofenceSet.from_dict({"a": [(0, 0), (0, 2), (2, 2), (2, 0)], "b": [(1, 1), (1, 3), (3, 3), (3, 1)]})
+    assert yards.locate([1.5, 2.5, 5.0], [1.5, 2.5, 5.0]).tolist() == ["a", "b", None]
+
+
+def test_annotate_adds_yard_and_status_columns():
+    df = pd.DataFrame({"vid": [2401, 2402], "latitude": [33.9047, 34.0], "longitude": [-118.3105, -118.0]})
+    out = load_yards(None).annotate(df)
+    assert out["yard"].tolist()[0] == "main_yard" and pd.isna(out["yard"].tolist()[1])
+    assert out["location_status"].tolist() == ["inside_yard", "in-transit"]
+    assert "yard" not in df
+
+
+def test_yards_file_adds_and_overrides_yards(tmp_path):
+    path = tmp_path / "yards.json"
+    path.write_text(json.dumps({"north": L_SHAPE, "main_yard": L_SHAPE}))
+    yards = load_yards(str(path))
+    assert yards.names == ["main_yard", "north"]
+    assert not yards.fences[0].contains(*MAIN_YARD[0])
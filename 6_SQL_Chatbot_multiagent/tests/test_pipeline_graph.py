@@ -0,0 +1,44 @@
+import operator
+from typing import Annotated, TypedDict
+
+import pytest
+
+from pipeline_graph import NODES, build_graph
+
+SCHEMA = {"trip_history": ["vid"], "soc_logs": ["soc"], "prediction_models": ["soc"]}
+
+
+class State(TypedDict, total=False):
+    user_query: str
+    schema: dict
+    data_scope: str
+    candidate_tables: list
+    seen_by_selector: list
+    steps: Annotated[list, operator.add]
+
+
+def _nodes():
+    nodes = {name: (lambda state: {}) for name in NODES}
+    nodes["schema_loader"] = lambda state: {"schema": SCHEMA}
+
+    def scope_detector(state):
+        state["data_scope"] = "historical"  # mutates its input, like the app's node
+        return {"schema": {k: v for k, v in state["schema"].items() if k != "prediction_models"},
+                "data_scope": "historical"}
+
+    def table_selector(state):
+        return {"candidate_tables": list(state["schema"]), "seen_by_selector": sorted(state["schema"])}
+
+    nodes["scope_detector"] = scope_detector
+    nodes["table_selector"] = table_selector
+    nodes["metadata_handler"] = lambda state: {"skip_sql_generation": True}
+    return nodes
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_table_selector_sees_the_scope_filtered_schema(parallel):
+    graph = build_graph(State, _nodes(), lambda state: "answer", parallel=parallel)
+    out = graph.invoke({"user_query": "soc last year", "steps": []})
+    assert out["seen_by_selector"] == ["soc_logs", "trip_history"]
+    assert out["data_scope"] == "historical"
+    assert "prediction_models" not in out["schema"]
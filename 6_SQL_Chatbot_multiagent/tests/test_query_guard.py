@@ -0,0 +1,89 @@
+import sqlite3
+import time
+
+import pytest
+
+from query_guard import QueryRejected, check_query, resolve_aliases, strip_sql, time_budget
+
+
+@pytest.fixture
+def conn():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE shapes (shape_id TEXT, lat REAL, lon REAL)")
+    db.execute("CREATE TABLE trips (trip_id TEXT, shape_id TEXT)")
+    db.executemany("INSERT INTO shapes VALUES (?, 0, 0)", [(f"s{i % 50}",) for i in range(3000)])
+    db.executemany("INSERT INTO trips VALUES (?, ?)", [(f"t{i}", f"s{i % 50}") for i in range(400)])
+    return db
+
+
+def test_only_select_is_allowed(conn):
+    with pytest.raises(QueryRejected):
+        check_query(conn, "DELETE FROM shapes", 100)
+
+
+def test_large_scan_is_flagged_but_the_sql_is_not_limited(conn):
+    report = check_query(conn, "SELECT * FROM shapes", max_rows=100, large_table_rows=1000)
+    assert report.full_scans == ["shapes"]
+    assert report.sql == "SELECT * FROM shapes"  # the count and the spill need every row
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM shapes, trips",
+    "SELECT * FROM shapes a, trips b",
+    "SELECT * FROM shapes AS a CROSS JOIN trips AS b",
+])
+def test_cartesian_join_is_rejected_with_or_without_aliases(conn, sql):
+    with pytest.raises(QueryRejected, match="cartesian"):
+        check_query(conn, sql, max_rows=100, large_table_rows=1000)
+
+
+def test_aliases_resolve_to_their_tables(conn):
+    names = resolve_aliases(conn, "SELECT * FROM shapes a JOIN trips AS b ON a.shape_id = b.shape_id WHERE 1")
+    assert names["a"] == "shapes" and names["b"] == "trips" and "where" not in names
+
+
+def test_keyed_join_is_allowed(conn):
+    report = check_query(conn, "SELECT * FROM shapes s JOIN trips t ON t.shape_id = s.shape_id",
+                         max_rows=100, large_table_rows=1000)
+    assert not report.cartesian
+
+
+def test_trailing_comments_and_semicolons_are_stripped_but_literals_kept(conn):
+    assert strip_sql("SELECT '--x' AS a FROM shapes; -- all shapes") == "SELECT '--x' AS a FROM shapes"
+    report = check_query(conn, "SELECT * FROM shapes -- all shapes", max_rows=100)
+    assert report.sql == "SELECT * FROM shapes"
+    conn.execute(f"SELECT COUNT(*) FROM ({report.sql})")  # still composable
+
+
+def test_time_budget_interrupts_long_queries(conn):
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    start = time.monotonic()
+    with pytest.raises(QueryRejected, match="time budget"):
+        with time_budget(conn, 0.2):
+            conn.execute(slow).fetchone()
+    assert time.monotonic() - start < 5
+
+
+@pytest.fixture
+def partitioned(conn):
+    for month in ("202506", "202507"):
+        conn.execute(f"CREATE TABLE pings__p{month} (vid INTEGER, kwh_mile REAL)")
+        conn.executemany(f"INSERT INTO pings__p{month} VALUES (?, ?)", [(i % 20, 1.5) for i in range(3000)])
+    conn.execute("CREATE VIEW pings AS SELECT * FROM pings__p202506 UNION ALL SELECT * FROM pings__p202507")
+    return conn
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT shape_id FROM shapes UNION SELECT shape_id FROM trips",
+    "SELECT * FROM shapes WHERE shape_id IN (SELECT shape_id FROM trips)",
+    "SELECT vid, AVG(kwh_mile) FROM pings GROUP BY vid",
+    "SELECT * FROM pings WHERE kwh_mile > 1",
+])
+def test_scans_in_separate_branches_are_not_a_cartesian_join(partitioned, sql):
+    report = check_query(partitioned, sql, max_rows=100, large_table_rows=1000)
+    assert not report.cartesian and "unindexed join" not in report.warnings
+
+
+def test_a_partition_view_joined_without_a_key_is_still_rejected(partitioned):
+    with pytest.raises(QueryRejected, match="cartesian"):
+        check_query(partitioned, "SELECT * FROM pings p, shapes s", max_rows=100, large_table_rows=1000)
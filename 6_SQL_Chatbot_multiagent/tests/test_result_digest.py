@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from result_digest import cap, digest
+
+
+def _trips(n=500):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "vid": 2400 + np.arange(n) % 5,
+        "start_timestamp": 1750000000 + np.arange(n) * 600,
+        "end_soc": np.linspace(95, 20, n) + rng.normal(0, 1, n),
+        "rt": np.where(np.arange(n) % 3, "2", "9"),
+    })
+
+
+def test_small_results_are_sent_as_csv():
+    df = pd.DataFrame({"vid": [2401, 2402], "soc": [55.25, 61.0]})
+    assert digest(df) == "2 rows × 2 columns: vid, soc\n\nRows:\nvid,soc\n2401,55.25\n2402,61.0"
+    assert digest(df.head(0)).endswith("No rows.")
+
+
+def test_large_results_get_stats_trends_and_extreme_rows():
+    text = digest(_trips(), row_count=12_000)
+    assert text.startswith("12,000 rows (500 fetched, stats cover those) × 4 columns")
+    assert "- end_soc: min" in text
+    assert "- vid: 5 distinct" in text  # ids are labels, not measures
+    assert "end_soc over start_timestamp" in text and "falling" in text
+    assert "Highest end_soc:" in text and "Lowest end_soc:" in text
+    assert "2025-06-" in text  # epochs shown as local time
+
+
+def test_the_digest_stays_within_max_chars():
+    df = _trips(5000)
+    assert len(digest(df, max_chars=600)) <= 600
+    assert len(digest(df)) < len(df.to_csv(index=False)) / 10
+
+
+def test_cap_cuts_at_a_line_and_says_how_much_was_left_out():
+    text = "\n".join(f"line {i}" for i in range(1000))
+    capped = cap(text, 200)
+    assert len(capped) <= 200 and capped.endswith("more characters omitted …")
+    assert capped.splitlines()[-2].startswith("line ")
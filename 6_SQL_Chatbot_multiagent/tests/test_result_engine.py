@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+import result_engine
+from query_guard import QueryRejected, time_budget
+
+
+class CountingConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def execute(self, sql, *args):
+        self.statements.append(sql)
+        return self.conn.execute(sql, *args)
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_engine, "SPILL_DIR", tmp_path / "spill")
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (id INTEGER, name TEXT)")
+    db.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"n{i}") for i in range(2500)])
+    return CountingConnection(db)
+
+
+def test_small_result_is_returned_whole_without_spill(conn):
+    result = result_engine.run_query(conn, "SELECT * FROM t WHERE id < 10", max_rows=100)
+    assert result.row_count == 10 and len(result.df) == 10
+    assert result.spill_path is None and not result.truncated
+
+
+def test_large_result_runs_once_counts_exactly_and_spills_every_row(conn, tmp_path):
+    sql = "SELECT * FROM t -- every row"
+    result = result_engine.run_query(conn, sql, max_rows=1000, batch_size=300)
+    assert conn.statements == [sql]  # no COUNT(*) or second pass for the spill
+    assert result.row_count == 2500 and len(result.df) == 1000 and result.truncated
+    spilled = pd.read_parquet(result.spill_path)
+    assert spilled["id"].tolist() == list(range(2500))
+    assert not list((tmp_path / "spill").glob("*.part"))
+
+
+def test_result_of_exactly_max_rows_is_not_truncated(conn):
+    result = result_engine.run_query(conn, "SELECT * FROM t WHERE id < 1000", max_rows=1000)
+    assert result.row_count == 1000 and result.spill_path is None
+
+
+def test_without_spill_the_count_is_still_exact(conn):
+    result = result_engine.run_query(conn, "SELECT * FROM t", max_rows=100, spill=False)
+    assert result.row_count == 2500 and result.spill_path is None
+
+
+def test_spills_of_the_same_query_use_unique_temp_files(conn, tmp_path):
+    spill_a = result_engine._open_spill("SELECT * FROM t", ["id", "name"])
+    spill_b = result_engine._open_spill("SELECT * FROM t", ["id", "name"])
+    assert spill_a.tmp != spill_b.tmp and spill_a.path == spill_b.path
+    spill_a.write([(1, "a")])
+    spill_b.write([(2, "b")])
+    spill_a.close()
+    spill_b.close()
+    assert pd.read_parquet(spill_b.path)["id"].tolist() == [2]
+    assert not list((tmp_path / "spill").glob("*.part"))
+
+
+def test_a_budget_hit_while_counting_keeps_the_preview(conn, tmp_path):
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT i, 'x' AS name FROM n"
+    with time_budget(conn.conn, 0.3):
+        result = result_engine.run_query(conn, slow, max_rows=100)
+    assert len(result.df) == 100 and result.df["i"].tolist()[:3] == [1, 2, 3]
+    assert not result.count_exact and result.row_count > 100 and result.truncated
+    assert result.spill_path is None and not list((tmp_path / "spill").iterdir())
+
+
+def test_a_budget_hit_before_the_preview_is_fetched_still_fails(conn):
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    with pytest.raises(QueryRejected, match="time budget"):
+        with time_budget(conn.conn, 0.2):
+            result_engine.run_query(conn, slow, max_rows=100)
+
+
+def test_old_and_surplus_spills_are_pruned_when_a_query_starts(conn, tmp_path, monkeypatch):
+    monkeypatch.setattr(result_engine, "SPILL_MAX_FILES", 3)
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    now = time.time()
+    for name, age in [("0.parquet", 0), ("1.parquet", 60), ("2.parquet", 120), ("3.parquet", 180),
+                      ("4.parquet", 240), ("old.parquet.part", 2 * 86400), ("recent.part", 0)]:
+        (spill_dir / name).write_bytes(b"")
+        os.utime(spill_dir / name, (now - age, now - age))
+    result_engine.run_query(conn, "SELECT * FROM t WHERE id < 10", max_rows=100)
+    assert sorted(p.name for p in spill_dir.iterdir()) == ["0.parquet", "1.parquet", "2.parquet", "recent.part"]
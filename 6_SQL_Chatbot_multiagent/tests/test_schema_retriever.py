@@ -0,0 +1,49 @@
+import numpy as np
+
+from schema_retriever import SchemaRetriever, get_retriever, hashing_embedder, table_documents
+
+TABLE_DEFS = """
+### 1. soc_logs
+State of charge readings per bus, battery percentage over time.
+
+### 2. gtfs_shape
+Route geometry: latitude and longitude points along each shape.
+"""
+COLUMNS = {"soc_logs": ["vid", "soc", "timestamp"], "gtfs_shape": ["shape_id", "latitude", "longitude"],
+           "block_schedule": ["block_id", "start_time"]}
+
+
+def test_documents_combine_definitions_memory_and_columns():
+    docs = table_documents(TABLE_DEFS, {"block_schedule": {"description": "planned blocks"}}, COLUMNS)
+    assert set(docs) == set(COLUMNS)
+    assert "battery percentage" in docs["soc_logs"]
+    assert "planned blocks" in docs["block_schedule"] and "start time" in docs["block_schedule"]
+
+
+def test_top_k_ranks_the_relevant_table_first_and_respects_within():
+    retriever = SchemaRetriever(table_documents(TABLE_DEFS, {}, COLUMNS), hashing_embedder)
+    assert retriever.top_k("battery state of charge of bus 2402", 1) == ["soc_logs"]
+    assert retriever.top_k("battery state of charge", 2, within={"gtfs_shape", "block_schedule"})[0] != "soc_logs"
+
+
+def test_a_failing_embedder_falls_back_to_local_hashing():
+    def offline(texts):
+        raise ConnectionError("no network")
+
+    retriever = SchemaRetriever(table_documents(TABLE_DEFS, {}, COLUMNS), offline)
+    assert retriever.embed is hashing_embedder
+    assert retriever.top_k("route shape latitude longitude", 1) == ["gtfs_shape"]
+
+
+def test_documents_are_embedded_once():
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return hashing_embedder(texts)
+
+    docs = table_documents(TABLE_DEFS, {}, COLUMNS)
+    first = get_retriever(docs, embed)
+    assert get_retriever(dict(docs), embed) is first
+    assert calls == [len(docs)]
+    assert np.allclose(np.linalg.norm(first.matrix, axis=1), 1.0)
@@ -0,0 +1,27 @@
+"""
+Each app folder is deployed on its own (`streamlit run app.py` with its own
+requirements.txt), so the modules both apps use are copied into each folder
+rather than imported from a package. The copies must stay byte-identical;
+edit one and copy it over.
+"""
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parents[1]
+OTHER = HERE.parent / "4_SQL_Chatbot"
+SHARED = (
+    "analytics_backend.py", "db_pool.py", "prompt_builder.py", "result_cache.py",
+    "schema_catalog.py", "shape_index.py", "timeseries.py", "tracing.py",
+)
+
+
+@pytest.mark.skipif(not OTHER.is_dir(), reason="the SQL chatbot app is not checked out next to this one")
+@pytest.mark.parametrize("name", SHARED)
+def test_shared_module_copies_are_identical(name):
+    assert (HERE / name).read_bytes() == (OTHER / name).read_bytes(), f"{name} differs between the two apps"
+
+
+def test_shared_modules_name_no_other_app_folder():
+    for name in SHARED:
+        assert "4_SQL_Chatbot" not in (HERE / name).read_text(), name
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from schema_catalog import SchemaCatalog
+from sql_repair import clean_sql, local_fix, repair_messages
+from timeseries import register_timeseries_functions
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "fleet.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE trip_event_bustime (vid INTEGER, rt TEXT, start_soc REAL, end_soc REAL, "
+                     "start_timestamp INTEGER, energy_used REAL)")
+    conn = sqlite3.connect(path)
+    register_timeseries_functions(conn)
+    return conn, SchemaCatalog(path)
+
+
+def _fix(db, sql):
+    conn, catalog = db
+
+    def prepare(text):
+        conn.execute(f"EXPLAIN {text}")
+
+    try:
+        prepare(sql)
+        error = ""
+    except sqlite3.Error as e:
+        error = str(e)
+    return local_fix(sql, error, catalog, prepare)
+
+
+def test_clean_sql_strips_fences_smart_quotes_and_semicolons():
+    assert clean_sql("```sql\nSELECT 1 WHERE rt = ’2’;\n```") == "SELECT 1 WHERE rt = '2'"
+
+
+@pytest.mark.parametrize("sql, fixed", [
+    ("SELECT vid, startsoc FROM trip_event_bustime", "SELECT vid, start_soc FROM trip_event_bustime"),
+    ("SELECT vid FROM trip_event_bustim", "SELECT vid FROM trip_event_bustime"),
+    ("SELECT TOP 5 vid FROM trip_event_bustime ORDER BY end_soc DESC",
+     "SELECT vid FROM trip_event_bustime ORDER BY end_soc DESC LIMIT 5"),
+    ("SELECT vid FROM trip_event_bustime WHERE start_soc::int > 90 AND rt ILIKE '2'",
+     "SELECT vid FROM trip_event_bustime WHERE CAST(start_soc AS INTEGER) > 90 AND rt LIKE '2'"),
+    ("SELECT date_trunc('day', start_timestamp) AS d, SUM(energy_used) FROM trip_event_bustime GROUP BY d",
+     "SELECT time_bucket(start_timestamp, '1 day') AS d, SUM(energy_used) FROM trip_event_bustime GROUP BY d"),
+])
+def test_common_mistakes_are_fixed_locally(db, sql, fixed):
+    repair = _fix(db, sql)
+    assert repair is not None and repair.sql == fixed and repair.notes
+
+
+def test_several_mistakes_are_fixed_step_by_step(db):
+    repair = _fix(db, "SELECT vid, startsoc, end_sco FROM trip_event_bustime")
+    assert repair.sql == "SELECT vid, start_soc, end_soc FROM trip_event_bustime"
+    assert len(repair.notes) == 2
+
+
+def test_unfixable_sql_goes_to_the_llm_with_the_tables_columns(db):
+    sql = "SELECT vid, battery_health FROM trip_event_bustime"
+    assert _fix(db, sql) is None
+    messages = repair_messages(sql, "no such column: battery_health", db[1])
+    assert "trip_event_bustime(vid, rt, start_soc, end_soc, start_timestamp, energy_used)" in messages[1]["content"]
@@ -0,0 +1,53 @@
+import pytest
+
+from sql_templates import TemplateStore, extract, parameterize
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TemplateStore(tmp_path / "templates.db")
+
+
+def test_extract_replaces_literals_in_question_order():
+    assert extract("SOC of bus 2402 on 2025-06-18?") == (
+        "soc of bus <vid> on <date>", [("vid", "2402"), ("date", "2025-06-18")])
+
+
+def test_only_compared_literals_become_slots():
+    sql = "SELECT ROUND(AVG(soc), 2) FROM trips WHERE rt = '2' ORDER BY 1 LIMIT 2"
+    assert parameterize(sql, [("route", "2")]) == (
+        "SELECT ROUND(AVG(soc), 2) FROM trips WHERE rt = '{p0}' ORDER BY 1 LIMIT 2")
+
+
+def test_in_lists_between_and_like_are_comparisons():
+    sql = "SELECT * FROM t WHERE vid IN (2401, '2402') AND ts LIKE '2025-06-18%'"
+    assert parameterize(sql, [("vid", "2401"), ("vid", "2402"), ("date", "2025-06-18")]) == (
+        "SELECT * FROM t WHERE vid IN ({p0}, '{p1}') AND ts LIKE '{p2}%'")
+    assert parameterize("SELECT * FROM t WHERE d BETWEEN '2025-06-01' AND '2025-06-18'",
+                        [("date", "2025-06-18")]) == "SELECT * FROM t WHERE d BETWEEN '2025-06-01' AND '{p0}'"
+
+
+def test_a_literal_that_is_never_compared_is_not_learned():
+    assert parameterize("SELECT 2402 AS bus, soc FROM t", [("vid", "2402")]) is None
+
+
+def test_learned_template_binds_new_literals(store):
+    assert store.learn("soc of route 2", "SELECT ROUND(soc, 2) FROM t WHERE rt = '2' LIMIT 2", "k")
+    template = store.lookup("soc of route 9", "k")
+    assert template.sql == "SELECT ROUND(soc, 2) FROM t WHERE rt = '9' LIMIT 2"
+
+
+@pytest.mark.parametrize("question, sql", [
+    ("soc of bus 2402 today", "SELECT soc FROM t WHERE vid = 2402 AND date(ts) = '2026-10-19'"),
+    ("trips of bus 2402 last week", "SELECT * FROM t WHERE vid = 2402 AND ts >= 1791936000"),
+    ("soc of bus 2402 on 2025-06-18",
+     "SELECT soc FROM t WHERE vid = 2402 AND ts >= '2025-06-18' AND ts < '2025-06-19'"),
+])
+def test_questions_whose_sql_froze_a_date_are_not_learned(store, question, sql):
+    assert not store.learn(question, sql, "k")
+    assert store.lookup(question, "k") is None
+
+
+def test_relative_questions_with_relative_sql_are_learned(store):
+    assert store.learn("soc of bus 2402 today", "SELECT soc FROM t WHERE vid = 2402 AND date(ts) = date('now')", "k")
+    assert store.lookup("soc of bus 2403 today", "k").sql.endswith("vid = 2403 AND date(ts) = date('now')")